@@ -0,0 +1,182 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """Request bị từ chối vì quá tải: 429 (hàng đợi đầy) hoặc 503 (chờ quá lâu), kèm Retry-After (giây)"""
+
+    def __init__(self, group: str, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.group = group
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """Slot đã được cấp; release() trả slot (gọi được từ thread khác, gọi nhiều lần không sao)"""
+
+    def __init__(self, limiter: 'AdmissionLimiter', frames: int):
+        self.limiter = limiter
+        self.frames = frames
+        self.started = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.limiter.release(self)
+
+
+class AdmissionLimiter:
+    """Giới hạn số request chạy đồng thời của 1 nhóm endpoint, hàng đợi FIFO có giới hạn và ngân sách frame
+
+    frame_budget: tổng số frame các request đang chạy được giữ cùng lúc (0 = không giới hạn); request
+    xin nhiều hơn cả ngân sách chỉ chạy khi không còn request nào khác. Trạng thái chỉ được sửa trên
+    event loop, release() từ thread khác được chuyển về loop.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float = 30.0,
+                 frame_budget: int = 0):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.frame_budget = max(0, frame_budget)
+        self.active = 0
+        self.active_frames = 0
+        self._waiters: deque = deque()  # (future, frames)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._service_seconds = 0.0  # EMA thời gian giữ slot, dùng để ước lượng Retry-After
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    def _fits(self, frames: int) -> bool:
+        if self.active >= self.max_concurrent:
+            return False
+        return not self.frame_budget or self.active == 0 or self.active_frames + frames <= self.frame_budget
+
+    def _admit(self, frames: int):
+        self.active += 1
+        self.active_frames += frames
+        self.admitted += 1
+
+    def retry_after(self) -> int:
+        """Ước lượng số giây tới khi có slot: thời gian giữ slot trung bình x số lượt chờ phía trước"""
+        service = self._service_seconds or 1.0
+        rounds = (len(self._waiters) + 1) / self.max_concurrent
+        return max(1, math.ceil(service * rounds))
+
+    async def acquire(self, frames: int = 0) -> AdmissionTicket:
+        """Chờ slot (tối đa queue_timeout giây); raise AdmissionRejected nếu hàng đợi đầy hoặc hết thời gian chờ"""
+        self._loop = asyncio.get_running_loop()
+        if self.frame_budget:
+            frames = min(frames, self.frame_budget)
+        if not self._waiters and self._fits(frames):
+            self._admit(frames)
+            return AdmissionTicket(self, frames)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(self.name, 429, f"Quá nhiều request '{self.name}' đang chờ, thử lại sau",
+                                    self.retry_after())
+
+        future = self._loop.create_future()
+        waiter = (future, frames)
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait({future}, timeout=self.queue_timeout)
+        except BaseException:
+            # Client ngắt kết nối khi đang chờ: trả slot nếu vừa được cấp
+            if future.done() and not future.cancelled():
+                AdmissionTicket(self, frames).release()
+            else:
+                self._remove_waiter(waiter)
+            raise
+        if not future.done():
+            self._remove_waiter(waiter)
+            self.rejected_timeout += 1
+            raise AdmissionRejected(self.name, 503, f"Server đang bận ('{self.name}'), thử lại sau",
+                                    self.retry_after())
+        return AdmissionTicket(self, frames)
+
+    @asynccontextmanager
+    async def slot(self, frames: int = 0):
+        ticket = await self.acquire(frames)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def release(self, ticket: AdmissionTicket):
+        loop = self._loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if loop is not None and running is not loop:
+            loop.call_soon_threadsafe(self._release, ticket)
+        else:
+            self._release(ticket)
+
+    def _release(self, ticket: AdmissionTicket):
+        self.active -= 1
+        self.active_frames -= ticket.frames
+        held = time.perf_counter() - ticket.started
+        self._service_seconds = held if not self._service_seconds else 0.8 * self._service_seconds + 0.2 * held
+        # Cấp slot cho các request đang chờ theo thứ tự FIFO
+        while self._waiters and self._fits(self._waiters[0][1]):
+            future, frames = self._waiters.popleft()
+            if future.done():
+                continue
+            self._admit(frames)
+            future.set_result(True)
+
+    def _remove_waiter(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        waiter[0].cancel()
+
+    def stats(self) -> Dict:
+        return {
+            'active': self.active,
+            'max_concurrent': self.max_concurrent,
+            'queued': len(self._waiters),
+            'max_queue': self.max_queue,
+            'active_frames': self.active_frames,
+            'frame_budget': self.frame_budget,
+            'accepting': len(self._waiters) < self.max_queue or (not self._waiters and self._fits(0)),
+            'utilization': round(self.active / self.max_concurrent, 3),
+            'avg_service_seconds': round(self._service_seconds, 3),
+            'retry_after': self.retry_after(),
+            'admitted': self.admitted,
+            'rejected_queue_full': self.rejected_queue_full,
+            'rejected_timeout': self.rejected_timeout,
+        }
+
+
+class AdmissionController:
+    """Các limiter theo nhóm endpoint + snapshot tải hiện tại cho load balancer"""
+
+    def __init__(self):
+        self.limiters: Dict[str, AdmissionLimiter] = {}
+
+    def add(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float = 30.0,
+            frame_budget: int = 0) -> AdmissionLimiter:
+        limiter = AdmissionLimiter(name, max_concurrent, max_queue, queue_timeout, frame_budget)
+        self.limiters[name] = limiter
+        return limiter
+
+    def __getitem__(self, name: str) -> AdmissionLimiter:
+        return self.limiters[name]
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
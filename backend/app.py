@@ -1,21 +1,44 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import Depends, FastAPI, File, UploadFile, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from starlette.background import BackgroundTask
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 import torch
-import torchvision
-from torchvision.transforms import transforms
-from torchvision.models.detection.ssd import SSDClassificationHead
-from torchvision.models.detection import SSD300_VGG16_Weights
 import cv2
-import numpy as np
 from PIL import Image
 import io
 import base64
-from typing import List, Dict
+import json
+import asyncio
+from collections import deque
+from typing import List, Dict, Optional
 import os
+import tempfile
 from video_processor import YouTubeVideoProcessor
+from inference_scheduler import InferenceScheduler
+from job_manager import VideoJobManager
+from video_exporter import AnnotatedVideoExporter
+from video_upload import StreamingVideoUpload, VideoUploadTooLarge
+from result_cache import DetectionCache, file_fingerprint
+from download_manager import DownloadManager
+from inference_backend import create_backend
+from preprocessing import decode_image, to_uint8_tensor
+from model_loader import create_blood_cell_model, find_model_path, load_state_dict_file
+from tiling import MAX_TILE_BATCH_SIZE, MAX_TILE_SIZE, MIN_TILE_SIZE, SlideTooLarge, TiledDetector, load_slide
+from temporal import TemporalConfig
+from batch_sources import iter_upload_images
+from admission import AdmissionController, AdmissionRejected
+from executors import Executors
+from artifact_store import IMAGE_MODES, ArtifactStore, RangeNotSatisfiable, parse_range
+from metrics import (
+    ADMISSION_REJECTED_TOTAL, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, REQUESTS_TOTAL, VIDEO_JOBS_IN_FLIGHT, count_detections,
+    finish_request_timings, registry, server_timing_header, span, start_request_timings
+)
+from postprocessing import (
+    RESPONSE_FORMATS, DetectionSettings, class_counts, detection_count, filter_detections, format_detections, to_detection_dicts
+)
 from pydantic import BaseModel
 import uuid
+import time
 
 app = FastAPI(title="Blood Cell Detection API - Trained Model", version="1.0.0")
 
@@ -28,62 +51,255 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    """Latency, số request theo endpoint và breakdown từng bước (span) cho header Server-Timing"""
+    if request.url.path == "/metrics":
+        return await call_next(request)
+    token = start_request_timings()
+    REQUESTS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        REQUESTS_IN_FLIGHT.dec()
+        timings = finish_request_timings(token)
+        # Dùng path template (/jobs/{job_id}) để không tạo label theo từng id
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        REQUEST_SECONDS.observe(elapsed, method=request.method, endpoint=endpoint)
+        REQUESTS_TOTAL.inc(method=request.method, endpoint=endpoint, status=str(status))
+    if SERVER_TIMING_HEADER:
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
 # Global variables cho model
 model = None
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 class_names = ['bg', 'Platelets', 'RBC', 'WBC']
 video_processor = None
+inference_scheduler = None
+video_job_manager = None
+inference_backend = None
+executors = None
+
+# Trạng thái load model (dùng cho readiness probe)
+model_status = {"weights_loaded": False, "weights_path": None, "error": None, "fingerprint": "", "startup_timings": {}}
+# Cho phép báo ready khi đang chạy bằng random weights (chỉ dùng cho demo)
+ALLOW_RANDOM_WEIGHTS = os.getenv("ALLOW_RANDOM_WEIGHTS", "0") == "1"
+
+# Backend inference: eager | torchscript | compile | onnx | onnx-int8
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+INFERENCE_ARTIFACT_DIR = os.getenv("INFERENCE_ARTIFACT_DIR") or None
+
+# Tham số postprocess mặc định của SSD head (lọc score trước decode box + NMS), request có thể ghi đè
+DEFAULT_DETECTION_SETTINGS = DetectionSettings(
+    score_thresh=float(os.getenv("DETECTION_SCORE_THRESH", "0.5")),
+    nms_thresh=float(os.getenv("DETECTION_NMS_THRESH", "0.45")),
+    topk_candidates=int(os.getenv("DETECTION_TOPK_CANDIDATES", "400")),
+    detections_per_img=int(os.getenv("DETECTION_MAX_PER_IMAGE", "200")),
+)
+
+# Cấu hình micro-batching cho /predict
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+
+# Cache kết quả detection (RAM + disk tùy chọn)
+detection_cache = DetectionCache(
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(float(os.getenv("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600")),
+    disk_dir=os.getenv("RESULT_CACHE_DIR") or None,
+    max_disk_bytes=int(float(os.getenv("RESULT_CACHE_DISK_MAX_MB", "1024")) * 1024 * 1024),
+)
+
+# Ảnh/frame đã render được lưu trên disk và trả về dạng URL (GET /artifacts/{id}) thay vì base64 trong JSON
+artifact_store = ArtifactStore(
+    root_dir=os.getenv("ARTIFACT_DIR") or None,
+    max_bytes=int(float(os.getenv("ARTIFACT_MAX_MB", "2048")) * 1024 * 1024),
+    url_prefix=os.getenv("ARTIFACT_URL_PREFIX", ""),  # vd. "/api" khi backend nằm sau reverse proxy
+)
+# image_mode mặc định khi request không chỉ định: "url" hoặc "inline" (data URI base64 như trước)
+DEFAULT_IMAGE_MODE = os.getenv("DEFAULT_IMAGE_MODE", "url")
+
+# Header Server-Timing với thời gian từng bước của request (decode, inference, encode...)
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "0") == "1"
+
+# Giới hạn cho /predict-batch
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "500"))
+BATCH_MAX_IMAGE_BYTES = int(float(os.getenv("BATCH_MAX_IMAGE_MB", "25")) * 1024 * 1024)
+
+# Tiled detection cho ảnh độ phân giải cao (/predict-tiled), request có thể ghi đè
+TILE_SIZE = max(MIN_TILE_SIZE, min(int(os.getenv("TILE_SIZE", "300")), MAX_TILE_SIZE))
+TILE_OVERLAP = max(0, min(int(os.getenv("TILE_OVERLAP", "50")), TILE_SIZE - 1))
+TILE_BATCH_SIZE = max(1, min(int(os.getenv("TILE_BATCH_SIZE", "8")), MAX_TILE_BATCH_SIZE))
+TILE_NMS_IOU = float(os.getenv("TILE_NMS_IOU", "0.5"))
+# Ảnh thường (không phải .npy) được decode toàn bộ vào RAM: giới hạn số pixel (0 = không giới hạn)
+TILE_MAX_PIXELS = int(os.getenv("TILE_MAX_PIXELS", "100000000"))
+
+# Video upload từ máy (/predict-video): giới hạn dung lượng và số frame sample mỗi giây video
+VIDEO_UPLOAD_MAX_BYTES = int(float(os.getenv("VIDEO_UPLOAD_MAX_MB", "500")) * 1024 * 1024)
+VIDEO_UPLOAD_SAMPLE_FPS = float(os.getenv("VIDEO_UPLOAD_SAMPLE_FPS", "1.0"))
+
+# Cấu hình job xử lý video chạy nền
+VIDEO_JOB_WORKERS = int(os.getenv("VIDEO_JOB_WORKERS", "2"))
+VIDEO_JOB_TTL_SECONDS = float(os.getenv("VIDEO_JOB_TTL_SECONDS", "3600"))
+VIDEO_JOB_MAX_QUEUED = int(os.getenv("VIDEO_JOB_MAX_QUEUED", "8"))  # 429 khi số job đang chờ vượt quá
+
+# Admission control: số request chạy đồng thời + hàng đợi giới hạn cho từng nhóm endpoint nặng CPU,
+# request quá tải bị từ chối ngay với 429/503 + Retry-After thay vì chờ tới timeout
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+admission = AdmissionController()
+# /predict (đã được gom batch bởi inference scheduler)
+admission.add("image", int(os.getenv("ADMISSION_IMAGE_CONCURRENCY", "32")),
+              int(os.getenv("ADMISSION_IMAGE_QUEUE", "64")), ADMISSION_QUEUE_TIMEOUT)
+# /predict-batch, /predict-tiled
+admission.add("bulk", int(os.getenv("ADMISSION_BULK_CONCURRENCY", "2")),
+              int(os.getenv("ADMISSION_BULK_QUEUE", "4")), ADMISSION_QUEUE_TIMEOUT)
+# /predict-youtube, /predict-youtube/stream, /predict-video: ngân sách frame giữ cùng lúc (ảnh base64 trong RAM)
+admission.add("video", int(os.getenv("ADMISSION_VIDEO_CONCURRENCY", "2")),
+              int(os.getenv("ADMISSION_VIDEO_QUEUE", "4")), ADMISSION_QUEUE_TIMEOUT,
+              frame_budget=int(os.getenv("ADMISSION_VIDEO_FRAME_BUDGET", "150")))
+# /process-youtube-video (decode + detect + encode toàn bộ video)
+admission.add("export", int(os.getenv("ADMISSION_EXPORT_CONCURRENCY", "1")),
+              int(os.getenv("ADMISSION_EXPORT_QUEUE", "2")), ADMISSION_QUEUE_TIMEOUT)
+
+# Thread pool cho việc blocking: event loop chỉ xử lý request, download chạy trên pool I/O,
+# decode/inference/encode chạy trên pool compute có số thread giới hạn (0 = nửa số core của worker)
+EXECUTOR_IO_WORKERS = int(os.getenv("EXECUTOR_IO_WORKERS", "16"))
+EXECUTOR_COMPUTE_WORKERS = int(os.getenv("EXECUTOR_COMPUTE_WORKERS", "0"))
 
 # Pydantic models cho request/response
 class YouTubeVideoRequest(BaseModel):
     url: str
     max_frames: int = 30
-    confidence_threshold: float = 0.5
-
-def create_blood_cell_model(num_classes=4):
-    """Tạo mô hình SSD với architecture tương thích với trained model"""
-    # Load base SSD model
-    model = torchvision.models.detection.ssd300_vgg16(weights=SSD300_VGG16_Weights.COCO_V1)
-    
-    # Thay đổi classification head để match với trained model
-    # Từ lỗi trước: model custom có [16, 512, 3, 3] = 4 classes * 4 anchors per location
-    in_channels = [512, 1024, 512, 256, 256, 256]  # SSD300 feature map channels
-    num_anchors = [4, 6, 6, 6, 4, 4]  # SSD300 anchors per location
-    
-    model.head.classification_head = SSDClassificationHead(
-        in_channels=in_channels,
-        num_anchors=num_anchors,
-        num_classes=num_classes
-    )
-    
-    # Cũng cần thay đổi regression head để tương thích
-    from torchvision.models.detection.ssd import SSDRegressionHead
-    model.head.regression_head = SSDRegressionHead(
-        in_channels=in_channels,
-        num_anchors=num_anchors
-    )
+    # Tham số postprocess của model, None = mặc định của deployment (DETECTION_*)
+    confidence_threshold: Optional[float] = None
+    nms_thresh: Optional[float] = None
+    topk_candidates: Optional[int] = None  # Số candidate tối đa mỗi class trước NMS
+    detections_per_img: Optional[int] = None
+    batch_size: int = 8  # Số frame inference cùng lúc
+    response_format: str = "objects"  # "objects" (list dict) hoặc "columnar" (mảng song song)
+    image_mode: Optional[str] = None  # "url" (link /artifacts/{id}) hoặc "inline" (data URI), None = DEFAULT_IMAGE_MODE
+    # Chế độ temporal: bỏ qua inference trên frame gần giống keyframe trước, dùng lại box
+    temporal: bool = False
+    change_threshold: float = 0.02  # Độ thay đổi (0-1) so với keyframe để chạy lại model
+    keyframe_interval: int = 10  # Bắt buộc inference ít nhất mỗi N frame
+    optical_flow: bool = False  # Dịch box propagate theo optical flow
+    change_metric: str = "diff"  # "diff" (chênh lệch pixel) hoặc "hist" (histogram)
+
+def detection_settings(confidence_threshold: Optional[float] = None, nms_thresh: Optional[float] = None,
+                       topk_candidates: Optional[int] = None, detections_per_img: Optional[int] = None) -> DetectionSettings:
+    """Tham số postprocess của request, giá trị None lấy theo mặc định của deployment"""
+    try:
+        return DEFAULT_DETECTION_SETTINGS.replace(confidence_threshold, nms_thresh, topk_candidates, detections_per_img)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def resolve_image_mode(image_mode: Optional[str]) -> str:
+    image_mode = image_mode or DEFAULT_IMAGE_MODE
+    if image_mode not in IMAGE_MODES:
+        raise HTTPException(status_code=400, detail=f"image_mode phải là một trong {list(IMAGE_MODES)}")
+    return image_mode
+
+def lookup_cached(cache_key: str, image_mode: str) -> Optional[bytes]:
+    """Kết quả đã cache; bỏ qua entry 'url' có artifact đã bị evict khỏi disk (chạy trên pool I/O)"""
+    cached = detection_cache.get(cache_key)
+    if cached is not None and image_mode == "url" and not artifact_store.available(cached):
+        return None
+    return cached
+
+def request_detection_settings(request: YouTubeVideoRequest) -> DetectionSettings:
+    return detection_settings(request.confidence_threshold, request.nms_thresh,
+                              request.topk_candidates, request.detections_per_img)
+
+def temporal_config(request: YouTubeVideoRequest) -> Optional[TemporalConfig]:
+    """Cấu hình temporal từ request, None nếu tắt (mọi frame đều chạy model)"""
+    if not request.temporal:
+        return None
+    try:
+        return TemporalConfig(
+            change_threshold=request.change_threshold,
+            keyframe_interval=request.keyframe_interval,
+            optical_flow=request.optical_flow,
+            metric=request.change_metric,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def warmup_model():
+    """Chạy 1 forward pass giả để khởi tạo kernel/allocator trước request đầu tiên"""
+    with torch.no_grad():
+        model(torch.zeros(1, 3, 300, 300, device=device))
+
+def build_inference_backend():
+    """Tạo backend inference theo INFERENCE_BACKEND, fallback về eager nếu lỗi"""
+    try:
+        # ONNX Runtime có thread pool riêng: dùng đúng số intra-op thread serve.py chia cho worker này
+        # (torch.set_num_threads / TORCH_NUM_THREADS) thay vì mặc định tất cả core của máy
+        backend = create_backend(
+            INFERENCE_BACKEND, model, device,
+            artifact_dir=INFERENCE_ARTIFACT_DIR,
+            fingerprint=model_status["fingerprint"],
+            num_threads=torch.get_num_threads(),
+        )
+    except Exception as e:
+        print(f"❌ Error creating '{INFERENCE_BACKEND}' inference backend: {e}")
+        print("📝 Fallback: using eager PyTorch backend")
+        backend = create_backend("eager", model, device)
+    backend.detection_settings = DEFAULT_DETECTION_SETTINGS
     
-    return model
+    # Warm-up (torch.compile / ONNX Runtime khởi tạo ở lần gọi đầu tiên)
+    phase_started = time.perf_counter()
+    backend(torch.zeros(1, 3, 300, 300, device=device))
+    model_status["startup_timings"]["backend_warmup_ms"] = (time.perf_counter() - phase_started) * 1000
+    # Backend khác nhau (vd. int8) có thể cho kết quả khác nhau -> tách cache
+    detection_cache.set_model_fingerprint(f"{model_status['fingerprint']}:{backend.name}",
+                                          persistent=model_status["weights_loaded"])
+    print(f"✅ Inference backend: {backend.name}")
+    return backend
+
+def load_trained_model(warmup: bool = True):
+    """Load mô hình đã được train cho blood cells
 
-def load_trained_model():
-    """Load mô hình đã được train cho blood cells"""
+    warmup=False: serve.py load weights ở supervisor rồi mới fork worker, không chạy forward trước khi fork.
+    """
     global model
+    timings = {}
+    started = time.perf_counter()
+    model_status.update({"weights_loaded": False, "weights_path": None, "error": None})
     try:
         print("Creating blood cell SSD model architecture...")
+        phase_started = time.perf_counter()
         model = create_blood_cell_model(num_classes=4)
+        timings["build_architecture_ms"] = (time.perf_counter() - phase_started) * 1000
         
         print("Loading trained weights...")
-        custom_model_path = "../SSD_custom.pth"
+        custom_model_path = find_model_path()
         
-        if not os.path.exists(custom_model_path):
-            raise FileNotFoundError(f"Trained model file not found: {custom_model_path}")
+        if custom_model_path is None:
+            raise FileNotFoundError("Trained model file not found: SSD_custom.pth (set MODEL_PATH)")
         
         # Load trained weights
-        checkpoint = torch.load(custom_model_path, map_location=device, weights_only=False)
+        phase_started = time.perf_counter()
+        checkpoint = load_state_dict_file(custom_model_path)
         model.load_state_dict(checkpoint, strict=True)
+        del checkpoint
         
         model.to(device)
         model.eval()
+        timings["load_weights_ms"] = (time.perf_counter() - phase_started) * 1000
+        
+        # Weights mới -> kết quả cache cũ không còn hợp lệ
+        phase_started = time.perf_counter()
+        model_status["fingerprint"] = file_fingerprint(custom_model_path)
+        detection_cache.set_model_fingerprint(model_status["fingerprint"])
+        timings["fingerprint_ms"] = (time.perf_counter() - phase_started) * 1000
+        
+        model_status.update({"weights_loaded": True, "weights_path": custom_model_path})
         print("✅ Trained blood cell model loaded successfully!")
         
     except Exception as e:
@@ -94,61 +310,104 @@ def load_trained_model():
         model = create_blood_cell_model(num_classes=4)
         model.to(device)
         model.eval()
+        # Random weights: không dùng lại kết quả cache nào
+        model_status["fingerprint"] = f"random-{uuid.uuid4().hex}"
+        # Mỗi worker có fingerprint riêng: không dùng (và không xóa) cache trên disk
+        detection_cache.set_model_fingerprint(model_status["fingerprint"], persistent=False)
+        model_status["error"] = str(e)
         print("⚠️ Using model with random weights - for demo only")
-
-def preprocess_image(image: Image.Image):
-    """Tiền xử lý ảnh đầu vào cho blood cell detection"""
-    # Resize theo kích thước mà model được train
-    image = image.resize((300, 300))  # SSD300 standard size
     
-    # Convert PIL image to tensor với normalization
-    transform = transforms.Compose([
-        transforms.ToTensor(),
-        # Có thể cần normalization tùy theo cách train model
-        # transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
-    
-    image_tensor = transform(image).unsqueeze(0)  # Add batch dimension
-    return image_tensor.to(device)
+    if warmup:
+        phase_started = time.perf_counter()
+        warmup_model()
+        timings["warmup_ms"] = (time.perf_counter() - phase_started) * 1000
+    timings["total_ms"] = (time.perf_counter() - started) * 1000
+    model_status["startup_timings"] = timings
+    print("Startup timings: " + ", ".join(f"{phase}={value:.0f}ms" for phase, value in timings.items()))
+
+def encode_processed_image(image: Image.Image, image_mode: str, quality: int = 90) -> str:
+    """Encode ảnh JPEG thành URL artifact hoặc data URI base64 (chạy trên compute pool)"""
+    img_buffer = io.BytesIO()
+    image.save(img_buffer, format='JPEG', quality=quality, optimize=True)
+    if image_mode == "url":
+        return artifact_store.put_url(img_buffer.getvalue())
+    return f"data:image/jpeg;base64,{base64.b64encode(img_buffer.getvalue()).decode('utf-8')}"
 
 def postprocess_predictions(predictions, confidence_threshold=0.5):
     """Xử lý kết quả dự đoán từ trained blood cell model"""
     results = []
-    
     for prediction in predictions:
-        boxes = prediction['boxes'].cpu().numpy()
-        scores = prediction['scores'].cpu().numpy()
-        labels = prediction['labels'].cpu().numpy()
-        
-        # Lọc các detection có confidence cao
-        mask = scores > confidence_threshold
-        boxes = boxes[mask]
-        scores = scores[mask]
-        labels = labels[mask]
-        
-        for box, score, label in zip(boxes, scores, labels):
-            x1, y1, x2, y2 = box
-            
-            # Labels từ trained model (1-3 cho Platelets, RBC, WBC)
-            class_name = class_names[label] if label < len(class_names) else 'unknown'
-            
-            results.append({
-                'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                'confidence': float(score),
-                'class_id': int(label),
-                'class_name': class_name
-            })
-    
+        # Labels từ trained model (1-3 cho Platelets, RBC, WBC)
+        results.extend(to_detection_dicts(filter_detections(prediction, confidence_threshold), class_names))
     return results
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request, exc: AdmissionRejected):
+    """Từ chối nhanh khi quá tải, Retry-After cho client / load balancer biết khi nào thử lại"""
+    ADMISSION_REJECTED_TOTAL.inc(group=exc.group, status=str(exc.status_code))
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail, "group": exc.group, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+def admission_slot(group: str):
+    """Dependency giữ 1 slot admission của nhóm endpoint tới khi gửi xong response (kể cả response stream)"""
+    async def acquire_slot():
+        async with admission[group].slot():
+            yield
+    return acquire_slot
+
 @app.on_event("startup")
 async def startup_event():
     """Khởi tạo trained model khi start server"""
-    global video_processor
-    load_trained_model()
+    global video_processor, inference_scheduler, video_job_manager, inference_backend, executors
+    # Tạo sau khi serve.py đã chia core cho worker (torch threads) để pool compute không vượt phần core đó
+    executors = Executors(io_workers=EXECUTOR_IO_WORKERS, compute_workers=EXECUTOR_COMPUTE_WORKERS or None,
+                          cores=torch.get_num_threads())
+    if model is None:
+        load_trained_model()
+    else:
+        # Worker của serve.py: weights đã được supervisor load (dùng chung bộ nhớ), warm-up ở worker
+        print(f"Using weights preloaded by supervisor (worker pid {os.getpid()})")
     # Khởi tạo video processor
     if model is not None:
-        video_processor = YouTubeVideoProcessor(model, device, class_names)
+        # Backend inference dùng chung cho /predict và video
+        inference_backend = build_inference_backend()
+        download_manager = DownloadManager(
+            root_dir=os.getenv("VIDEO_DOWNLOAD_DIR") or None,
+            cache_max_bytes=int(float(os.getenv("VIDEO_CACHE_MAX_MB", "2048")) * 1024 * 1024),
+        )
+        video_processor = YouTubeVideoProcessor(inference_backend, device, class_names, download_manager,
+                                                artifacts=artifact_store)
+        # Scheduler gom các request /predict đồng thời thành batch
+        inference_scheduler = InferenceScheduler(
+            inference_backend,
+            device,
+            filter_detections,
+            max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+            max_wait_ms=INFERENCE_MAX_WAIT_MS,
+        )
+        inference_scheduler.start()
+        # Worker pool cho các job video chạy nền
+        video_job_manager = VideoJobManager(
+            video_processor,
+            max_workers=VIDEO_JOB_WORKERS,
+            result_ttl_seconds=VIDEO_JOB_TTL_SECONDS,
+        )
+        VIDEO_JOBS_IN_FLIGHT.callback = lambda: sum(
+            count for status, count in video_job_manager.stats().items() if status in ('queued', 'running')
+        )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Dừng inference scheduler khi tắt server"""
+    if inference_scheduler is not None:
+        inference_scheduler.stop()
+    if video_job_manager is not None:
+        video_job_manager.shutdown()
+    if executors is not None:
+        executors.shutdown()
 
 @app.get("/")
 async def root():
@@ -159,64 +418,326 @@ async def health_check():
     return {
         "status": "healthy",
         "model_loaded": model is not None,
+        "weights_loaded": model_status["weights_loaded"],
+        "inference_backend": inference_backend.name if inference_backend is not None else None,
         "device": str(device),
+        "worker_pid": os.getpid(),
+        "torch_threads": torch.get_num_threads(),
         "model_type": "SSD300_BloodCell_Trained",
         "classes": class_names[1:],
         "note": "Using custom trained model for blood cell detection"
     }
 
-@app.post("/predict")
-async def predict_blood_cells(file: UploadFile = File(...)):
-    """Endpoint chính để phát hiện tế bào máu với trained model"""
-    if model is None:
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: process còn phục vụ request (không phụ thuộc model)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: model đã load weights, warm-up xong và scheduler đã chạy"""
+    ready = (
+        model is not None
+        and inference_scheduler is not None
+        and (model_status["weights_loaded"] or ALLOW_RANDOM_WEIGHTS)
+    )
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "weights_loaded": model_status["weights_loaded"],
+            "weights_path": model_status["weights_path"],
+            "error": model_status["error"],
+            "startup_timings": model_status["startup_timings"],
+        }
+    )
+
+@app.post("/predict", dependencies=[Depends(admission_slot("image"))])
+async def predict_blood_cells(file: UploadFile = File(...), response_format: str = "objects",
+                              confidence_threshold: Optional[float] = None, nms_thresh: Optional[float] = None,
+                              topk_candidates: Optional[int] = None, detections_per_img: Optional[int] = None,
+                              image_mode: Optional[str] = None):
+    """Endpoint chính để phát hiện tế bào máu với trained model
+
+    response_format=columnar trả detections dạng mảng song song boxes/scores/labels.
+    confidence_threshold/nms_thresh/topk_candidates/detections_per_img ghi đè tham số postprocess của model.
+    image_mode=url (mặc định) trả processed_image là link /artifacts/{id}, inline trả data URI base64.
+    """
+    if model is None or inference_scheduler is None:
         raise HTTPException(status_code=500, detail="Model not loaded")
     
     # Kiểm tra file type
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"response_format phải là một trong {list(RESPONSE_FORMATS)}")
+    
+    settings = detection_settings(confidence_threshold, nms_thresh, topk_candidates, detections_per_img)
+    image_mode = resolve_image_mode(image_mode)
     try:
         # Đọc và xử lý ảnh
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert('RGB')
-        original_size = image.size
+        with span('upload'):
+            contents = await file.read()
         
-        print(f"Processing image: {original_size}")
+        # Ảnh đã phân tích trước đó -> trả kết quả từ cache
+        cache_key = detection_cache.image_key(contents, confidence_threshold=settings.score_thresh,
+                                              variant=f"{response_format}|{settings.cache_variant()}|{image_mode}")
+        with span('cache_lookup'):
+            cached = await executors.run_io(lookup_cached, cache_key, image_mode)
+        if cached is not None:
+            return Response(content=cached, media_type="application/json", headers={"X-Cache": "HIT"})
         
-        # Tiền xử lý ảnh
-        image_tensor = preprocess_image(image)
+        # Decode thẳng về 300x300 (JPEG: DCT scaling), original_size là kích thước trước khi thu nhỏ
+        with span('decode'):
+            image_resized, original_size = await executors.run_compute(decode_image, contents)
         
-        # Inference với trained model
-        with torch.no_grad():
-            predictions = model(image_tensor)
+        # Inference qua scheduler (gom batch với các request đồng thời) + lọc kết quả
+        # Tensor uint8 được chuẩn hóa khi copy vào buffer batch của scheduler
+        with span('inference'):
+            detections = await inference_scheduler.predict(to_uint8_tensor(image_resized), settings=settings)
+        counts = class_counts(detections['labels'], class_names)
+        count_detections(counts, source='image')
         
-        print(f"Raw predictions: {len(predictions[0]['boxes'])} detections")
+        # Convert ảnh thành base64 với kích thước phù hợp
+        with span('encode'):
+            # Dùng lại ảnh 300x300 đã đưa vào model để match với detection coordinates
+            processed_image = await executors.run_compute(encode_processed_image, image_resized, image_mode)
         
-        # Xử lý kết quả
-        results = postprocess_predictions(predictions)
+        with span('serialize'):
+            content = await executors.run_compute(detection_cache.set, cache_key, {
+                "success": True,
+                "detections": format_detections(detections, class_names, response_format),
+                "total_detections": detection_count(detections),
+                "class_counts": counts,
+                "original_image_size": original_size,
+                "processed_image": processed_image,
+                "class_names": class_names[1:],  # Exclude background
+                "detection_settings": settings.describe(),
+                "model_info": "Custom trained SSD model for blood cell detection"
+            })
+        return Response(content=content, media_type="application/json", headers={"X-Cache": "MISS"})
+        
+    except Exception as e:
+        print(f"Error in prediction: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+
+async def stream_batch_records(files: List[UploadFile], settings: DetectionSettings, response_format: str):
+    """Decode từng ảnh, đưa vào scheduler (gom batch) và trả NDJSON theo đúng thứ tự ảnh
+
+    Chỉ giữ tối đa 2 batch ảnh đang chờ inference để bộ nhớ không tăng theo số ảnh.
+    """
+    window = max(1, INFERENCE_MAX_BATCH_SIZE * 2)
+    pending = deque()
+    totals = {name: 0 for name in class_names[1:]}
+    processed = failed = 0
+    started = time.perf_counter()
+
+    def image_record(index: int, filename: str, original_size, detections) -> Dict:
+        counts = class_counts(detections['labels'], class_names)
+        count_detections(counts, source='batch')
+        for name, count in counts.items():
+            totals[name] += count
+        return {
+            "type": "image",
+            "index": index,
+            "filename": filename,
+            "detections": format_detections(detections, class_names, response_format),
+            "total_detections": detection_count(detections),
+            "class_counts": counts,
+            "original_image_size": original_size,
+        }
+
+    async def complete_oldest() -> str:
+        nonlocal processed, failed
+        index, filename, original_size, future = pending.popleft()
+        try:
+            detections = await asyncio.wrap_future(future)
+        except Exception as e:
+            failed += 1
+            return encode_stream_record({"type": "error", "index": index, "filename": filename, "error": str(e)}, "ndjson")
+        processed += 1
+        return encode_stream_record(image_record(index, filename, original_size, detections), "ndjson")
+
+    index = 0
+    # Đọc file upload / giải nén ZIP trên pool I/O, decode trên pool compute
+    source_report = {'truncated': False, 'skipped_images': 0}
+    async for filename, contents in executors.io.iterate(
+            iter_upload_images(files, BATCH_MAX_IMAGES, BATCH_MAX_IMAGE_BYTES, report=source_report)):
+        if isinstance(contents, Exception):
+            # Lỗi đọc file: trả ngay sau các ảnh trước đó để giữ thứ tự
+            while pending:
+                yield await complete_oldest()
+            failed += 1
+            yield encode_stream_record({"type": "error", "index": index, "filename": filename, "error": str(contents)}, "ndjson")
+            index += 1
+            continue
+        try:
+            with span('decode'):
+                image_resized, original_size = await executors.run_compute(decode_image, contents)
+        except Exception as e:
+            while pending:
+                yield await complete_oldest()
+            failed += 1
+            yield encode_stream_record({"type": "error", "index": index, "filename": filename, "error": f"Không đọc được ảnh: {e}"}, "ndjson")
+            index += 1
+            continue
+        pending.append((index, filename, original_size,
+                        inference_scheduler.submit(to_uint8_tensor(image_resized), settings=settings)))
+        index += 1
+        if len(pending) >= window:
+            yield await complete_oldest()
+    
+    while pending:
+        yield await complete_oldest()
+    
+    elapsed = time.perf_counter() - started
+    yield encode_stream_record({
+        "type": "summary",
+        "images_processed": processed,
+        "images_failed": failed,
+        # Vượt BATCH_MAX_IMAGES: các ảnh sau bị bỏ, không có record riêng
+        "truncated": source_report['truncated'],
+        "skipped_images": source_report['skipped_images'],
+        "max_images": BATCH_MAX_IMAGES,
+        "total_detections": sum(totals.values()),
+        "class_counts": totals,
+        "seconds": round(elapsed, 3),
+        "images_per_second": round(processed / elapsed, 2) if elapsed > 0 else 0,
+        "detection_settings": settings.describe(),
+    }, "ndjson")
+
+@app.post("/predict-batch", dependencies=[Depends(admission_slot("bulk"))])
+async def predict_blood_cells_batch(files: List[UploadFile] = File(...), confidence_threshold: Optional[float] = None,
+                                    response_format: str = "objects", nms_thresh: Optional[float] = None,
+                                    topk_candidates: Optional[int] = None, detections_per_img: Optional[int] = None):
+    """Phát hiện tế bào trên nhiều ảnh (nhiều file và/hoặc file ZIP), trả NDJSON từng ảnh + record summary"""
+    if model is None or inference_scheduler is None:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"response_format phải là một trong {list(RESPONSE_FORMATS)}")
+    
+    settings = detection_settings(confidence_threshold, nms_thresh, topk_candidates, detections_per_img)
+    # File upload được đọc dần trong lúc stream (FastAPI 0.104 chỉ đóng form sau khi gửi xong response)
+    return StreamingResponse(
+        stream_batch_records(files, settings, response_format),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/predict-tiled", dependencies=[Depends(admission_slot("bulk"))])
+async def predict_blood_cells_tiled(file: UploadFile = File(...), confidence_threshold: Optional[float] = None,
+                                    tile_size: Optional[int] = None, overlap: Optional[int] = None,
+                                    batch_size: Optional[int] = None, response_format: str = "objects",
+                                    nms_thresh: Optional[float] = None, topk_candidates: Optional[int] = None,
+                                    detections_per_img: Optional[int] = None):
+    """Phát hiện tế bào trên ảnh độ phân giải cao bằng các tile 300x300 chồng lấn
+
+    Box trả về theo tọa độ ảnh gốc. Chỉ file .npy (uint8 [H, W, 3]) được đọc bằng memory-map (RAM không tăng
+    theo kích thước slide); JPEG/PNG/TIFF được decode toàn bộ nên bị giới hạn TILE_MAX_PIXELS (413 nếu vượt).
+    """
+    if model is None or inference_backend is None:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    
+    is_npy = (file.filename or '').lower().endswith('.npy')
+    if not is_npy and not (file.content_type or '').startswith('image/'):
+        raise HTTPException(status_code=400, detail="File must be an image or .npy array")
+    
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"response_format phải là một trong {list(RESPONSE_FORMATS)}")
+    
+    # Áp dụng cho từng tile; tile_nms_iou vẫn dùng để gộp box giữa các tile
+    settings = detection_settings(confidence_threshold, nms_thresh, topk_candidates, detections_per_img)
+    tile_size = TILE_SIZE if tile_size is None else tile_size
+    if overlap is None:
+        # Overlap mặc định không được vượt tile nhỏ hơn do request chọn
+        overlap = min(TILE_OVERLAP, max(0, tile_size - 1))
+    try:
+        # tile_size ngoài [MIN_TILE_SIZE, MAX_TILE_SIZE] -> 400; batch_size bị chặn như các endpoint khác
+        detector = TiledDetector(
+            inference_backend, device,
+            tile_size=tile_size,
+            overlap=overlap,
+            batch_size=max(1, min(batch_size or TILE_BATCH_SIZE, MAX_TILE_BATCH_SIZE)),
+            nms_iou_threshold=TILE_NMS_IOU,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    suffix = '.npy' if is_npy else os.path.splitext(file.filename or '')[1] or '.img'
+    fd, upload_path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        # Ghi upload ra file tạm theo từng chunk thay vì giữ cả slide trong RAM (trong try: client ngắt kết nối
+        # hoặc ghi disk lỗi giữa chừng thì file tạm vẫn bị xóa)
+        with open(upload_path, 'wb') as tmp:
+            while chunk := await file.read(1024 * 1024):
+                await executors.run_io(tmp.write, chunk)
         
-        print(f"Filtered results: {len(results)} detections")
+        with span('decode'):
+            slide = await executors.run_compute(load_slide, upload_path, TILE_MAX_PIXELS)
+        print(f"Tiled processing: {slide.shape[1]}x{slide.shape[0]}")
+        with span('tiled_inference'):
+            detections, tiling = await executors.run_compute(detector.detect, slide, settings=settings)
+        print(f"Tiled results: {tiling['tiles']} tiles, {tiling['tiles_per_second']} tiles/s, "
+              f"{tiling['raw_detections']} -> {tiling['merged_detections']} detections after NMS")
         
-        # Convert ảnh thành base64 với kích thước phù hợp
-        img_buffer = io.BytesIO()
-        # Resize để match với detection coordinates
-        image_resized = image.resize((300, 300))
-        image_resized.save(img_buffer, format='JPEG', quality=90, optimize=True)
-        img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+        tiled_counts = class_counts(detections['labels'], class_names)
+        count_detections(tiled_counts, source='tiled')
         
-        return JSONResponse(content={
+        return {
             "success": True,
-            "detections": results,
-            "total_detections": len(results),
-            "original_image_size": original_size,
-            "processed_image": f"data:image/jpeg;base64,{img_base64}",
+            "detections": format_detections(detections, class_names, response_format),
+            "total_detections": detection_count(detections),
+            "class_counts": tiled_counts,
+            "original_image_size": tiling['image_size'],
+            "tiling": tiling,
+            "detection_settings": settings.describe(),
             "class_names": class_names[1:],  # Exclude background
-            "model_info": "Custom trained SSD model for blood cell detection"
-        })
-        
+        }
+    
+    except SlideTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Error in prediction: {e}")
+        print(f"Error in tiled prediction: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+    finally:
+        os.remove(upload_path)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics dạng Prometheus text: latency từng bước, request, detection theo class, frame, job"""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/load")
+async def get_load(group: Optional[str] = None):
+    """Tải hiện tại của worker cho load balancer
+
+    503 + Retry-After khi nhóm endpoint `group` (mặc định: mọi nhóm) không nhận thêm request.
+    """
+    limiters = admission.stats()
+    if group is not None and group not in limiters:
+        raise HTTPException(status_code=404, detail=f"group phải là một trong {list(limiters)}")
+    
+    checked = [group] if group is not None else list(limiters)
+    accepting = all(limiters[name]['accepting'] for name in checked)
+    job_stats = video_job_manager.stats() if video_job_manager is not None else None
+    content = {
+        "status": "ok" if accepting else "saturated",
+        "accepting": accepting,
+        "worker_pid": os.getpid(),
+        "limiters": limiters,
+        "video_jobs": {**job_stats, "max_queued": VIDEO_JOB_MAX_QUEUED} if job_stats is not None else None,
+        "scheduler_queue_depth": inference_scheduler.stats()['queue_depth'] if inference_scheduler is not None else None,
+        "executors": executors.stats() if executors is not None else None,
+    }
+    if accepting:
+        return content
+    retry_after = max(limiters[name]['retry_after'] for name in checked if not limiters[name]['accepting'])
+    return JSONResponse(status_code=503, content=content, headers={"Retry-After": str(retry_after)})
 
 @app.get("/classes")
 async def get_classes():
@@ -231,6 +752,80 @@ async def get_classes():
         }
     }
 
+@app.get("/scheduler-stats")
+async def get_scheduler_stats():
+    """Thống kê hàng đợi và kích thước batch của inference scheduler"""
+    if inference_scheduler is None:
+        raise HTTPException(status_code=500, detail="Inference scheduler not started")
+    return inference_scheduler.stats()
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """Số lần hit/miss và dung lượng của cache kết quả detection"""
+    return detection_cache.stats()
+
+@app.delete("/cache")
+async def clear_cache():
+    """Xóa toàn bộ kết quả đã cache"""
+    detection_cache.clear()
+    return detection_cache.stats()
+
+@app.api_route("/artifacts/{artifact_id}", methods=["GET", "HEAD"])
+async def get_artifact(artifact_id: str, request: Request):
+    """Ảnh/frame đã render được tham chiếu trong response (processed_image, frame_image, original_frame)
+
+    id là hash nội dung nên artifact không bao giờ đổi: ETag + Cache-Control immutable, If-None-Match trả 304,
+    Range trả 206 (1 khoảng byte). 404 khi artifact đã bị evict (ARTIFACT_MAX_MB).
+    """
+    found = await executors.run_io(artifact_store.stat, artifact_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Artifact không tồn tại hoặc đã bị xóa")
+    _, size, media_type = found
+    etag = artifact_store.etag(artifact_id)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*"
+                          or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    
+    start, end, status_code = 0, size - 1, 200
+    range_header = request.headers.get("range")
+    # If-Range khác ETag: client đang giữ bản khác -> trả cả file
+    if range_header and request.headers.get("if-range", etag).strip() == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    try:
+        content = await executors.run_io(artifact_store.read, artifact_id, start, end)
+    except OSError:
+        # Bị evict giữa lúc stat và đọc
+        raise HTTPException(status_code=404, detail="Artifact không tồn tại hoặc đã bị xóa")
+    return Response(content=content, status_code=status_code, headers=headers, media_type=media_type)
+
+@app.get("/artifact-stats")
+async def get_artifact_stats():
+    """Số artifact đã ghi/đọc/evict và dung lượng thư mục artifact"""
+    return artifact_store.stats()
+
+@app.get("/download-stats")
+async def get_download_stats():
+    """Thống kê download video: cache hit, số download gộp (single-flight), dung lượng cache"""
+    if video_processor is None:
+        raise HTTPException(status_code=500, detail="Model or video processor not loaded")
+    return video_processor.downloads.stats()
+
 @app.get("/model-info")
 async def get_model_info():
     """Thông tin về model đã train"""
@@ -240,6 +835,8 @@ async def get_model_info():
         "classes": ["Platelets", "RBC", "WBC"],
         "input_size": "300x300",
         "framework": "PyTorch + torchvision",
+        "inference_backend": inference_backend.describe() if inference_backend is not None else None,
+        "detection_settings": DEFAULT_DETECTION_SETTINGS.describe(),
         "note": "Custom trained model specifically for blood cell detection"
     }
 
@@ -253,19 +850,43 @@ async def predict_youtube_video(request: YouTubeVideoRequest):
     if not any(domain in request.url for domain in ['youtube.com', 'youtu.be']):
         raise HTTPException(status_code=400, detail="URL phải là YouTube video")
     
+    max_frames = min(request.max_frames, 100)  # Giới hạn tối đa 100 frames
+    if request.response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"response_format phải là một trong {list(RESPONSE_FORMATS)}")
+    
+    temporal = temporal_config(request)
+    settings = request_detection_settings(request)
+    image_mode = resolve_image_mode(request.image_mode)
+    variant = f"{request.response_format}|{settings.cache_variant()}|{image_mode}"
+    if temporal is not None:
+        variant = f"{variant}|{temporal.cache_variant()}"
+    cache_key = detection_cache.video_key(request.url, max_frames, confidence_threshold=settings.score_thresh, variant=variant)
+    cached = await executors.run_io(lookup_cached, cache_key, image_mode)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json", headers={"X-Cache": "HIT"})
+    
+    # Giữ slot + max_frames frame trong ngân sách của nhóm video tới khi xử lý xong
+    ticket = await admission["video"].acquire(max_frames)
+    video_path = None
     try:
         print(f"Processing YouTube video: {request.url}")
         
-        # Process video
-        result = video_processor.process_video(
-            url=request.url,
-            max_frames=min(request.max_frames, 100)  # Giới hạn tối đa 100 frames
-        )
+        # Download trên pool I/O, detect + encode frame trên pool compute
+        video_path = await executors.run_io(video_processor.download_youtube_video, request.url)
+        result = await collect_records(executors.compute, video_processor.iter_file_results(
+            video_path,
+            max_frames=max_frames,
+            batch_size=max(1, min(request.batch_size, 32)),
+            response_format=request.response_format,
+            temporal=temporal,
+            settings=settings,
+            image_mode=image_mode
+        ))
         
         if not result['success']:
             raise HTTPException(status_code=400, detail=result['error'])
         
-        return JSONResponse(content={
+        content = await executors.run_compute(detection_cache.set, cache_key, {
             "success": True,
             "video_url": request.url,
             "total_frames_processed": result['total_frames_processed'],
@@ -273,13 +894,268 @@ async def predict_youtube_video(request: YouTubeVideoRequest):
             "class_statistics": result['class_statistics'],
             "average_detections_per_frame": result['average_detections_per_frame'],
             "frame_results": result['frame_results'],
+            "temporal": result.get('temporal'),
+            "detection_settings": result['detection_settings'],
             "model_info": "Custom trained SSD model for blood cell detection",
             "processing_note": f"Processed {result['total_frames_processed']} frames from YouTube video"
         })
+        return Response(content=content, media_type="application/json", headers={"X-Cache": "MISS"})
         
     except Exception as e:
         print(f"Error processing YouTube video: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing video: {str(e)}")
+    finally:
+        if video_path is not None:
+            await executors.run_io(video_processor.release_video, video_path)
+        ticket.release()
+
+def encode_stream_record(record: Dict, stream_format: str) -> str:
+    """Encode 1 record thành 1 dòng NDJSON hoặc 1 event SSE"""
+    payload = json.dumps(record, ensure_ascii=False)
+    if stream_format == "sse":
+        return f"event: {record['type']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+async def collect_records(pool, records) -> Dict:
+    """collect_results với từng record được lấy trên pool (mỗi next() là 1 task)
+
+    Video dài không giữ 1 thread của pool tới khi xong, các request khác chen vào được giữa các batch frame.
+    """
+    collected = []
+    try:
+        async for record in pool.iterate(records):
+            collected.append(record)
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+    return video_processor.collect_results(record for record in collected)
+
+async def stream_video_records(request: YouTubeVideoRequest, stream_format: str, include_images: bool,
+                               temporal: Optional[TemporalConfig] = None, ticket=None,
+                               settings: Optional[DetectionSettings] = None, image_mode: str = "url"):
+    """Generator trả từng frame ngay khi xử lý xong, kết thúc bằng record summary
+
+    Download chạy trên pool I/O, từng frame được detect + encode trên pool compute.
+    ticket: slot admission được trả khi stream kết thúc (kể cả khi client ngắt kết nối giữa chừng).
+    """
+    video_path = None
+    try:
+        video_path = await executors.run_io(video_processor.download_youtube_video, request.url)
+        records = video_processor.iter_file_results(
+            video_path,
+            max_frames=min(request.max_frames, 100),  # Giới hạn tối đa 100 frames
+            batch_size=max(1, min(request.batch_size, 32)),
+            include_images=include_images,
+            response_format=request.response_format,
+            temporal=temporal,
+            settings=settings,
+            image_mode=image_mode
+        )
+        async for record in executors.iterate_compute(records):
+            if record['type'] == 'frame':
+                record = {
+                    'type': 'frame',
+                    'frames_done': record['frames_done'],
+                    'frames_total': record['frames_total'],
+                    **record['frame']
+                }
+            yield encode_stream_record(record, stream_format)
+    except Exception as e:
+        print(f"Error streaming YouTube video: {e}")
+        yield encode_stream_record({'type': 'error', 'error': str(e)}, stream_format)
+    finally:
+        if video_path is not None:
+            # Không await: client ngắt kết nối thì stream đang bị hủy
+            executors.io.submit(video_processor.release_video, video_path)
+        if ticket is not None:
+            ticket.release()
+
+@app.post("/predict-youtube/stream")
+async def predict_youtube_video_stream(request: YouTubeVideoRequest, format: str = "ndjson", include_images: bool = True):
+    """Stream kết quả từng frame (NDJSON hoặc SSE) thay vì chờ xử lý xong toàn bộ video"""
+    if model is None or video_processor is None:
+        raise HTTPException(status_code=500, detail="Model or video processor not loaded")
+    
+    # Validate YouTube URL
+    if not any(domain in request.url for domain in ['youtube.com', 'youtu.be']):
+        raise HTTPException(status_code=400, detail="URL phải là YouTube video")
+    
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format phải là 'ndjson' hoặc 'sse'")
+    
+    if request.response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"response_format phải là một trong {list(RESPONSE_FORMATS)}")
+    
+    temporal = temporal_config(request)
+    settings = request_detection_settings(request)
+    image_mode = resolve_image_mode(request.image_mode)
+    ticket = await admission["video"].acquire(min(request.max_frames, 100))
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    # Generator trả slot khi stream kết thúc; BackgroundTask trả slot cả khi body không được gửi
+    # (client ngắt kết nối trước khi Starlette bắt đầu lặp generator). release() gọi 2 lần không sao
+    return StreamingResponse(
+        stream_video_records(request, format, include_images, temporal, ticket, settings, image_mode),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(ticket.release)
+    )
+
+@app.post("/predict-video")
+async def predict_uploaded_video(request: Request, filename: Optional[str] = None, max_frames: int = 30,
+                                 sample_fps: Optional[float] = None, batch_size: int = 8,
+                                 include_images: bool = True, response_format: str = "objects",
+                                 confidence_threshold: Optional[float] = None, nms_thresh: Optional[float] = None,
+                                 topk_candidates: Optional[int] = None, detections_per_img: Optional[int] = None,
+                                 image_mode: Optional[str] = None):
+    """Phát hiện tế bào trong video upload từ máy (body là nội dung file video, không dùng multipart)
+
+    Body được ghi xuống disk theo từng chunk và pipe vào ffmpeg, frame được sample theo sample_fps và
+    detect ngay khi decode xong thay vì chờ upload hết. Container không đọc tuần tự được (MP4 có moov
+    atom ở cuối) được xử lý từ file trên disk sau khi upload xong.
+    """
+    if model is None or video_processor is None:
+        raise HTTPException(status_code=500, detail="Model or video processor not loaded")
+    
+    if request.headers.get("content-type", "").startswith("multipart/"):
+        raise HTTPException(status_code=415, detail="Gửi nội dung video trực tiếp trong body (vd. curl --data-binary @video.mp4), không dùng multipart")
+    
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"response_format phải là một trong {list(RESPONSE_FORMATS)}")
+    
+    sample_fps = sample_fps or VIDEO_UPLOAD_SAMPLE_FPS
+    if sample_fps <= 0:
+        raise HTTPException(status_code=400, detail="sample_fps phải > 0")
+    
+    # Từ chối sớm nếu client báo trước Content-Length vượt giới hạn
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > VIDEO_UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Video vượt quá giới hạn {VIDEO_UPLOAD_MAX_BYTES // (1024 * 1024)} MB")
+    
+    max_frames = max(1, min(max_frames, 100))  # Giới hạn tối đa 100 frames
+    batch_size = max(1, min(batch_size, 32))
+    settings = detection_settings(confidence_threshold, nms_thresh, topk_candidates, detections_per_img)
+    image_mode = resolve_image_mode(image_mode)
+    suffix = os.path.splitext(filename or '')[1] or '.mp4'
+    upload_path = upload = None
+    ticket = await admission["video"].acquire(max_frames)
+    # Mọi bước sau khi nhận slot (tạo file tạm, start ffmpeg) nằm trong try để slot luôn được trả
+    try:
+        fd, upload_path = tempfile.mkstemp(suffix=suffix, dir=video_processor.temp_dir)
+        os.close(fd)
+        upload = StreamingVideoUpload(upload_path, VIDEO_UPLOAD_MAX_BYTES, sample_fps, max_frames)
+        upload.start()
+        # Detection chạy song song với việc nhận body, bắt đầu từ frame đầu tiên ffmpeg decode được.
+        # Dùng pool I/O vì thread chủ yếu chờ frame theo tốc độ upload, không giữ thread của pool compute
+        processing = asyncio.ensure_future(collect_records(
+            executors.io,
+            video_processor.iter_sample_results(upload.frames(), max_frames, max_frames, batch_size, include_images,
+                                                response_format, settings=settings, decode_stage='upload_frame_wait',
+                                                image_mode=image_mode)
+        ))
+        try:
+            with span('upload'):
+                async for chunk in request.stream():
+                    await executors.run_io(upload.write, chunk)
+        except BaseException:
+            # Quá giới hạn hoặc client ngắt kết nối: dừng ffmpeg để detection thread kết thúc
+            upload.abort()
+            await asyncio.shield(processing)
+            raise
+        upload.finish()
+        result = await processing
+        
+        if upload.pipe_frames == 0:
+            # ffmpeg không decode được từ pipe: xử lý file đã upload bằng FrameSampler (seek trên file)
+            print(f"Không sample được frame khi đang upload, xử lý lại từ file {upload_path}")
+            result = await collect_records(
+                executors.compute,
+                video_processor.iter_file_results(upload_path, max_frames, batch_size, include_images, response_format,
+                                                  settings=settings, image_mode=image_mode)
+            )
+    except VideoUploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    finally:
+        if upload is not None:
+            upload.close()
+        elif upload_path is not None:
+            try:
+                os.remove(upload_path)
+            except OSError:
+                pass
+        ticket.release()
+    
+    if not result['success']:
+        raise HTTPException(status_code=400, detail=result['error'])
+    
+    upload_stats = upload.stats()
+    print(f"Uploaded video: {upload_stats['bytes_received']} bytes in {upload_stats['upload_seconds']:.1f}s, "
+          f"{upload_stats['frames_before_upload_complete']} frames decoded before upload completed")
+    return {
+        "success": True,
+        "filename": filename,
+        "total_frames_processed": result['total_frames_processed'],
+        "total_detections": result['total_detections'],
+        "class_statistics": result['class_statistics'],
+        "average_detections_per_frame": result['average_detections_per_frame'],
+        "frame_results": result['frame_results'],
+        "upload": upload_stats,
+        "detection_settings": result['detection_settings'],
+        "model_info": "Custom trained SSD model for blood cell detection",
+        "processing_note": f"Processed {result['total_frames_processed']} frames from uploaded video"
+    }
+
+@app.post("/jobs/youtube", status_code=202)
+async def submit_youtube_job(request: YouTubeVideoRequest):
+    """Tạo job xử lý video YouTube chạy nền, trả về job id ngay lập tức"""
+    if video_job_manager is None:
+        raise HTTPException(status_code=500, detail="Model or video processor not loaded")
+    
+    # Validate YouTube URL
+    if not any(domain in request.url for domain in ['youtube.com', 'youtu.be']):
+        raise HTTPException(status_code=400, detail="URL phải là YouTube video")
+    
+    # Hàng đợi job có giới hạn: từ chối ngay thay vì nhận job sẽ chờ rất lâu
+    if video_job_manager.stats()['queued'] >= VIDEO_JOB_MAX_QUEUED:
+        raise AdmissionRejected("jobs", 429, "Hàng đợi job video đã đầy, thử lại sau",
+                                video_job_manager.estimated_wait_seconds())
+    
+    job = video_job_manager.submit(
+        url=request.url,
+        max_frames=min(request.max_frames, 100),  # Giới hạn tối đa 100 frames
+        batch_size=max(1, min(request.batch_size, 32)),
+        temporal=temporal_config(request),
+        settings=request_detection_settings(request),
+        image_mode=resolve_image_mode(request.image_mode)
+    )
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "results_url": f"/jobs/{job.id}/results"
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Trạng thái và tiến độ (frames_done/frames_total) của job"""
+    job = video_job_manager.get(job_id) if video_job_manager is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job không tồn tại hoặc đã hết hạn")
+    return job.to_status()
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str, offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1)):
+    """Kết quả từng phần của job, có thể gọi khi job đang chạy"""
+    results = video_job_manager.results(job_id, offset, limit) if video_job_manager is not None else None
+    if results is None:
+        raise HTTPException(status_code=404, detail="Job không tồn tại hoặc đã hết hạn")
+    return JSONResponse(content=results)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Hủy job đang chờ hoặc đang chạy"""
+    job = video_job_manager.cancel(job_id) if video_job_manager is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job không tồn tại hoặc đã hết hạn")
+    return job.to_status()
 
 @app.get("/video-limits")
 async def get_video_limits():
@@ -292,22 +1168,55 @@ async def get_video_limits():
         "note": "Video sẽ được tự động resize và sample để tối ưu xử lý"
     }
 
-@app.post("/process-youtube-video")
+def remove_files(*paths: str):
+    """Xóa các file tạm sau khi response đã gửi xong"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def cleanup_export_files(video_path: str, output_path: str):
+    """Xóa video đã download (workspace của job) và file mp4 kết quả"""
+    video_processor.release_video(video_path)
+    remove_files(output_path)
+
+@app.post("/process-youtube-video", dependencies=[Depends(admission_slot("export"))])
 async def process_youtube_video(request: YouTubeVideoRequest):
+    """Trả về video YouTube đã vẽ bounding box trên từng frame"""
+    if model is None or video_processor is None:
+        raise HTTPException(status_code=500, detail="Model or video processor not loaded")
+    
     url = request.url
-    output_path = f"output_{uuid.uuid4().hex}.mp4"
+    settings = request_detection_settings(request)
+    output_path = os.path.join(video_processor.temp_dir, f"output_{uuid.uuid4().hex}.mp4")
+    video_path = None
     try:
         # 1. Download video
-        video_path = video_processor.download_youtube_video(url)
-        # 2. Detect + vẽ box + ghép lại
-        video_processor.process_video_with_boxes(video_path, output_path)
-        # 3. Trả về file video kết quả
-        return FileResponse(output_path, media_type="video/mp4", filename="detected.mp4")
+        video_path = await executors.run_io(video_processor.download_youtube_video, url)
+        # 2. Detect + vẽ box + encode qua pipeline nhiều stage
+        exporter = AnnotatedVideoExporter(video_processor, batch_size=max(1, min(request.batch_size, 32)))
+        stats = await executors.run_compute(exporter.export, video_path, output_path, settings=settings)
     except Exception as e:
-        return {"error": str(e)}
-    finally:
-        # Xóa file tạm nếu cần
-        pass
+        print(f"Error exporting annotated video: {e}")
+        if video_path:
+            video_processor.release_video(video_path)
+        remove_files(output_path)
+        raise HTTPException(status_code=500, detail=f"Error processing video: {str(e)}")
+    
+    # 3. Trả về file video kết quả, xóa file tạm sau khi gửi xong
+    return FileResponse(
+        output_path,
+        media_type="video/mp4",
+        filename="detected.mp4",
+        headers={
+            "X-Frames-Processed": str(stats['frames']),
+            "X-Processing-FPS": f"{stats['fps']:.2f}",
+            "X-Render-FPS": f"{stats['render_fps']:.2f}",
+            "X-Detection-Settings": json.dumps(settings.describe())
+        },
+        background=BackgroundTask(cleanup_export_files, video_path, output_path)
+    )
 
 if __name__ == "__main__":
     import uvicorn
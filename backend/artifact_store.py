@@ -0,0 +1,193 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Ảnh trong response: 'url' (link tới GET /artifacts/{id}, mặc định) hoặc 'inline' (data URI base64 như trước)
+IMAGE_MODES = ('url', 'inline')
+
+MEDIA_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png'}
+ARTIFACT_ID_PATTERN = re.compile(r'^([0-9a-f]{64})\.(jpg|png)$')
+# Tìm id artifact trong JSON đã cache (không cần parse lại response)
+ARTIFACT_REF_PATTERN = re.compile(rb'/artifacts/([0-9a-f]{64}\.(?:jpg|png))')
+
+
+class RangeNotSatisfiable(ValueError):
+    """Header Range không hợp lệ với kích thước artifact (416)"""
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Header Range 'bytes=start-end' -> (start, end) (end inclusive); None = trả cả file
+
+    Chỉ hỗ trợ 1 khoảng; nhiều khoảng (multipart/byteranges) thì trả cả file như RFC 9110 cho phép.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    start_text, _, end_text = (part.strip() for part in spec.strip().partition('-'))
+    if not (start_text.isdigit() or start_text == '') or not (end_text.isdigit() or end_text == ''):
+        return None
+    if start_text == '':
+        if end_text == '':
+            return None
+        # bytes=-N: N byte cuối
+        length = int(end_text)
+        if length == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - length), size - 1
+    start = int(start_text)
+    if end_text and int(end_text) < start:
+        # Cú pháp không hợp lệ (RFC 9110: last-pos < first-pos): bỏ qua header, trả cả file
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    end = int(end_text) if end_text else size - 1
+    return start, min(end, size - 1)
+
+
+class ArtifactStore:
+    """Lưu ảnh/frame đã render trên disk, response chỉ trả URL ngắn tới GET /artifacts/{id}
+
+    id là SHA-256 của nội dung (content-addressed): cùng ảnh -> cùng id, ghi 1 lần và dùng được làm ETag,
+    client cache vĩnh viễn. Tổng dung lượng vượt max_bytes thì xóa file ít được đọc nhất (atime) tới
+    còn low_water của giới hạn. Các worker của serve.py dùng chung thư mục nên giới hạn chỉ là xấp xỉ.
+    """
+
+    def __init__(self, root_dir: Optional[str] = None, max_bytes: int = 2 * 1024 * 1024 * 1024,
+                 url_prefix: str = '', low_water: float = 0.9):
+        # Thư mục cố định (không mkdtemp) để worker khác process vẫn phục vụ được artifact
+        self.root_dir = root_dir or os.path.join(tempfile.gettempdir(), 'blood_cell_artifacts')
+        self.max_bytes = max_bytes
+        self.url_prefix = url_prefix.rstrip('/')
+        self.low_water = low_water
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._counters = {'writes': 0, 'dedup_writes': 0, 'reads': 0, 'not_found': 0, 'evictions': 0}
+        self._bytes = self._disk_usage()
+
+    def url(self, artifact_id: str) -> str:
+        return f"{self.url_prefix}/artifacts/{artifact_id}"
+
+    def _path(self, artifact_id: str) -> str:
+        # Chia thư mục con theo 2 ký tự đầu để không có hàng trăm nghìn file trong 1 thư mục
+        return os.path.join(self.root_dir, artifact_id[:2], artifact_id)
+
+    def put(self, data: bytes, extension: str = 'jpg') -> str:
+        """Lưu nội dung, trả về id (ảnh đã có thì chỉ cập nhật thời gian truy cập)"""
+        artifact_id = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        path = self._path(artifact_id)
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+            with self._lock:
+                self._counters['dedup_writes'] += 1
+            return artifact_id
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._counters['writes'] += 1
+            self._bytes += len(data)
+            over_limit = self._bytes > self.max_bytes
+        if over_limit:
+            self._evict()
+        return artifact_id
+
+    def put_url(self, data: bytes, extension: str = 'jpg') -> str:
+        return self.url(self.put(data, extension))
+
+    def stat(self, artifact_id: str) -> Optional[Tuple[str, int, str]]:
+        """(đường dẫn, kích thước, media type) của artifact, None nếu id sai hoặc đã bị xóa"""
+        match = ARTIFACT_ID_PATTERN.match(artifact_id)
+        if match is None:
+            return None
+        path = self._path(artifact_id)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            with self._lock:
+                self._counters['not_found'] += 1
+            return None
+        return path, size, MEDIA_TYPES[match.group(2)]
+
+    def read(self, artifact_id: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Đọc nội dung (byte start..end inclusive) và đánh dấu vừa được dùng để eviction theo LRU"""
+        path = self._path(artifact_id)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read() if end is None else f.read(end - start + 1)
+        try:
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+        except OSError:
+            pass
+        with self._lock:
+            self._counters['reads'] += 1
+        return data
+
+    def available(self, content: bytes) -> bool:
+        """Mọi artifact được tham chiếu trong response (JSON bytes) còn trên disk không"""
+        return all(os.path.exists(self._path(artifact_id.decode('ascii')))
+                   for artifact_id in set(ARTIFACT_REF_PATTERN.findall(content)))
+
+    @staticmethod
+    def etag(artifact_id: str) -> str:
+        return f'"{artifact_id.split(".", 1)[0]}"'
+
+    def _files(self):
+        for shard in os.scandir(self.root_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if ARTIFACT_ID_PATTERN.match(entry.name):
+                    yield entry
+
+    def _disk_usage(self) -> int:
+        total = 0
+        for entry in self._files():
+            try:
+                total += entry.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def _evict(self):
+        """Xóa artifact ít được đọc nhất tới khi còn low_water * max_bytes (quét lại disk: có cả file của worker khác)"""
+        files = []
+        for entry in self._files():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_atime, stat.st_size, entry.path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * self.low_water
+        evicted = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                evicted += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._bytes = total
+            self._counters['evictions'] += evicted
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self._counters,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'root_dir': self.root_dir,
+            }
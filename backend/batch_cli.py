@@ -0,0 +1,338 @@
+"""Chạy SSD_custom.pth offline trên cả thư mục ảnh (hàng chục nghìn ảnh), không qua HTTP
+
+DataLoader nhiều worker đọc + decode ảnh trước (prefetch) trong lúc model inference theo batch.
+Kết quả ghi dạng bảng: images.<format> (kích thước, số box từng class mỗi ảnh) và
+detections.<format> (mỗi dòng 1 box, tọa độ theo ảnh gốc). Checkpoint được ghi sau mỗi
+--checkpoint-every ảnh; chạy lại cùng lệnh sẽ tiếp tục từ checkpoint thay vì làm lại từ đầu.
+
+    python batch_cli.py /data/smears --output-dir results --format parquet --batch-size 32 --workers 8
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from batch_sources import list_image_files
+from inference_backend import BACKEND_NAMES, create_backend
+from model_loader import create_blood_cell_model, find_model_path, load_state_dict_file
+from postprocessing import DetectionSettings, class_counts, filter_detections
+from preprocessing import INPUT_SIZE, decode_image, to_uint8_tensor
+from result_cache import file_fingerprint
+
+CLASS_NAMES = ['bg', 'Platelets', 'RBC', 'WBC']
+OUTPUT_FORMATS = ('csv', 'jsonl', 'parquet')
+CHECKPOINT_FILE = 'checkpoint.json'
+
+# (tên cột, kiểu) của 2 bảng kết quả, kiểu dùng cho schema Parquet
+IMAGE_COLUMNS = [('path', 'string'), ('width', 'int64'), ('height', 'int64'), ('total_detections', 'int64')] + \
+    [(name, 'int64') for name in CLASS_NAMES[1:]] + [('error', 'string')]
+DETECTION_COLUMNS = [('path', 'string'), ('x1', 'float64'), ('y1', 'float64'), ('x2', 'float64'), ('y2', 'float64'),
+                     ('score', 'float64'), ('label', 'string')]
+
+
+class ImageFileDataset(Dataset):
+    """Đọc + decode 1 ảnh về 300x300 (chạy trong worker của DataLoader), ảnh lỗi trả về message thay vì raise"""
+
+    def __init__(self, root: str, paths: Sequence[str]):
+        self.root = root
+        self.paths = paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index: int):
+        path = self.paths[index]
+        try:
+            with open(os.path.join(self.root, path), 'rb') as f:
+                image, original_size = decode_image(f.read())
+            return path, to_uint8_tensor(image), original_size, None
+        except Exception as e:
+            return path, None, None, str(e)
+
+
+def collate_samples(samples: List[Tuple]) -> List[Tuple]:
+    # Giữ nguyên list: ảnh lỗi không có tensor, batch được stack sau khi bỏ ảnh lỗi
+    return samples
+
+
+def init_loader_worker(worker_id: int):
+    # Worker chỉ decode bằng PIL, không để intra-op pool của torch tranh core với inference
+    torch.set_num_threads(1)
+
+
+class TableWriter:
+    """Ghi 1 bảng theo từng đợt (append) ra CSV / JSONL / Parquet
+
+    Các dòng được giữ trong RAM tới commit(): ghi + flush xuống disk và trả vị trí ghi (byte offset hoặc
+    số part Parquet) để lưu vào checkpoint; restore() cắt bỏ phần ghi sau checkpoint cuối (lần chạy trước
+    bị dừng giữa lúc ghi).
+    """
+
+    def __init__(self, output_dir: str, name: str, columns: List[Tuple[str, str]], output_format: str):
+        self.columns = columns
+        self.names = [column for column, _ in columns]
+        self.output_format = output_format
+        self._rows: List[Dict] = []
+        self._file = None
+        if output_format == 'parquet':
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise SystemExit("--format parquet cần pyarrow (pip install pyarrow)")
+            self._pq = pq
+            types = {'string': pa.string(), 'int64': pa.int64(), 'float64': pa.float64()}
+            self._schema = pa.schema([(column, types[kind]) for column, kind in columns])
+            self._pa = pa
+            # Dataset Parquet: mỗi checkpoint 1 file part (file Parquet không append được)
+            self.path = os.path.join(output_dir, name)
+            os.makedirs(self.path, exist_ok=True)
+            self.parts = 0
+        else:
+            self.path = os.path.join(output_dir, f"{name}.{output_format}")
+
+    def restore(self, state: Optional[Dict]):
+        """Bỏ dữ liệu ghi sau checkpoint (state None = chạy mới, xóa kết quả cũ)"""
+        if self.output_format == 'parquet':
+            self.parts = state['parts'] if state else 0
+            for filename in os.listdir(self.path):
+                if filename.startswith('part-') and int(filename[5:10]) >= self.parts:
+                    os.remove(os.path.join(self.path, filename))
+            return
+        offset = state['bytes'] if state else 0
+        with open(self.path, 'a+b') as f:
+            f.truncate(offset)
+        self._file = open(self.path, 'a', newline='', encoding='utf-8')
+        if self.output_format == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=self.names)
+            if offset == 0:
+                self._csv.writeheader()
+
+    def append(self, rows: List[Dict]):
+        self._rows.extend(rows)
+
+    def commit(self) -> Dict:
+        rows, self._rows = self._rows, []
+        if self.output_format == 'parquet':
+            if rows:
+                table = self._pa.Table.from_pylist(rows, schema=self._schema)
+                self._pq.write_table(table, os.path.join(self.path, f"part-{self.parts:05d}.parquet"))
+                self.parts += 1
+            return {'parts': self.parts}
+        if self.output_format == 'csv':
+            self._csv.writerows(rows)
+        else:
+            for row in rows:
+                self._file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {'bytes': self._file.tell()}
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def run_fingerprint(paths: Sequence[str], settings: DetectionSettings, model_fingerprint: str, output_format: str) -> str:
+    """Checkpoint chỉ dùng lại được khi cùng danh sách ảnh, model, tham số postprocess và định dạng output"""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.encode('utf-8') + b'\0')
+    digest.update(f"{settings.cache_variant()}|{model_fingerprint}|{output_format}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_checkpoint(output_dir: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(output_dir, CHECKPOINT_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(output_dir: str, checkpoint: Dict):
+    """Ghi file tạm rồi rename: checkpoint luôn ở trạng thái cũ hoặc mới, không bao giờ ghi dở"""
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def detect_batch(backend, samples: List[Tuple], settings: DetectionSettings, device) -> Tuple[List[Dict], List[Dict]]:
+    """Inference 1 batch, trả (dòng bảng images, dòng bảng detections) theo đúng thứ tự ảnh"""
+    valid = [sample for sample in samples if sample[3] is None]
+    predictions = {}
+    if valid:
+        # uint8 -> float [0, 1] sau khi chuyển sang device (ít dữ liệu copy hơn 4 lần)
+        images = torch.stack([tensor for _, tensor, _, _ in valid]).to(device, non_blocking=True).float().div_(255.0)
+        for (path, _, _, _), prediction in zip(valid, backend(images, settings)):
+            predictions[path] = prediction
+
+    image_rows, detection_rows = [], []
+    for path, _, original_size, error in samples:
+        if error is not None:
+            image_rows.append({'path': path, 'width': None, 'height': None, 'total_detections': None,
+                               **{name: None for name in CLASS_NAMES[1:]}, 'error': error})
+            continue
+        width, height = original_size
+        # Box được dự đoán trên ảnh 300x300 -> scale về tọa độ ảnh gốc
+        detections = filter_detections(predictions[path], settings.score_thresh,
+                                       scale=(width / INPUT_SIZE[0], height / INPUT_SIZE[1]))
+        counts = class_counts(detections['labels'], CLASS_NAMES)
+        image_rows.append({'path': path, 'width': width, 'height': height,
+                           'total_detections': int(len(detections['scores'])), **counts, 'error': None})
+        for (x1, y1, x2, y2), score, label in zip(detections['boxes'].tolist(), detections['scores'].tolist(),
+                                                 detections['labels'].tolist()):
+            detection_rows.append({'path': path, 'x1': round(x1, 2), 'y1': round(y1, 2), 'x2': round(x2, 2),
+                                   'y2': round(y2, 2), 'score': round(score, 4), 'label': CLASS_NAMES[label]})
+    return image_rows, detection_rows
+
+
+def load_model(model_path: Optional[str], device):
+    """Dựng SSD300 bằng create_blood_cell_model và load weights đã train (không fallback random weights)"""
+    model_path = model_path or find_model_path()
+    if model_path is None or not os.path.exists(model_path):
+        raise SystemExit("SSD_custom.pth not found (set MODEL_PATH hoặc --model)")
+    model = create_blood_cell_model(num_classes=4)
+    model.load_state_dict(load_state_dict_file(model_path), strict=True)
+    model.to(device).eval()
+    return model, file_fingerprint(model_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch inference offline trên thư mục ảnh, ghi kết quả CSV/JSONL/Parquet")
+    parser.add_argument('input_dir', help="Thư mục ảnh (tìm cả trong thư mục con)")
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--format', default='csv', choices=OUTPUT_FORMATS)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Số process DataLoader đọc + decode ảnh")
+    parser.add_argument('--prefetch', type=int, default=4, help="Số batch mỗi worker chuẩn bị trước")
+    parser.add_argument('--checkpoint-every', type=int, default=1000, help="Ghi checkpoint sau mỗi N ảnh")
+    parser.add_argument('--log-every', type=int, default=20, help="In tiến độ sau mỗi N batch")
+    parser.add_argument('--model', default=None, help="Đường dẫn SSD_custom.pth (mặc định như server)")
+    parser.add_argument('--backend', default=os.getenv("INFERENCE_BACKEND", "eager"), choices=BACKEND_NAMES)
+    parser.add_argument('--artifact-dir', default=os.getenv("INFERENCE_ARTIFACT_DIR") or None)
+    parser.add_argument('--score-thresh', type=float, default=float(os.getenv("DETECTION_SCORE_THRESH", "0.5")))
+    parser.add_argument('--nms-thresh', type=float, default=float(os.getenv("DETECTION_NMS_THRESH", "0.45")))
+    parser.add_argument('--topk-candidates', type=int, default=int(os.getenv("DETECTION_TOPK_CANDIDATES", "400")))
+    parser.add_argument('--detections-per-img', type=int, default=int(os.getenv("DETECTION_MAX_PER_IMAGE", "200")))
+    parser.add_argument('--limit', type=int, default=None, help="Chỉ xử lý N ảnh đầu tiên (chạy thử)")
+    parser.add_argument('--restart', action='store_true', help="Bỏ checkpoint cũ, chạy lại từ đầu")
+    args = parser.parse_args()
+
+    try:
+        settings = DetectionSettings(args.score_thresh, args.nms_thresh, args.topk_candidates, args.detections_per_img)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    paths = list_image_files(args.input_dir)[:args.limit]
+    if not paths:
+        raise SystemExit(f"Không tìm thấy ảnh nào trong {args.input_dir}")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model, model_fingerprint = load_model(args.model, device)
+    backend = create_backend(args.backend, model, device, args.artifact_dir, model_fingerprint,
+                             num_threads=torch.get_num_threads())
+    backend.detection_settings = settings
+
+    fingerprint = run_fingerprint(paths, settings, model_fingerprint, args.format)
+    checkpoint = None if args.restart else load_checkpoint(args.output_dir)
+    if checkpoint is not None and checkpoint['fingerprint'] != fingerprint:
+        raise SystemExit(f"Checkpoint trong {args.output_dir} thuộc lần chạy khác (ảnh, model, tham số hoặc format "
+                         "khác nhau); dùng --restart hoặc --output-dir khác")
+    if checkpoint is not None and checkpoint['completed']:
+        print(f"Đã xử lý xong {checkpoint['images_done']} ảnh trước đó (--restart để chạy lại)")
+        return 0
+
+    writers = {
+        'images': TableWriter(args.output_dir, 'images', IMAGE_COLUMNS, args.format),
+        'detections': TableWriter(args.output_dir, 'detections', DETECTION_COLUMNS, args.format),
+    }
+    for name, writer in writers.items():
+        writer.restore(checkpoint['tables'][name] if checkpoint else None)
+    start = checkpoint['images_done'] if checkpoint else 0
+    if start:
+        print(f"Tiếp tục từ checkpoint: {start}/{len(paths)} ảnh đã xong")
+
+    loader = DataLoader(
+        ImageFileDataset(args.input_dir, paths[start:]),
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        prefetch_factor=args.prefetch if args.workers > 0 else None,
+        collate_fn=collate_samples,
+        worker_init_fn=init_loader_worker,
+        pin_memory=device.type == 'cuda',
+    )
+
+    # Warm-up (torch.compile / ONNX Runtime khởi tạo ở lần gọi đầu tiên) trước khi đo tốc độ
+    backend(torch.zeros(1, 3, INPUT_SIZE[1], INPUT_SIZE[0], device=device))
+
+    done, failed, since_checkpoint = start, 0, 0
+    # Batch đã inference xong nhưng chưa ghi: chỉ thêm vào list bằng 1 lệnh append nên Ctrl+C
+    # không bao giờ để lại batch ghi dở
+    pending: List[Tuple[List[Dict], List[Dict], int]] = []
+    started = time.perf_counter()
+
+    def commit(completed: bool = False):
+        nonlocal done
+        while pending:
+            image_rows, detection_rows, count = pending.pop(0)
+            writers['images'].append(image_rows)
+            writers['detections'].append(detection_rows)
+            done += count
+        elapsed = time.perf_counter() - started
+        save_checkpoint(args.output_dir, {
+            'fingerprint': fingerprint,
+            'images_total': len(paths),
+            'images_done': done,
+            'completed': completed,
+            'tables': {name: writer.commit() for name, writer in writers.items()},
+            'detection_settings': settings.describe(),
+            'backend': backend.name,
+            'last_run_images_per_second': round((done - start) / elapsed, 2) if elapsed > 0 else 0,
+        })
+
+    interrupted = False
+    try:
+        for batch_index, samples in enumerate(loader, 1):
+            image_rows, detection_rows = detect_batch(backend, samples, settings, device)
+            pending.append((image_rows, detection_rows, len(samples)))
+            failed += sum(1 for sample in samples if sample[3] is not None)
+            since_checkpoint += len(samples)
+            if since_checkpoint >= args.checkpoint_every:
+                commit()
+                since_checkpoint = 0
+            if batch_index % args.log_every == 0:
+                elapsed = time.perf_counter() - started
+                finished = done + sum(count for _, _, count in pending)
+                rate = (finished - start) / elapsed
+                eta = (len(paths) - finished) / rate if rate > 0 else 0
+                print(f"{finished}/{len(paths)} ảnh, {rate:.1f} images/s, còn ~{eta:.0f}s")
+    except KeyboardInterrupt:
+        # Giữ các batch đã xong: lần chạy sau tiếp tục từ đây
+        interrupted = True
+    commit(completed=not interrupted)
+    for writer in writers.values():
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    processed = done - start
+    print(f"{'Dừng' if interrupted else 'Xong'}: {processed} ảnh trong {elapsed:.1f}s "
+          f"({processed / elapsed if elapsed > 0 else 0:.1f} images/s), {failed} ảnh lỗi, "
+          f"tổng {done}/{len(paths)} -> {args.output_dir}")
+    return 130 if interrupted else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import os
+import zipfile
+import zlib
+from typing import BinaryIO, Dict, Generator, List, Optional, Tuple
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+ZIP_CONTENT_TYPES = ('application/zip', 'application/x-zip-compressed', 'application/x-zip')
+# Lỗi khi giải nén 1 member (CRC sai, file bị cắt, mã hóa, kiểu nén không hỗ trợ): chỉ ảnh đó lỗi
+ZIP_MEMBER_ERRORS = (zipfile.BadZipFile, zlib.error, OSError, EOFError, RuntimeError, NotImplementedError)
+
+
+class BatchSourceError(ValueError):
+    """Lỗi của 1 ảnh trong batch (ảnh lỗi bị bỏ qua, các ảnh khác vẫn được xử lý)"""
+
+    def __init__(self, filename: str, message: str):
+        super().__init__(message)
+        self.filename = filename
+
+
+def is_zip_upload(filename: Optional[str], content_type: Optional[str]) -> bool:
+    return (content_type or '') in ZIP_CONTENT_TYPES or (filename or '').lower().endswith('.zip')
+
+
+def _is_image_name(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not os.path.basename(name).startswith('.')
+
+
+def _zip_image_members(zf: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    return [member for member in zf.infolist()
+            if not member.is_dir() and _is_image_name(member.filename) and '__MACOSX/' not in member.filename]
+
+
+def iter_zip_images(archive: BinaryIO, archive_name: str, max_member_bytes: int,
+                    progress: Optional[Dict] = None) -> Generator[Tuple[str, object], None, None]:
+    """Đọc lần lượt từng ảnh trong ZIP (chỉ 1 ảnh nằm trong RAM tại 1 thời điểm)
+
+    progress (nếu có): progress['total'] = số ảnh trong ZIP, đọc từ central directory khi mở archive.
+    """
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise BatchSourceError(archive_name, "File ZIP không hợp lệ")
+    with zf:
+        members = _zip_image_members(zf)
+        if progress is not None:
+            progress['total'] = len(members)
+        for member in members:
+            name = f"{archive_name}/{member.filename}"
+            # Kiểm tra kích thước sau giải nén trước khi đọc (chống zip bomb)
+            if member.file_size > max_member_bytes:
+                yield name, BatchSourceError(name, f"Ảnh quá lớn ({member.file_size} bytes)")
+                continue
+            try:
+                with zf.open(member) as f:
+                    contents = f.read(max_member_bytes + 1)
+            except ZIP_MEMBER_ERRORS as e:
+                contents = BatchSourceError(name, f"Không giải nén được ảnh: {e}")
+            yield name, contents
+
+
+def count_upload_images(upload) -> int:
+    """Số ảnh trong 1 file upload chưa được đọc (ZIP: số member là ảnh, chỉ đọc central directory)"""
+    if not is_zip_upload(upload.filename, upload.content_type):
+        return 1
+    try:
+        upload.file.seek(0)
+        with zipfile.ZipFile(upload.file) as zf:
+            return len(_zip_image_members(zf))
+    except (zipfile.BadZipFile, OSError):
+        return 1
+
+
+def iter_upload_images(uploads: List, max_images: int, max_member_bytes: int,
+                       report: Optional[Dict] = None) -> Generator[Tuple[str, object], None, None]:
+    """Yield (tên, bytes ảnh hoặc BatchSourceError) từ nhiều file upload và/hoặc file ZIP
+
+    report (nếu có) được cập nhật khi vượt max_images: truncated = True, skipped_images = số ảnh bị bỏ.
+    """
+    count = 0
+    for position, upload in enumerate(uploads):
+        filename = upload.filename or 'upload'
+        progress = {'total': 1}
+        if is_zip_upload(upload.filename, upload.content_type):
+            upload.file.seek(0)
+            members = iter_zip_images(upload.file, filename, max_member_bytes, progress)
+        elif (upload.content_type or '').startswith('image/') or _is_image_name(filename):
+            upload.file.seek(0)
+            members = iter([(filename, upload.file.read(max_member_bytes + 1))])
+        else:
+            members = iter([(filename, BatchSourceError(filename, "File phải là ảnh hoặc ZIP"))])
+
+        taken = 0
+        try:
+            for name, contents in members:
+                count += 1
+                taken += 1
+                if isinstance(contents, bytes) and len(contents) > max_member_bytes:
+                    contents = BatchSourceError(name, "Ảnh quá lớn")
+                yield name, contents
+                if count >= max_images:
+                    # Phần còn lại: theo tiến độ của generator ZIP đang đọc (không mở lại file của nó)
+                    # + các file upload phía sau chưa được đọc
+                    skipped = progress['total'] - taken + sum(count_upload_images(rest)
+                                                              for rest in uploads[position + 1:])
+                    if report is not None and skipped > 0:
+                        report['truncated'] = True
+                        report['skipped_images'] = skipped
+                    close = getattr(members, 'close', None)
+                    if close is not None:
+                        close()
+                    return
+        except BatchSourceError as e:
+            yield e.filename, e
+
+
+def list_image_files(root: str) -> List[str]:
+    """Đường dẫn tương đối (sort, dấu '/') của mọi ảnh trong root và thư mục con, thứ tự cố định giữa các lần chạy"""
+    paths = []
+    for directory, subdirs, filenames in os.walk(root):
+        subdirs[:] = [name for name in subdirs if not name.startswith('.')]
+        for filename in filenames:
+            if _is_image_name(filename):
+                paths.append(os.path.relpath(os.path.join(directory, filename), root).replace(os.sep, '/'))
+    return sorted(paths)
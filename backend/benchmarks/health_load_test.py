@@ -0,0 +1,173 @@
+"""Latency của /health trong lúc server đang xử lý video (event loop có bị chặn không)
+
+Gọi /health đều đặn khi server rảnh, rồi lặp lại trong lúc --video-concurrency client liên tục gửi video
+tổng hợp lên /predict-video (decode + inference + vẽ box + encode từng frame). Khi việc blocking đã chạy
+trên pool I/O / compute, p99 của /health lúc có tải phải xấp xỉ lúc rảnh thay vì bằng thời gian 1 batch frame.
+
+Chạy từ thư mục backend (tự start serve.py, hoặc --url để đo server đang chạy):
+    python benchmarks/health_load_test.py --duration 30 --video-concurrency 2 --output health_load.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List
+
+from serving_benchmark import BACKEND_DIR, wait_ready
+from synthetic import synthetic_video
+
+
+def percentiles(latencies: List[float]) -> Dict:
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2) if latencies else None
+
+    return {
+        'samples': len(latencies),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(latencies[-1], 2) if latencies else None,
+    }
+
+
+def poll_health(base_url: str, duration: float, interval: float) -> Dict:
+    """Gọi /health mỗi interval giây trong duration giây, trả percentile latency"""
+    latencies, errors = [], 0
+    stop_at = time.time() + duration
+    while time.time() < stop_at:
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(f"{base_url}/health", timeout=30) as response:
+                response.read()
+            latencies.append((time.perf_counter() - started) * 1000)
+        except Exception:
+            errors += 1
+        time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    return {**percentiles(latencies), 'errors': errors}
+
+
+def video_load(base_url: str, body: bytes, query: str, concurrency: int, stop: threading.Event) -> Dict:
+    """Client gửi video liên tục tới khi stop được set; 429/503 (admission) được đếm riêng với lỗi"""
+    counts = {'completed': 0, 'rejected': 0, 'errors': 0}
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def worker():
+        while not stop.is_set():
+            request = urllib.request.Request(f"{base_url}/predict-video?{query}", data=body, method='POST',
+                                             headers={'Content-Type': 'application/octet-stream'})
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=300) as response:
+                    response.read()
+                with lock:
+                    counts['completed'] += 1
+                    latencies.append((time.perf_counter() - started) * 1000)
+            except urllib.error.HTTPError as e:
+                with lock:
+                    counts['rejected' if e.code in (429, 503) else 'errors'] += 1
+                if e.code in (429, 503):
+                    time.sleep(float(e.headers.get('Retry-After', '1')))
+            except Exception:
+                with lock:
+                    counts['errors'] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    return {'threads': threads, 'counts': counts, 'latencies': latencies}
+
+
+def fetch_json(url: str) -> Dict:
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def run(base_url: str, body: bytes, args) -> Dict:
+    query = f"max_frames={args.max_frames}&sample_fps={args.sample_fps}&include_images=true&filename=load.mp4"
+    idle = poll_health(base_url, args.idle_duration, args.interval)
+    print(f"idle: /health p50={idle['p50_ms']}ms p99={idle['p99_ms']}ms")
+
+    stop = threading.Event()
+    load = video_load(base_url, body, query, args.video_concurrency, stop)
+    # Chờ các video đầu tiên bắt đầu xử lý trước khi đo
+    time.sleep(args.ramp_up)
+    loaded = poll_health(base_url, args.duration, args.interval)
+    executors = fetch_json(f"{base_url}/load").get('executors')
+    stop.set()
+    for thread in load['threads']:
+        thread.join()
+    print(f"under video load: /health p50={loaded['p50_ms']}ms p99={loaded['p99_ms']}ms "
+          f"({load['counts']['completed']} videos, {load['counts']['rejected']} rejected)")
+
+    return {
+        'video_concurrency': args.video_concurrency,
+        'frames_per_video': args.max_frames,
+        'health_idle': idle,
+        'health_under_load': loaded,
+        'videos': {**load['counts'], **percentiles(load['latencies'])},
+        'executors': executors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p99 latency của /health khi server đang xử lý video")
+    parser.add_argument('--url', help="Đo server đang chạy thay vì tự start serve.py")
+    parser.add_argument('--port', type=int, default=8200)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--video-concurrency', type=int, default=2)
+    parser.add_argument('--max-frames', type=int, default=30)
+    parser.add_argument('--sample-fps', type=float, default=10.0)
+    parser.add_argument('--video-size', type=int, nargs=2, default=[1280, 720])
+    parser.add_argument('--duration', type=float, default=30, help="Thời gian đo /health khi có tải (giây)")
+    parser.add_argument('--idle-duration', type=float, default=10)
+    parser.add_argument('--ramp-up', type=float, default=3)
+    parser.add_argument('--interval', type=float, default=0.05, help="Khoảng cách giữa 2 lần gọi /health (giây)")
+    parser.add_argument('--startup-timeout', type=float, default=180)
+    parser.add_argument('--output', help="Ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    # Video tổng hợp đủ dài để sample max_frames frame theo sample_fps
+    fd, video_path = tempfile.mkstemp(suffix='.mp4')
+    os.close(fd)
+    frame_count = int(args.max_frames / args.sample_fps * 30) + 30
+    synthetic_video(video_path, frame_count=frame_count, width=args.video_size[0], height=args.video_size[1])
+    with open(video_path, 'rb') as f:
+        body = f.read()
+    os.remove(video_path)
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        # Tắt cache kết quả để video nào cũng chạy model
+        env = dict(os.environ, RESULT_CACHE_MAX_ENTRIES="0", RESULT_CACHE_DIR="")
+        command = [sys.executable, 'serve.py', '--workers', str(args.workers), '--port', str(args.port),
+                   '--log-level', 'warning']
+        server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_ready(base_url, args.startup_timeout)
+        result = run(base_url, body, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
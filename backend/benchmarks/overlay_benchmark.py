@@ -0,0 +1,121 @@
+"""So sánh throughput (frame/giây) vẽ box + encode JPEG: đường PIL cũ và OverlayRenderer
+
+Đường cũ: load font mỗi lần vẽ, copy + vẽ bằng PIL ở độ phân giải gốc, LANCZOS resize + optimize=True cho
+cả frame có box và frame gốc. Đường mới: resize 1 lần, vẽ trên numpy tại chỗ, mỗi ảnh encode 1 lần.
+
+Chạy từ thư mục backend:
+    python benchmarks/overlay_benchmark.py --frames 100 --detections 40
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from overlay import CLASS_COLORS, OverlayRenderer  # noqa: E402
+from synthetic import synthetic_image  # noqa: E402
+
+CLASS_NAMES = ['bg', 'Platelets', 'RBC', 'WBC']
+
+
+def synthetic_detections(count: int, width: int, height: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, [width - 60, height - 60], size=(count, 2))
+    wh = rng.uniform(15, 60, size=(count, 2))
+    return {
+        'boxes': np.concatenate([xy, xy + wh], axis=1),
+        'scores': rng.uniform(0.5, 1.0, size=count).astype(np.float32),
+        'labels': rng.integers(1, 4, size=count),
+    }
+
+
+def legacy_render(frame: np.ndarray, detections, max_size: int = 800):
+    """Tái hiện draw_bounding_boxes + frame_to_base64 trước khi có overlay.py"""
+    image = Image.fromarray(frame)
+    annotated = image.copy()
+    draw = ImageDraw.Draw(annotated)
+    try:
+        font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", 16)
+    except OSError:
+        try:
+            font = ImageFont.truetype("arial.ttf", 16)
+        except OSError:
+            font = ImageFont.load_default()
+    for (x1, y1, x2, y2), score, label in zip(detections['boxes'].tolist(), detections['scores'].tolist(),
+                                             detections['labels'].tolist()):
+        name = CLASS_NAMES[label]
+        color = CLASS_COLORS[name]
+        draw.rectangle([(x1, y1), (x2, y2)], outline=color, width=3)
+        text = f"{name}: {score * 100:.1f}%"
+        bbox = draw.textbbox((0, 0), text, font=font)
+        text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        draw.rectangle([(x1, y1 - text_height - 4), (x1 + text_width + 8, y1)], fill=color)
+        draw.text((x1 + 4, y1 - text_height - 2), text, fill='white', font=font)
+
+    def to_base64(img):
+        buffer = io.BytesIO()
+        if max(img.size) > max_size:
+            ratio = max_size / max(img.size)
+            img = img.resize((int(img.size[0] * ratio), int(img.size[1] * ratio)), Image.Resampling.LANCZOS)
+        img.save(buffer, format='JPEG', quality=85, optimize=True)
+        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+    return to_base64(annotated), to_base64(image)
+
+
+def overlay_render(renderer: OverlayRenderer, frame: np.ndarray, detections, max_size: int = 800):
+    resized, scale = renderer.fit(frame, max_size)
+    original = renderer.data_uri(resized)
+    names = [CLASS_NAMES[label] for label in detections['labels'].tolist()]
+    annotated = renderer.draw(resized.copy(), detections['boxes'], detections['scores'].tolist(), names, scale)
+    return renderer.data_uri(annotated), original
+
+
+def fps(fn, frames, detections) -> float:
+    fn(frames[0], detections)  # warmup
+    started = time.perf_counter()
+    for frame in frames:
+        fn(frame, detections)
+    return len(frames) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput vẽ bounding box + encode JPEG (frame/giây)")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--size', type=int, nargs=2, default=[1280, 720])
+    parser.add_argument('--detections', type=int, default=40)
+    parser.add_argument('--output', help="Ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    width, height = args.size
+    base = synthetic_image(width, height)
+    frames = [np.roll(base, index * 4, axis=1) for index in range(min(args.frames, 20))]
+    frames = (frames * (args.frames // len(frames) + 1))[:args.frames]
+    detections = synthetic_detections(args.detections, width, height)
+    renderer = OverlayRenderer()
+
+    results = {
+        'frame_size': [width, height],
+        'frames': args.frames,
+        'detections_per_frame': args.detections,
+        'legacy_fps': round(fps(legacy_render, frames, detections), 2),
+        'overlay_fps': round(fps(lambda frame, dets: overlay_render(renderer, frame, dets), frames, detections), 2),
+        'overlay_draw_fps': round(renderer.stats()['draw_fps'], 2),
+    }
+    print(f"legacy PIL: {results['legacy_fps']} fps, overlay: {results['overlay_fps']} fps "
+          f"(draw only: {results['overlay_draw_fps']} fps)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""So sánh thời gian từng bước tiền xử lý: đường cũ (decode full-res + PIL + ToTensor) và đường nhanh
+
+Chạy từ thư mục backend:
+    python benchmarks/preprocessing_benchmark.py --width 4000 --height 3000 --iterations 20
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision.transforms import transforms
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocessing import InputBuffers, decode_image, resize_frame, to_uint8_tensor, write_input  # noqa: E402
+from synthetic import encode_jpeg, synthetic_image  # noqa: E402
+
+
+def timed(stages: dict, name: str, fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    stages[name] = stages.get(name, 0.0) + (time.perf_counter() - started) * 1000
+    return result
+
+
+def image_legacy(contents: bytes, stages: dict):
+    image = timed(stages, 'decode', lambda: Image.open(io.BytesIO(contents)).convert('RGB'))
+    resized = timed(stages, 'resize', image.resize, (300, 300))
+    tensor = timed(stages, 'to_tensor', lambda: transforms.ToTensor()(resized).unsqueeze(0))
+    return tensor
+
+
+def image_fast(contents: bytes, stages: dict, buffer: torch.Tensor):
+    resized, _ = timed(stages, 'decode+resize', decode_image, contents)
+    timed(stages, 'to_tensor', lambda: buffer[0].copy_(to_uint8_tensor(resized)).div_(255.0))
+    return buffer
+
+
+def frame_legacy(frame: np.ndarray, stages: dict):
+    pil_image = timed(stages, 'to_pil', Image.fromarray, frame)
+    resized = timed(stages, 'resize', pil_image.resize, (300, 300))
+    return timed(stages, 'to_tensor', transforms.ToTensor(), resized)
+
+
+def frame_fast(frame: np.ndarray, stages: dict, buffer: torch.Tensor):
+    resized = timed(stages, 'resize', resize_frame, frame)
+    return timed(stages, 'to_tensor', write_input, resized, buffer[0])
+
+
+def run(fn, sample, iterations: int, *extra) -> dict:
+    fn(sample, {}, *extra)  # warmup
+    stages = {}
+    for _ in range(iterations):
+        timed(stages, 'total', fn, sample, stages, *extra)
+    return {name: round(value / iterations, 3) for name, value in stages.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tiền xử lý ảnh/frame (ms trung bình mỗi bước)")
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--frame-width', type=int, default=1280)
+    parser.add_argument('--frame-height', type=int, default=720)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--output', help="Ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    contents = encode_jpeg(synthetic_image(args.width, args.height))
+    frame = synthetic_image(args.frame_width, args.frame_height, seed=1)
+    buffer = InputBuffers().get(1)
+
+    results = {
+        'image': {
+            'size': [args.width, args.height],
+            'jpeg_bytes': len(contents),
+            'before': run(image_legacy, contents, args.iterations),
+            'after': run(image_fast, contents, args.iterations, buffer),
+        },
+        'video_frame': {
+            'size': [args.frame_width, args.frame_height],
+            'before': run(frame_legacy, frame, args.iterations),
+            'after': run(frame_fast, frame, args.iterations, buffer),
+        },
+        'iterations': args.iterations,
+        'torch_threads': torch.get_num_threads(),
+    }
+
+    for name in ('image', 'video_frame'):
+        before, after = results[name]['before'], results[name]['after']
+        print(f"{name}: {before['total']:.2f}ms -> {after['total']:.2f}ms "
+              f"(x{before['total'] / max(after['total'], 1e-6):.1f})")
+        print(f"  before: {before}")
+        print(f"  after:  {after}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Benchmark offline cho pipeline ảnh và video (dữ liệu giả lập, không cần mạng)
+
+Đo từng bước (preprocess_image, model forward, postprocess_predictions, draw_bounding_boxes,
+frame_to_base64, extract_frames) và end-to-end /predict, /predict-youtube qua FastAPI TestClient.
+Video "YouTube" là MP4 giả lập được đặt sẵn vào cache của DownloadManager nên không gọi yt-dlp.
+
+Chạy từ thư mục backend:
+    python benchmarks/run_benchmarks.py --output baseline.json
+    python benchmarks/run_benchmarks.py --output current.json --compare baseline.json --threshold 0.15
+Exit code 1 nếu có bước chậm hơn baseline quá ngưỡng.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from synthetic import encode_jpeg, synthetic_image, synthetic_video  # noqa: E402
+
+BENCH_VIDEO_ID = 'benchSynth01'
+
+
+def measure(fn: Callable, iterations: int, warmup: int = 2) -> Dict:
+    """Chạy fn warmup lần rồi đo iterations lần, trả về thống kê theo ms"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'iterations': iterations,
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p50_ms': round(samples[len(samples) // 2], 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'min_ms': round(samples[0], 3),
+    }
+
+
+def synthetic_prediction(count: int = 200, seed: int = 0):
+    """Output giả lập của model (boxes/scores/labels) để đo postprocess độc lập với weights"""
+    import torch
+
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 280, size=(count, 2))
+    wh = rng.uniform(5, 40, size=(count, 2))
+    return {
+        'boxes': torch.from_numpy(np.concatenate([xy, np.minimum(xy + wh, 300)], axis=1).astype(np.float32)),
+        'scores': torch.from_numpy(rng.uniform(0, 1, size=count).astype(np.float32)),
+        'labels': torch.from_numpy(rng.integers(1, 4, size=count).astype(np.int64)),
+    }
+
+
+def prepare_environment(workdir: str, args) -> Dict:
+    """Biến môi trường phải set trước khi import app; đặt video giả lập vào cache download"""
+    download_dir = os.path.join(workdir, 'downloads')
+    os.makedirs(os.path.join(download_dir, 'cache'), exist_ok=True)
+    video_path = synthetic_video(os.path.join(download_dir, 'cache', f'{BENCH_VIDEO_ID}.mp4'),
+                                 frame_count=args.video_frames, width=args.video_size[0], height=args.video_size[1])
+    os.environ.update({
+        'VIDEO_DOWNLOAD_DIR': download_dir,
+        # Tắt cache kết quả để mọi request đều chạy model
+        'RESULT_CACHE_MAX_ENTRIES': '0',
+        'RESULT_CACHE_DIR': '',
+    })
+    return {'video_path': video_path}
+
+
+def run_suite(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix='ssd-bench-')
+    data = prepare_environment(workdir, args)
+    # app tìm SSD_custom.pth theo đường dẫn tương đối với thư mục backend
+    os.chdir(BACKEND_DIR)
+
+    import torch
+    from fastapi.testclient import TestClient
+    from PIL import Image
+
+    import app as app_module
+    from model_loader import preprocess_image
+
+    torch.manual_seed(0)
+    image_pixels = synthetic_image(*args.image_size)
+    image_jpeg = encode_jpeg(image_pixels)
+    pil_image = Image.fromarray(image_pixels)
+    frame_image = Image.fromarray(synthetic_image(*args.video_size, seed=3))
+    prediction = synthetic_prediction()
+    draw_detections = app_module.to_detection_dicts(app_module.filter_detections(prediction, 0.0), app_module.class_names)[:50]
+    youtube_request = {'url': f'https://youtu.be/{BENCH_VIDEO_ID}', 'max_frames': args.video_max_frames,
+                       'batch_size': 8, 'confidence_threshold': 0.5}
+
+    results = {}
+    with TestClient(app_module.app) as client:
+        processor = app_module.video_processor
+        backend = app_module.inference_backend
+        batch = preprocess_image(pil_image, app_module.device)
+
+        def forward():
+            with torch.no_grad():
+                backend(batch)
+
+        stages = {
+            'preprocess_image': lambda: preprocess_image(pil_image, app_module.device),
+            'model_forward': forward,
+            'postprocess_predictions': lambda: app_module.postprocess_predictions([prediction]),
+            'draw_bounding_boxes': lambda: processor.draw_bounding_boxes(frame_image, draw_detections),
+            'frame_to_base64': lambda: processor.frame_to_base64(frame_image),
+            'extract_frames': lambda: sum(1 for _ in processor.extract_frames(data['video_path'], args.video_max_frames)),
+        }
+        for name, fn in stages.items():
+            results[name] = measure(fn, args.iterations)
+            print(f"{name}: {results[name]['mean_ms']:.2f}ms")
+
+        def predict_endpoint():
+            response = client.post('/predict', files={'file': ('smear.jpg', image_jpeg, 'image/jpeg')})
+            response.raise_for_status()
+
+        def video_endpoint():
+            response = client.post('/predict-youtube', json=youtube_request)
+            response.raise_for_status()
+            if not response.json().get('success'):
+                raise RuntimeError(response.json().get('error'))
+
+        results['e2e_predict'] = measure(predict_endpoint, args.iterations)
+        print(f"e2e_predict: {results['e2e_predict']['mean_ms']:.2f}ms")
+        results['e2e_video'] = measure(video_endpoint, args.video_iterations, warmup=1)
+        print(f"e2e_video: {results['e2e_video']['mean_ms']:.2f}ms")
+
+        meta = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'torch_threads': torch.get_num_threads(),
+            'inference_backend': backend.name,
+            'weights_loaded': app_module.model_status['weights_loaded'],
+            'image_size': list(args.image_size),
+            'video_size': list(args.video_size),
+            'video_frames': args.video_frames,
+            'video_max_frames': args.video_max_frames,
+        }
+    return {'meta': meta, 'results': results}
+
+
+def compare(current: Dict, baseline: Dict, threshold: float, metric: str = 'p50_ms') -> Dict:
+    """So sánh với baseline, bước nào chậm hơn quá threshold (tỉ lệ) bị đánh dấu regression"""
+    report = {}
+    for name, result in current['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None or not previous.get(metric):
+            continue
+        change = result[metric] / previous[metric] - 1
+        report[name] = {
+            'baseline': previous[metric],
+            'current': result[metric],
+            'change': round(change, 4),
+            'regression': change > threshold,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline cho blood cell detection")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--video-iterations', type=int, default=3)
+    parser.add_argument('--image-size', type=int, nargs=2, default=[1280, 960])
+    parser.add_argument('--video-size', type=int, nargs=2, default=[640, 360])
+    parser.add_argument('--video-frames', type=int, default=150)
+    parser.add_argument('--video-max-frames', type=int, default=30)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="File JSON baseline để so sánh")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Ngưỡng regression (0.15 = chậm hơn 15%%)")
+    parser.add_argument('--metric', default='p50_ms', choices=['mean_ms', 'p50_ms', 'p95_ms', 'min_ms'])
+    args = parser.parse_args()
+    # run_suite() đổi thư mục làm việc sang backend
+    args.output = os.path.abspath(args.output)
+    if args.compare:
+        args.compare = os.path.abspath(args.compare)
+
+    report = run_suite(args)
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report['comparison'] = {
+            'baseline_file': args.compare,
+            'metric': args.metric,
+            'threshold': args.threshold,
+            'stages': compare(report, baseline, args.threshold, args.metric),
+        }
+        for name, row in report['comparison']['stages'].items():
+            flag = 'REGRESSION' if row['regression'] else 'ok'
+            print(f"{name}: {row['baseline']:.2f} -> {row['current']:.2f}ms ({row['change']:+.1%}) {flag}")
+        if any(row['regression'] for row in report['comparison']['stages'].values()):
+            exit_code = 1
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
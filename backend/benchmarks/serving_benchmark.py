@@ -0,0 +1,179 @@
+"""So sánh throughput và bộ nhớ giữa 1 process và serve.py nhiều worker
+
+Mỗi cấu hình được chạy thành server riêng (cache kết quả bị tắt để mọi request đều chạy model),
+gửi /predict đồng thời trong --duration giây rồi đo RSS và PSS của cả cây process.
+PSS chia đều các page dùng chung (weights trong shared memory) cho các process nên phản ánh
+đúng bộ nhớ thực; cộng RSS của từng worker sẽ đếm weights nhiều lần.
+
+Chạy từ thư mục backend (Linux, cần /proc):
+    python benchmarks/serving_benchmark.py --workers 1 4 --concurrency 16 --duration 30 --output serving.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from typing import Dict, List
+
+from synthetic import encode_jpeg, synthetic_image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def multipart_body(contents: bytes, filename: str = 'smear.jpg'):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode('utf-8') + contents + f"\r\n--{boundary}--\r\n".encode('utf-8')
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def process_tree(root_pid: int) -> List[int]:
+    """PID của root và mọi process con (đọc ppid từ /proc)"""
+    children: Dict[int, List[int]] = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def memory_kb(pid: int) -> Dict[str, int]:
+    values = {'rss_kb': 0, 'pss_kb': 0}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    values[f'{key.lower()}_kb'] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def wait_ready(base_url: str, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/health/ready", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except Exception:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Server không ready sau {timeout}s")
+
+
+def load_test(base_url: str, body: bytes, content_type: str, concurrency: int, duration: float) -> Dict:
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def worker():
+        while time.time() < stop_at:
+            request = urllib.request.Request(f"{base_url}/predict", data=body, method='POST',
+                                             headers={'Content-Type': content_type})
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(elapsed)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2) if latencies else None
+
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': round(len(latencies) / wall, 2),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }
+
+
+def run_configuration(workers: int, port: int, body: bytes, content_type: str, args) -> Dict:
+    env = dict(os.environ, RESULT_CACHE_MAX_ENTRIES="0", RESULT_CACHE_DIR="")
+    command = [sys.executable, 'serve.py', '--workers', str(workers), '--port', str(port), '--log-level', 'warning']
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base_url, args.startup_timeout)
+        # Warm-up cho mọi worker trước khi đo
+        load_test(base_url, body, content_type, args.concurrency, 3)
+        idle = [memory_kb(pid) for pid in process_tree(server.pid)]
+        result = load_test(base_url, body, content_type, args.concurrency, args.duration)
+        loaded = [memory_kb(pid) for pid in process_tree(server.pid)]
+        result.update({
+            'workers': workers,
+            'processes': len(loaded),
+            'rss_total_mb': round(sum(m['rss_kb'] for m in loaded) / 1024, 1),
+            'pss_total_mb': round(sum(m['pss_kb'] for m in loaded) / 1024, 1),
+            'pss_idle_mb': round(sum(m['pss_kb'] for m in idle) / 1024, 1),
+        })
+        return result
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput / RSS / PSS của /predict theo số worker")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--image-size', type=int, nargs=2, default=[1280, 960])
+    parser.add_argument('--startup-timeout', type=float, default=180)
+    parser.add_argument('--output', help="Ghi kết quả JSON ra file")
+    args = parser.parse_args()
+
+    body, content_type = multipart_body(encode_jpeg(synthetic_image(*args.image_size)))
+    results = []
+    for index, workers in enumerate(args.workers):
+        result = run_configuration(workers, args.port + index, body, content_type, args)
+        results.append(result)
+        print(f"workers={workers}: {result['requests_per_second']} req/s, p95={result['p95_ms']}ms, "
+              f"RSS={result['rss_total_mb']}MB, PSS={result['pss_total_mb']}MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'concurrency': args.concurrency, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Dữ liệu giả lập cho benchmark (không cần mạng hay dataset thật)"""
+import io
+
+import numpy as np
+from PIL import Image
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Ảnh RGB giả lập tiêu bản máu: nền hồng nhạt + các hình tròn (tế bào) ngẫu nhiên"""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), (235, 205, 210), dtype=np.uint8)
+    yy, xx = np.ogrid[:height, :width]
+    radius = max(4, min(width, height) // 40)
+    for _ in range(200):
+        cx, cy = rng.integers(0, width), rng.integers(0, height)
+        r = int(radius * rng.uniform(0.5, 1.5))
+        y0, y1, x0, x1 = max(0, cy - r), min(height, cy + r), max(0, cx - r), min(width, cx + r)
+        mask = (yy[y0:y1] - cy) ** 2 + (xx[:, x0:x1] - cx) ** 2 <= r * r
+        image[y0:y1, x0:x1][mask] = rng.integers(120, 220, size=3)
+    noise = rng.integers(-8, 8, size=image.shape)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def encode_jpeg(pixels: np.ndarray, quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def synthetic_video(path: str, frame_count: int = 90, width: int = 640, height: int = 360, fps: float = 30.0) -> str:
+    """Ghi MP4 giả lập (các tế bào trôi ngang qua khung hình) bằng OpenCV"""
+    import cv2
+
+    background = synthetic_image(width * 2, height, seed=2)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError("OpenCV không ghi được MP4 (thiếu codec mp4v)")
+    try:
+        for index in range(frame_count):
+            offset = (index * 4) % width
+            frame = background[:, offset:offset + width]
+            writer.write(cv2.cvtColor(np.ascontiguousarray(frame), cv2.COLOR_RGB2BGR))
+    finally:
+        writer.release()
+    return path
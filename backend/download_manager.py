@@ -0,0 +1,198 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Optional
+
+import yt_dlp
+
+from result_cache import youtube_video_id
+
+VIDEO_EXTENSIONS = ['.mp4', '.webm', '.mkv', '.avi']
+
+
+class DownloadManager:
+    """Quản lý download video YouTube: workspace riêng cho từng job, gộp request trùng (single-flight), cache LRU trên disk"""
+
+    def __init__(self, root_dir: Optional[str] = None, cache_max_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.root_dir = root_dir or tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.root_dir, 'cache')
+        self.jobs_dir = os.path.join(self.root_dir, 'jobs')
+        self.cache_max_bytes = cache_max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._counters = {'cache_hits': 0, 'downloads': 0, 'deduplicated': 0}
+
+    def fetch(self, url: str, max_duration: int = 300) -> str:
+        """Trả về đường dẫn file video trong workspace riêng của job (caller gọi release() khi xong)"""
+        video_id = youtube_video_id(url)
+        if not re.fullmatch(r'[a-zA-Z0-9_-]+', video_id):
+            # URL không nhận ra id: dùng hash làm tên file
+            video_id = hashlib.sha256(video_id.encode('utf-8')).hexdigest()[:16]
+
+        cached_path = self._cached_file(video_id)
+        if cached_path is not None:
+            job_path = self._checkout(cached_path)
+            if job_path is not None:
+                with self._lock:
+                    self._counters['cache_hits'] += 1
+                return job_path
+
+        # Single-flight: chỉ 1 thread download, các thread khác chờ chung kết quả
+        with self._lock:
+            future = self._inflight.get(video_id)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[video_id] = future
+            else:
+                self._counters['deduplicated'] += 1
+
+        if leader:
+            try:
+                future.set_result(self._download_to_cache(url, video_id, max_duration))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(video_id, None)
+
+        cached_path = future.result()
+        job_path = self._checkout(cached_path)
+        if job_path is None:
+            # File vừa bị evict khỏi cache, download lại
+            return self.fetch(url, max_duration)
+        return job_path
+
+    def release(self, job_path: str):
+        """Xóa file video và workspace của job"""
+        workspace = os.path.dirname(job_path)
+        if os.path.dirname(workspace) == self.jobs_dir:
+            shutil.rmtree(workspace, ignore_errors=True)
+        else:
+            try:
+                os.remove(job_path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict:
+        files = self._cache_files()
+        with self._lock:
+            return {
+                **self._counters,
+                'in_flight': len(self._inflight),
+                'cached_videos': len(files),
+                'cache_bytes': sum(size for _, size, _ in files),
+                'cache_max_bytes': self.cache_max_bytes,
+            }
+
+    def _download_to_cache(self, url: str, video_id: str, max_duration: int) -> str:
+        """Download vào workspace tạm rồi chuyển vào cache"""
+        workspace = tempfile.mkdtemp(dir=self.jobs_dir)
+        try:
+            # Cấu hình yt-dlp với hỗ trợ YouTube Shorts
+            ydl_opts = {
+                'format': 'best[height<=720][ext=mp4]/best[ext=mp4]/best',  # Hỗ trợ nhiều format hơn
+                'outtmpl': os.path.join(workspace, '%(id)s.%(ext)s'),  # Dùng ID thay vì title
+                'quiet': True,
+                'no_warnings': True,
+                'extract_flat': False,  # Đảm bảo extract full info
+                'force_json': False,
+            }
+
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                # Lấy thông tin video trước
+                info = ydl.extract_info(url, download=False)
+                duration = info.get('duration', 0)
+
+                # Kiểm tra độ dài video (cho phép Shorts dài hơn)
+                max_allowed = max_duration if duration and duration > 60 else 180  # Shorts có thể dài đến 3 phút
+                if duration and duration > max_allowed:
+                    raise ValueError(f"Video quá dài ({duration}s). Tối đa {max_allowed}s")
+
+                # Download video
+                ydl.download([url])
+
+            # Workspace riêng nên chỉ có file của video này
+            video_files = [f for f in Path(workspace).glob('*.*') if f.suffix.lower() in VIDEO_EXTENSIONS]
+            if not video_files:
+                raise FileNotFoundError("Không thể download video")
+
+            cached_path = os.path.join(self.cache_dir, f"{video_id}{video_files[0].suffix.lower()}")
+            os.replace(str(video_files[0]), cached_path)
+            with self._lock:
+                self._counters['downloads'] += 1
+            self._evict(keep=cached_path)
+            return cached_path
+        finally:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    def _cached_file(self, video_id: str) -> Optional[str]:
+        for extension in VIDEO_EXTENSIONS:
+            path = os.path.join(self.cache_dir, f"{video_id}{extension}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _checkout(self, cached_path: str) -> Optional[str]:
+        """Hard link (hoặc copy) file cache vào workspace riêng của job, None nếu file đã bị evict"""
+        workspace = tempfile.mkdtemp(dir=self.jobs_dir)
+        job_path = os.path.join(workspace, os.path.basename(cached_path))
+        try:
+            if not self._link_or_copy(cached_path, job_path):
+                shutil.rmtree(workspace, ignore_errors=True)
+                return None
+            # Đánh dấu vừa dùng để eviction theo LRU
+            now = time.time()
+            os.utime(cached_path, (now, now))
+        except FileNotFoundError:
+            pass
+        return job_path
+
+    @staticmethod
+    def _link_or_copy(source: str, destination: str) -> bool:
+        try:
+            os.link(source, destination)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            # Khác filesystem (hoặc không hỗ trợ hard link): copy
+            try:
+                shutil.copy2(source, destination)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def _cache_files(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _evict(self, keep: str):
+        """Xóa video ít được dùng nhất khi cache vượt cache_max_bytes"""
+        files = self._cache_files()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.cache_max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional
+
+from metrics import EXECUTOR_QUEUE_SECONDS, EXECUTOR_TASKS
+
+# Sentinel báo iterator đã hết phần tử
+_END = object()
+
+
+class ManagedExecutor:
+    """ThreadPoolExecutor có tên + số luồng cố định, đếm task đang chờ/đang chạy để báo tải
+
+    run() chạy hàm blocking trên pool và await kết quả từ event loop; context của request (breakdown span
+    cho Server-Timing) được copy sang thread.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self._queue_seconds = 0.0  # EMA thời gian chờ thread trống
+
+    def _update_gauges(self):
+        EXECUTOR_TASKS.set(self.queued, pool=self.name, state='queued')
+        EXECUTOR_TASKS.set(self.running, pool=self.name, state='running')
+
+    def _call(self, submitted: float, fn: Callable, *args, **kwargs):
+        waited = time.perf_counter() - submitted
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self._queue_seconds = waited if not self.completed else 0.9 * self._queue_seconds + 0.1 * waited
+            self._update_gauges()
+        EXECUTOR_QUEUE_SECONDS.observe(waited, pool=self.name)
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                if not ok:
+                    self.failed += 1
+                self._update_gauges()
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        """Gửi task vào pool, trả concurrent.futures.Future (dùng được từ thread khác event loop)"""
+        with self._lock:
+            self.queued += 1
+            self._update_gauges()
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._call, time.perf_counter(), fn, *args, **kwargs)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Chạy fn(*args, **kwargs) trên pool, event loop tiếp tục phục vụ request khác trong lúc chờ"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def iterate(self, iterator: Iterator) -> AsyncIterator:
+        """Lấy từng phần tử của generator đồng bộ trên pool (mỗi next() là 1 task)
+
+        Dừng giữa chừng (client ngắt kết nối) thì generator được đóng trên pool sau khi next() đang chạy
+        kết thúc, để các khối finally (trả slot, xóa file tạm) vẫn chạy mà không chặn event loop.
+        """
+        # next() và close() không được chạy đồng thời trên 2 thread
+        lock = threading.Lock()
+
+        def locked(fn, *args):
+            with lock:
+                return fn(*args)
+
+        finished = False
+        try:
+            while True:
+                item = await self.run(locked, next, iterator, _END)
+                if item is _END:
+                    finished = True
+                    return
+                yield item
+        finally:
+            close = getattr(iterator, 'close', None)
+            if not finished and close is not None:
+                # Không await: có thể đang ở trong cancel scope đã bị hủy
+                self.submit(locked, close)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'queued': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'utilization': round(self.running / self.max_workers, 3),
+                'avg_queue_seconds': round(self._queue_seconds, 4),
+            }
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def default_compute_workers(cores: Optional[int] = None) -> int:
+    """Mặc định: nửa số core của process (tối thiểu 2, tối đa 8), phần còn lại cho intra-op thread của PyTorch
+
+    cores: số core được chia cho process (vd. torch.get_num_threads() của worker serve.py).
+    """
+    if cores is None:
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    return max(2, min(8, cores // 2))
+
+
+class Executors:
+    """Pool riêng cho từng loại việc blocking để event loop chỉ xử lý request
+
+    io: chờ mạng/disk (download video, ghi file upload) nên có nhiều thread;
+    compute: decode, inference, vẽ box, encode (giữ CPU) nên được giới hạn theo số core, tránh
+    quá nhiều thread tranh CPU với PyTorch và với chính event loop.
+    """
+
+    def __init__(self, io_workers: int = 16, compute_workers: Optional[int] = None, cores: Optional[int] = None):
+        self.io = ManagedExecutor("io", io_workers)
+        self.compute = ManagedExecutor("compute", compute_workers or default_compute_workers(cores))
+
+    async def run_io(self, fn: Callable, *args, **kwargs):
+        return await self.io.run(fn, *args, **kwargs)
+
+    async def run_compute(self, fn: Callable, *args, **kwargs):
+        return await self.compute.run(fn, *args, **kwargs)
+
+    def iterate_compute(self, iterator: Iterator) -> AsyncIterator:
+        return self.compute.iterate(iterator)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {'io': self.io.stats(), 'compute': self.compute.stats()}
+
+    def shutdown(self):
+        self.io.shutdown()
+        self.compute.shutdown()
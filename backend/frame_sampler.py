@@ -0,0 +1,124 @@
+import cv2
+import numpy as np
+from typing import Generator, List, Tuple
+
+
+class FrameSampler:
+    """Sample frame theo timestamp bằng seek/grab thay vì decode rồi bỏ từng frame"""
+
+    def __init__(self, min_seek_gap: int = 48, seek_tolerance: int = 1, fallback_fps: float = 30.0):
+        # Khoảng cách (số frame) tối thiểu để seek thay vì grab() tuần tự
+        self.min_seek_gap = min_seek_gap
+        # Sai lệch tối đa (số khoảng frame, so theo PTS của frame đọc được) sau khi seek trước khi coi
+        # container là không seek chính xác được
+        self.seek_tolerance = seek_tolerance
+        self.fallback_fps = fallback_fps
+
+    @staticmethod
+    def target_indices(total_frames: int, max_frames: int) -> List[int]:
+        """Các frame index cần lấy, cách đều nhau trên toàn video"""
+        if total_frames <= 0 or max_frames <= 0:
+            return []
+        step = max(1, total_frames // max_frames)
+        return list(range(0, total_frames, step))[:max_frames]
+
+    def planned_frame_count(self, video_path: str, max_frames: int) -> int:
+        """Số frame sẽ được sample (dùng để báo tiến độ), max_frames nếu container không báo số frame"""
+        cap = cv2.VideoCapture(video_path)
+        try:
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        finally:
+            cap.release()
+        if total_frames <= 0:
+            return max_frames
+        return len(self.target_indices(total_frames, max_frames))
+
+    def sample(self, video_path: str, max_frames: int = 100) -> Generator[Tuple[np.ndarray, int, float], None, None]:
+        """Yield (frame RGB, frame index, timestamp thực tế tính bằng giây)"""
+        cap = cv2.VideoCapture(video_path)
+        try:
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            fps = cap.get(cv2.CAP_PROP_FPS) or self.fallback_fps
+
+            if total_frames <= 0:
+                # Container không báo số frame (một số file webm/mkv): decode tuần tự theo thời gian
+                yield from self._sample_sequential(cap, max_frames, fps)
+                return
+
+            can_seek = True
+            position = 0  # frame index của lần grab() kế tiếp
+            for target in self.target_indices(total_frames, max_frames):
+                frame = None
+                gap = target - position
+                if can_seek and gap > self.min_seek_gap:
+                    frame = self._seek(cap, target, fps)
+                    if frame is not None:
+                        position = target + 1
+                    else:
+                        # Seek không chính xác: mở lại video và chuyển sang grab() tuần tự
+                        print(f"Seek không chính xác trên {video_path}, fallback sang grab() tuần tự")
+                        can_seek = False
+                        cap.release()
+                        cap = cv2.VideoCapture(video_path)
+                        position = 0
+
+                if frame is None:
+                    # Bỏ qua các frame trung gian bằng grab() (không convert màu, không copy ra numpy)
+                    while position < target:
+                        if not cap.grab():
+                            return
+                        position += 1
+
+                    ret, frame = cap.read()
+                    if not ret:
+                        return
+                    position += 1
+
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), target, self._timestamp(cap, target, fps)
+        finally:
+            cap.release()
+
+    def _seek(self, cap: cv2.VideoCapture, target: int, fps: float):
+        """Seek tới frame target rồi đọc 1 frame, trả frame (BGR) nếu đúng vị trí, None nếu seek không chính xác
+
+        CAP_PROP_POS_FRAMES ngay sau set() chỉ lặp lại giá trị vừa set trên hầu hết backend, nên vị trí được
+        kiểm tra bằng PTS (CAP_PROP_POS_MSEC) của frame thực sự decode được: lệch quá seek_tolerance
+        khoảng frame (vd. seek rơi vào keyframe gần nhất) thì coi như không seek chính xác được.
+        """
+        if not cap.set(cv2.CAP_PROP_POS_FRAMES, target):
+            return None
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        position_msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+        if position_msec <= 0:
+            # Backend không báo PTS: không kiểm tra được
+            return None
+        frame_msec = 1000.0 / fps
+        # Thêm 0.5 ms cho sai số làm tròn PTS
+        if abs(position_msec - target * frame_msec) > self.seek_tolerance * frame_msec + 0.5:
+            return None
+        return frame
+
+    def _timestamp(self, cap: cv2.VideoCapture, frame_index: int, fps: float) -> float:
+        """Timestamp của frame vừa đọc, ưu tiên PTS từ container"""
+        position_msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+        if position_msec > 0 or frame_index == 0:
+            return position_msec / 1000.0
+        return frame_index / fps
+
+    def _sample_sequential(self, cap: cv2.VideoCapture, max_frames: int, fps: float) -> Generator[Tuple[np.ndarray, int, float], None, None]:
+        """Fallback khi không biết tổng số frame: lấy ~1 frame mỗi giây bằng grab()/retrieve()"""
+        step = max(1, int(round(fps)))
+        frame_index = 0
+        returned = 0
+        while returned < max_frames:
+            if not cap.grab():
+                break
+            if frame_index % step == 0:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), frame_index, self._timestamp(cap, frame_index, fps)
+                returned += 1
+            frame_index += 1
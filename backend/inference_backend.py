@@ -0,0 +1,377 @@
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import torch
+import torch.nn.functional as F
+from torchvision.models.detection.image_list import ImageList
+from torchvision.ops import boxes as box_ops
+
+from postprocessing import DetectionSettings
+
+# Kích thước input cố định của SSD300
+INPUT_SIZE = (300, 300)
+
+BACKEND_NAMES = ['eager', 'torchscript', 'compile', 'onnx', 'onnx-int8']
+
+
+class SSDFeatureHead(torch.nn.Module):
+    """Backbone VGG16 + SSD head: phần nặng nhất của model, được script/compile/export ONNX"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.backbone = model.backbone
+        self.head = model.head
+
+    def forward(self, images: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        features = list(self.backbone(images).values())
+        head_outputs = self.head(features)
+        return head_outputs['cls_logits'], head_outputs['bbox_regression']
+
+
+class InferenceBackend:
+    """Backend inference eager, dùng chung cho /predict và YouTubeVideoProcessor
+
+    Gọi backend(images) giống model(images): images [N, 3, H, W] trong khoảng [0, 1],
+    trả về list dict {'boxes', 'scores', 'labels'} theo tọa độ của ảnh input.
+    Normalize, anchors và postprocess (decode box + NMS) luôn chạy bằng torch,
+    các backend con chỉ thay phần backbone + head.
+    backend(images, settings): DetectionSettings cho cả batch hoặc list theo từng ảnh
+    (mặc định detection_settings của deployment).
+    """
+    name = 'eager'
+
+    def __init__(self, model, device):
+        self.model = model
+        self.device = device
+        self.image_mean = torch.tensor(model.transform.image_mean, device=device).view(1, 3, 1, 1)
+        self.image_std = torch.tensor(model.transform.image_std, device=device).view(1, 3, 1, 1)
+        self.feature_head = SSDFeatureHead(model).eval()
+        self.detection_settings = DetectionSettings()
+        self._anchors = None
+
+    def __call__(self, images: torch.Tensor,
+                 settings: Union[DetectionSettings, Sequence[DetectionSettings], None] = None) -> List[Dict[str, torch.Tensor]]:
+        with torch.no_grad():
+            images = images.to(self.device)
+            original_size = tuple(images.shape[-2:])
+            if original_size != INPUT_SIZE:
+                images = F.interpolate(images, size=INPUT_SIZE, mode='bilinear', align_corners=False)
+            normalized = (images - self.image_mean) / self.image_std
+            cls_logits, bbox_regression = self.head_outputs(normalized)
+            detections = self.postprocess(cls_logits, bbox_regression, settings)
+            if original_size != INPUT_SIZE:
+                detections = self._rescale(detections, original_size)
+            return detections
+
+    def head_outputs(self, normalized: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        return self.feature_head(normalized)
+
+    def anchors(self) -> torch.Tensor:
+        """Default boxes của SSD300 (cố định vì input luôn 300x300), tính 1 lần"""
+        if self._anchors is None:
+            with torch.no_grad():
+                dummy = torch.zeros(1, 3, *INPUT_SIZE, device=self.device)
+                features = list(self.model.backbone(dummy).values())
+                self._anchors = self.model.anchor_generator(ImageList(dummy, [INPUT_SIZE]), features)[0]
+        return self._anchors
+
+    def settings(self, score_thresh: Optional[float] = None, nms_thresh: Optional[float] = None,
+                 topk_candidates: Optional[int] = None, detections_per_img: Optional[int] = None) -> DetectionSettings:
+        """detection_settings của deployment với các giá trị request ghi đè (None = giữ mặc định)"""
+        return self.detection_settings.replace(score_thresh, nms_thresh, topk_candidates, detections_per_img)
+
+    def postprocess(self, cls_logits: torch.Tensor, bbox_regression: torch.Tensor,
+                    settings: Union[DetectionSettings, Sequence[DetectionSettings], None] = None) -> List[Dict[str, torch.Tensor]]:
+        """Thay postprocess_detections của torchvision: bỏ anchor dưới ngưỡng score trước khi decode box
+
+        torchvision decode + clip toàn bộ 8732 anchor rồi mới lọc theo score_thresh (0.01) của model;
+        ở đây chỉ các anchor vượt ngưỡng của request mới được top-k, decode và đưa vào NMS.
+        """
+        if settings is None:
+            settings = self.detection_settings
+        if isinstance(settings, DetectionSettings):
+            settings = [settings] * cls_logits.shape[0]
+        anchors = self.anchors()
+        # Bỏ cột background: scores [N, anchors, classes - 1]
+        class_scores = F.softmax(cls_logits, dim=-1)[..., 1:]
+        results = []
+        for scores, regression, image_settings in zip(class_scores, bbox_regression, settings):
+            anchor_idx, class_idx = torch.nonzero(scores > image_settings.score_thresh, as_tuple=True)
+            if anchor_idx.numel() == 0:
+                results.append({
+                    'boxes': regression.new_zeros((0, 4)),
+                    'scores': scores.new_zeros((0,)),
+                    'labels': torch.zeros((0,), dtype=torch.int64, device=scores.device),
+                })
+                continue
+            candidate_scores = scores[anchor_idx, class_idx]
+            labels = class_idx + 1
+            keep = self._topk_per_class(candidate_scores, labels, image_settings.topk_candidates)
+            anchor_idx, candidate_scores, labels = anchor_idx[keep], candidate_scores[keep], labels[keep]
+
+            # Mỗi anchor chỉ decode 1 lần kể cả khi vượt ngưỡng ở nhiều class
+            unique_anchors, inverse = torch.unique(anchor_idx, return_inverse=True)
+            boxes = self.model.box_coder.decode_single(regression[unique_anchors], anchors[unique_anchors])
+            boxes = box_ops.clip_boxes_to_image(boxes, INPUT_SIZE)[inverse]
+
+            keep = box_ops.batched_nms(boxes, candidate_scores, labels, image_settings.nms_thresh)
+            keep = keep[:image_settings.detections_per_img]
+            results.append({'boxes': boxes[keep], 'scores': candidate_scores[keep], 'labels': labels[keep]})
+        return results
+
+    @staticmethod
+    def _topk_per_class(scores: torch.Tensor, labels: torch.Tensor, k: int) -> torch.Tensor:
+        """Index của tối đa k candidate score cao nhất mỗi class"""
+        if scores.numel() <= k:
+            return torch.arange(scores.numel(), device=scores.device)
+        keep = []
+        for label in labels.unique():
+            idx = torch.nonzero(labels == label).flatten()
+            if idx.numel() > k:
+                idx = idx[scores[idx].topk(k).indices]
+            keep.append(idx)
+        return torch.cat(keep)
+
+    @staticmethod
+    def _rescale(detections: List[Dict[str, torch.Tensor]], original_size: Tuple[int, int]) -> List[Dict[str, torch.Tensor]]:
+        scale = torch.tensor(
+            [original_size[1] / INPUT_SIZE[1], original_size[0] / INPUT_SIZE[0]] * 2,
+            device=detections[0]['boxes'].device if detections else 'cpu'
+        )
+        for detection in detections:
+            detection['boxes'] = detection['boxes'] * scale
+        return detections
+
+    def describe(self) -> Dict:
+        return {'backend': self.name, 'device': str(self.device)}
+
+
+class TorchScriptBackend(InferenceBackend):
+    """Backbone + head được trace, freeze và tối ưu bằng TorchScript"""
+    name = 'torchscript'
+
+    def __init__(self, model, device):
+        super().__init__(model, device)
+        example = torch.zeros(1, 3, *INPUT_SIZE, device=device)
+        with torch.no_grad():
+            traced = torch.jit.trace(self.feature_head, example)
+            self.feature_head = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+
+class CompileBackend(InferenceBackend):
+    """Backbone + head được biên dịch bằng torch.compile (biên dịch ở lần gọi đầu tiên)"""
+    name = 'compile'
+
+    def __init__(self, model, device):
+        super().__init__(model, device)
+        self.feature_head = torch.compile(self.feature_head, dynamic=True)
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """Backbone + head chạy bằng ONNX Runtime (CPU), tùy chọn quantize int8 phần backbone VGG16"""
+    name = 'onnx'
+
+    def __init__(self, model, device, artifact_dir: Optional[str] = None, fingerprint: str = '',
+                 quantize: bool = False, num_threads: int = 0):
+        super().__init__(model, device)
+        import onnxruntime as ort
+
+        self.quantize = quantize
+        if quantize:
+            self.name = 'onnx-int8'
+        artifact_dir = artifact_dir or tempfile.gettempdir()
+        os.makedirs(artifact_dir, exist_ok=True)
+        suffix = fingerprint[:12] or 'model'
+        onnx_path = os.path.join(artifact_dir, f"ssd300_{suffix}.onnx")
+        if not os.path.exists(onnx_path):
+            self._export(onnx_path)
+        if quantize:
+            int8_path = os.path.join(artifact_dir, f"ssd300_{suffix}.int8.onnx")
+            if not os.path.exists(int8_path):
+                self._quantize_backbone(onnx_path, int8_path)
+            onnx_path = int8_path
+        self.onnx_path = onnx_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+    def _export(self, onnx_path: str):
+        print(f"Exporting SSD300 backbone + head to ONNX: {onnx_path}")
+        example = torch.zeros(1, 3, *INPUT_SIZE)
+        tmp_path = f"{onnx_path}.tmp"
+        torch.onnx.export(
+            self.feature_head.cpu(),
+            example,
+            tmp_path,
+            input_names=['images'],
+            output_names=['cls_logits', 'bbox_regression'],
+            dynamic_axes={'images': {0: 'batch'}, 'cls_logits': {0: 'batch'}, 'bbox_regression': {0: 'batch'}},
+            opset_version=17,
+        )
+        self.feature_head.to(self.device)
+        os.replace(tmp_path, onnx_path)
+
+    @staticmethod
+    def _quantize_backbone(onnx_path: str, int8_path: str):
+        """Dynamic quantization int8 cho các Conv của backbone VGG16, giữ head ở float32"""
+        import onnx
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"Quantizing VGG16 backbone to int8: {int8_path}")
+        graph = onnx.load(onnx_path).graph
+        backbone_convs = [node.name for node in graph.node if node.op_type == 'Conv' and '/backbone/' in node.name]
+        tmp_path = f"{int8_path}.tmp"
+        quantize_dynamic(
+            onnx_path,
+            tmp_path,
+            weight_type=QuantType.QUInt8,
+            op_types_to_quantize=['Conv'],
+            nodes_to_quantize=backbone_convs,
+        )
+        os.replace(tmp_path, int8_path)
+
+    def head_outputs(self, normalized: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        cls_logits, bbox_regression = self.session.run(
+            None, {'images': normalized.detach().cpu().numpy()}
+        )
+        return (
+            torch.from_numpy(cls_logits).to(self.device),
+            torch.from_numpy(bbox_regression).to(self.device),
+        )
+
+    def describe(self) -> Dict:
+        return {**super().describe(), 'onnx_path': self.onnx_path}
+
+
+def create_backend(name: str, model, device, artifact_dir: Optional[str] = None, fingerprint: str = '',
+                   num_threads: int = 0) -> InferenceBackend:
+    """Tạo backend theo tên cấu hình (INFERENCE_BACKEND)
+
+    num_threads: số intra-op thread của session ONNX Runtime (0 = mặc định của ORT: mọi core); TorchScript /
+    compile dùng thread pool của PyTorch (torch.set_num_threads).
+    """
+    if name == 'eager':
+        return InferenceBackend(model, device)
+    if name == 'torchscript':
+        return TorchScriptBackend(model, device)
+    if name == 'compile':
+        return CompileBackend(model, device)
+    if name in ('onnx', 'onnx-int8'):
+        return OnnxRuntimeBackend(model, device, artifact_dir, fingerprint,
+                                  quantize=(name == 'onnx-int8'), num_threads=num_threads)
+    raise ValueError(f"Unknown inference backend '{name}', expected one of {BACKEND_NAMES}")
+
+
+def _match_detections(reference: Dict[str, torch.Tensor], candidate: Dict[str, torch.Tensor],
+                      iou_threshold: float) -> Tuple[int, List[float], List[float]]:
+    """Ghép greedy box cùng class theo IoU, trả về (số box ghép được, IoU, chênh lệch score)"""
+    matched = 0
+    ious: List[float] = []
+    score_diffs: List[float] = []
+    if len(reference['boxes']) == 0 or len(candidate['boxes']) == 0:
+        return matched, ious, score_diffs
+
+    iou_matrix = box_ops.box_iou(reference['boxes'], candidate['boxes'])
+    same_class = reference['labels'][:, None] == candidate['labels'][None, :]
+    iou_matrix = torch.where(same_class, iou_matrix, torch.zeros_like(iou_matrix))
+    used = set()
+    for ref_idx in torch.argsort(reference['scores'], descending=True).tolist():
+        row = iou_matrix[ref_idx].clone()
+        if used:
+            row[list(used)] = 0
+        best_iou, cand_idx = row.max(dim=0)
+        if best_iou.item() >= iou_threshold:
+            used.add(cand_idx.item())
+            matched += 1
+            ious.append(best_iou.item())
+            score_diffs.append(abs(reference['scores'][ref_idx].item() - candidate['scores'][cand_idx].item()))
+    return matched, ious, score_diffs
+
+
+def check_parity(model, backend: InferenceBackend, images: torch.Tensor, score_threshold: float = 0.5,
+                 iou_threshold: float = 0.5, min_match_rate: float = 0.95, max_score_diff: float = 0.05) -> Dict:
+    """So sánh output của backend với model eager trên cùng batch ảnh (độ chính xác + latency)"""
+    with torch.no_grad():
+        started = time.perf_counter()
+        reference = model(images.to(backend.device))
+        eager_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        candidate = backend(images, backend.settings(score_thresh=score_threshold))
+        backend_ms = (time.perf_counter() - started) * 1000
+
+    def keep(detection):
+        mask = detection['scores'] > score_threshold
+        return {key: value[mask].cpu() for key, value in detection.items()}
+
+    reference_boxes = candidate_boxes = matched = 0
+    ious: List[float] = []
+    score_diffs: List[float] = []
+    for ref, cand in zip(reference, candidate):
+        ref, cand = keep(ref), keep(cand)
+        reference_boxes += len(ref['boxes'])
+        candidate_boxes += len(cand['boxes'])
+        image_matched, image_ious, image_diffs = _match_detections(ref, cand, iou_threshold)
+        matched += image_matched
+        ious.extend(image_ious)
+        score_diffs.extend(image_diffs)
+
+    match_rate = matched / reference_boxes if reference_boxes else 1.0
+    max_diff = max(score_diffs) if score_diffs else 0.0
+    return {
+        'backend': backend.name,
+        'images': int(images.shape[0]),
+        'reference_detections': reference_boxes,
+        'backend_detections': candidate_boxes,
+        'matched_detections': matched,
+        'match_rate': match_rate,
+        'mean_iou': sum(ious) / len(ious) if ious else 1.0,
+        'mean_score_diff': sum(score_diffs) / len(score_diffs) if score_diffs else 0.0,
+        'max_score_diff': max_diff,
+        'eager_ms': eager_ms,
+        'backend_ms': backend_ms,
+        'passed': match_rate >= min_match_rate and max_diff <= max_score_diff,
+    }
+
+
+if __name__ == "__main__":
+    # Kiểm tra độ chính xác của backend so với eager trên ảnh mẫu:
+    #   python inference_backend.py --backend onnx-int8 sample1.jpg sample2.jpg
+    import argparse
+    import json
+
+    from PIL import Image
+
+    from model_loader import create_blood_cell_model, find_model_path, load_state_dict_file, preprocess_image
+    from result_cache import file_fingerprint
+
+    parser = argparse.ArgumentParser(description="Accuracy parity check of an inference backend against eager PyTorch")
+    parser.add_argument("images", nargs="+", help="Ảnh mẫu (jpg/png)")
+    parser.add_argument("--backend", default="onnx", choices=BACKEND_NAMES)
+    parser.add_argument("--artifact-dir", default=None)
+    parser.add_argument("--score-threshold", type=float, default=0.5)
+    parser.add_argument("--min-match-rate", type=float, default=0.95)
+    parser.add_argument("--max-score-diff", type=float, default=0.05)
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model_path = find_model_path()
+    if model_path is None:
+        raise SystemExit("SSD_custom.pth not found (set MODEL_PATH)")
+    eager_model = create_blood_cell_model(num_classes=4)
+    eager_model.load_state_dict(load_state_dict_file(model_path), strict=True)
+    eager_model.to(device).eval()
+
+    candidate_backend = create_backend(args.backend, eager_model, device, args.artifact_dir, file_fingerprint(model_path),
+                                       num_threads=torch.get_num_threads())
+    batch = torch.cat([preprocess_image(Image.open(path).convert('RGB'), device) for path in args.images], dim=0)
+    # Chạy 1 lần để warm-up (torch.compile / ORT) trước khi đo
+    candidate_backend(batch[:1])
+    report = check_parity(eager_model, candidate_backend, batch, args.score_threshold,
+                          min_match_rate=args.min_match_rate, max_score_diff=args.max_score_diff)
+    print(json.dumps(report, indent=2))
+    raise SystemExit(0 if report['passed'] else 1)
@@ -0,0 +1,172 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import torch
+
+from metrics import SCHEDULER_BATCH_SIZE, record_stage
+from postprocessing import DetectionSettings
+
+
+class _PendingRequest:
+    """Một request /predict đang chờ được gom vào batch"""
+    __slots__ = ('image_tensor', 'settings', 'future', 'enqueued_at')
+
+    def __init__(self, image_tensor: torch.Tensor, settings: DetectionSettings):
+        self.image_tensor = image_tensor
+        self.settings = settings
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class InferenceScheduler:
+    """Gom các request đồng thời thành batch 300x300 và chạy 1 forward pass duy nhất"""
+
+    def __init__(self, model, device, postprocess_fn: Callable, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.model = model
+        self.device = device
+        self.postprocess_fn = postprocess_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+
+        self._queue = queue.Queue()
+        self._thread = None
+        # Buffer input [max_batch_size, 3, H, W] cấp phát 1 lần, chỉ worker thread ghi vào
+        self._input_buffer = None
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._batches_run = 0
+        self._requests_served = 0
+        self._batch_size_histogram: Dict[int, int] = {}
+        self._total_wait_ms = 0.0
+        self._total_inference_ms = 0.0
+        self._max_queue_depth = 0
+
+    def start(self):
+        """Khởi động worker thread chạy inference"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Dừng worker thread sau khi xử lý hết các request còn trong hàng đợi"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def submit(self, image_tensor: torch.Tensor, confidence_threshold: float = 0.5,
+               settings: Optional[DetectionSettings] = None) -> Future:
+        """Đưa 1 ảnh vào hàng đợi, trả về Future chứa postprocess_fn(prediction, threshold)
+
+        image_tensor: uint8 [3, 300, 300] (chuẩn hóa về [0, 1] trong buffer) hoặc float [1, 3, 300, 300].
+        settings: tham số postprocess riêng của request (mặc định: của backend với score_thresh=confidence_threshold);
+        các request khác settings vẫn chung 1 forward pass, chỉ postprocess tách theo từng ảnh.
+        """
+        if settings is None:
+            settings = self.model.settings(score_thresh=confidence_threshold)
+        request = _PendingRequest(image_tensor, settings)
+        self._queue.put(request)
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return request.future
+
+    async def predict(self, image_tensor: torch.Tensor, confidence_threshold: float = 0.5,
+                      settings: Optional[DetectionSettings] = None):
+        """Phiên bản async của submit() dùng trong FastAPI handler"""
+        return await asyncio.wrap_future(self.submit(image_tensor, confidence_threshold, settings))
+
+    def _collect_batch(self, first: _PendingRequest) -> List[_PendingRequest]:
+        """Gom thêm request cho tới khi đủ max_batch_size hoặc hết max_wait_ms"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Trả sentinel lại để vòng lặp chính dừng sau batch này
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect_batch(first)
+            self._run_batch(batch)
+
+    def _fill_input_buffer(self, batch: List[_PendingRequest]) -> torch.Tensor:
+        """Copy từng ảnh vào buffer có sẵn thay vì torch.cat cấp phát tensor mới mỗi batch"""
+        shape = tuple(batch[0].image_tensor.shape[-3:])
+        if self._input_buffer is None or tuple(self._input_buffer.shape[1:]) != shape:
+            self._input_buffer = torch.empty((self.max_batch_size, *shape), dtype=torch.float32)
+        images = self._input_buffer[:len(batch)]
+        for slot, request in zip(images, batch):
+            slot.copy_(request.image_tensor.reshape(shape))
+            if request.image_tensor.dtype == torch.uint8:
+                slot.div_(255.0)
+        return images
+
+    def _run_batch(self, batch: List[_PendingRequest]):
+        started = time.monotonic()
+        try:
+            images = self._fill_input_buffer(batch).to(self.device)
+            with torch.no_grad():
+                predictions = self.model(images, [request.settings for request in batch])
+        except Exception as e:
+            print(f"Error in batch inference: {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        inference_ms = (time.monotonic() - started) * 1000.0
+        record_stage('scheduler_batch', inference_ms / 1000.0)
+        SCHEDULER_BATCH_SIZE.observe(len(batch))
+
+        for request, prediction in zip(batch, predictions):
+            try:
+                request.future.set_result(self.postprocess_fn(prediction, request.settings.score_thresh))
+            except Exception as e:
+                request.future.set_exception(e)
+
+        with self._stats_lock:
+            self._batches_run += 1
+            self._requests_served += len(batch)
+            self._batch_size_histogram[len(batch)] = self._batch_size_histogram.get(len(batch), 0) + 1
+            self._total_wait_ms += sum((started - request.enqueued_at) * 1000.0 for request in batch)
+            self._total_inference_ms += inference_ms
+
+    def stats(self) -> Dict:
+        """Thống kê hàng đợi và kích thước batch để tinh chỉnh throughput/latency"""
+        with self._stats_lock:
+            batches = self._batches_run
+            served = self._requests_served
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms,
+                'batches_run': batches,
+                'requests_served': served,
+                'average_batch_size': served / batches if batches else 0,
+                'batch_size_histogram': dict(sorted(self._batch_size_histogram.items())),
+                'average_queue_wait_ms': self._total_wait_ms / served if served else 0,
+                'average_inference_ms': self._total_inference_ms / batches if batches else 0,
+            }
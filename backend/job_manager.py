@@ -0,0 +1,184 @@
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+
+class VideoJob:
+    """Trạng thái của 1 job xử lý video chạy nền"""
+
+    def __init__(self, url: str, max_frames: int, batch_size: int, temporal=None, settings=None, image_mode: str = 'url'):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.max_frames = max_frames
+        self.batch_size = batch_size
+        self.temporal = temporal  # TemporalConfig hoặc None
+        self.settings = settings  # DetectionSettings hoặc None (mặc định của backend)
+        self.image_mode = image_mode  # 'url' (link artifact) hoặc 'inline' (data URI) cho ảnh frame
+        self.status = 'queued'  # queued | running | completed | failed | cancelled
+        self.frames_done = 0
+        self.frames_total = max_frames
+        self.frame_results: List[Dict] = []
+        self.summary: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def to_status(self) -> Dict:
+        """Trạng thái + tiến độ (không kèm ảnh frame)"""
+        with self.lock:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'video_url': self.url,
+                'frames_done': self.frames_done,
+                'frames_total': self.frames_total,
+                'progress': self.frames_done / self.frames_total if self.frames_total else 0,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+
+
+class VideoJobManager:
+    """Chạy process_video trên worker pool giới hạn, giữ kết quả trong result_ttl_seconds"""
+
+    def __init__(self, video_processor, max_workers: int = 2, result_ttl_seconds: float = 3600):
+        self.video_processor = video_processor
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="video-job")
+        self._jobs: Dict[str, VideoJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, url: str, max_frames: int, batch_size: int, temporal=None, settings=None,
+               image_mode: str = 'url') -> VideoJob:
+        """Tạo job mới và đưa vào hàng đợi của worker pool"""
+        self.purge_expired()
+        job = VideoJob(url, max_frames, batch_size, temporal, settings, image_mode)
+        with self._lock:
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[VideoJob]:
+        self.purge_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[VideoJob]:
+        """Hủy job: job đang chờ bị bỏ khỏi hàng đợi, job đang chạy dừng ở frame kế tiếp"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        with job.lock:
+            if job.status == 'queued' and job.future is not None and job.future.cancel():
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+        return job
+
+    def results(self, job_id: str, offset: int = 0, limit: Optional[int] = None) -> Optional[Dict]:
+        """Kết quả từng phần (các frame đã xử lý xong) kể cả khi job còn đang chạy"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        # Giá trị âm sẽ cắt list từ cuối: chặn về cửa sổ hợp lệ
+        offset = max(0, offset)
+        with job.lock:
+            end = len(job.frame_results) if limit is None else offset + max(0, limit)
+            return {
+                'job_id': job.id,
+                'status': job.status,
+                'frames_done': job.frames_done,
+                'frames_total': job.frames_total,
+                'offset': offset,
+                'frame_results': job.frame_results[offset:end],
+                'summary': job.summary,
+            }
+
+    def purge_expired(self):
+        """Xóa các job đã kết thúc quá result_ttl_seconds"""
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.is_finished and job.finished_at is not None and now - job.finished_at > self.result_ttl_seconds
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ('queued', 'running', 'completed', 'failed', 'cancelled')}
+
+    def estimated_wait_seconds(self) -> int:
+        """Ước lượng thời gian chờ của job mới: thời lượng job trung bình x số lượt job đang chờ phía trước"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        durations = [job.finished_at - job.started_at for job in jobs
+                     if job.status == 'completed' and job.started_at is not None and job.finished_at is not None]
+        average = sum(durations) / len(durations) if durations else 30.0
+        queued = sum(1 for job in jobs if job.status == 'queued')
+        return max(1, math.ceil(average * (queued // self.max_workers + 1)))
+
+    def shutdown(self):
+        """Hủy mọi job chưa xong và dừng worker pool"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel_event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: VideoJob):
+        with job.lock:
+            if job.cancel_event.is_set():
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                return
+            job.status = 'running'
+            job.started_at = time.time()
+
+        def on_progress(frame_result: Dict, frames_done: int, frames_total: int):
+            with job.lock:
+                job.frame_results.append(frame_result)
+                job.frames_done = frames_done
+                job.frames_total = frames_total
+
+        try:
+            result = self.video_processor.process_video(
+                url=job.url,
+                max_frames=job.max_frames,
+                batch_size=job.batch_size,
+                progress_callback=on_progress,
+                cancel_event=job.cancel_event,
+                temporal=job.temporal,
+                settings=job.settings,
+                image_mode=job.image_mode,
+            )
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        with job.lock:
+            job.finished_at = time.time()
+            if result.get('cancelled'):
+                job.status = 'cancelled'
+            elif result['success']:
+                job.status = 'completed'
+                job.frames_total = job.frames_done
+                job.summary = {key: value for key, value in result.items() if key != 'frame_results'}
+            else:
+                job.status = 'failed'
+                job.error = result['error']
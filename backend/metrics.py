@@ -0,0 +1,234 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Bucket (giây) cho latency: từ vài ms (postprocess) tới vài phút (download + xử lý video)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Thời gian từng bước của request hiện tại (cho header Server-Timing), None nếu ngoài request
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                                for key, value in items]
+
+
+class Gauge(_Metric):
+    """Gauge set trực tiếp hoặc đọc từ callback lúc scrape (vd. số job đang chạy)"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                self.set(self.callback())
+            except Exception as e:
+                print(f"Error reading gauge {self.name}: {e}")
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                                for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = self.header()
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+    """Registry tối giản xuất Prometheus text format (không cần prometheus_client)"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    'blood_cell_stage_duration_seconds', 'Thời gian từng bước xử lý (decode, inference, draw, encode, download...)',
+    ['stage']))
+REQUEST_SECONDS = registry.register(Histogram(
+    'blood_cell_http_request_duration_seconds', 'Latency HTTP theo endpoint', ['method', 'endpoint']))
+REQUESTS_TOTAL = registry.register(Counter(
+    'blood_cell_http_requests_total', 'Số request HTTP theo endpoint và status', ['method', 'endpoint', 'status']))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    'blood_cell_http_requests_in_flight', 'Số request HTTP đang xử lý'))
+DETECTIONS_TOTAL = registry.register(Counter(
+    'blood_cell_detections_total', 'Số tế bào phát hiện được theo class', ['class_name', 'source']))
+FRAMES_PROCESSED_TOTAL = registry.register(Counter(
+    'blood_cell_video_frames_processed_total', 'Số frame video đã chạy detection', ['pipeline']))
+ADMISSION_REJECTED_TOTAL = registry.register(Counter(
+    'blood_cell_admission_rejected_total', 'Số request bị từ chối vì quá tải theo nhóm endpoint', ['group', 'status']))
+EXECUTOR_TASKS = registry.register(Gauge(
+    'blood_cell_executor_tasks', 'Số task đang chờ/đang chạy trong executor (io, compute)', ['pool', 'state']))
+EXECUTOR_QUEUE_SECONDS = registry.register(Histogram(
+    'blood_cell_executor_queue_seconds', 'Thời gian task chờ thread trống trong executor', ['pool']))
+SCHEDULER_BATCH_SIZE = registry.register(Histogram(
+    'blood_cell_scheduler_batch_size', 'Số ảnh trong mỗi batch inference của scheduler',
+    buckets=(1, 2, 4, 8, 16, 32, 64)))
+# callback được gán khi khởi động (đọc từ VideoJobManager)
+VIDEO_JOBS_IN_FLIGHT = registry.register(Gauge(
+    'blood_cell_video_jobs_in_flight', 'Số job video đang chờ hoặc đang chạy'))
+
+
+@contextmanager
+def span(stage: str):
+    """Đo thời gian 1 bước: ghi vào histogram và vào breakdown của request hiện tại (nếu có)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def timed_iter(iterable: Iterable, stage: str) -> Iterator:
+    """Bọc generator, tính thời gian chờ mỗi phần tử (vd. đọc/decode frame) vào stage"""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            record_stage(stage, time.perf_counter() - started)
+            return
+        record_stage(stage, time.perf_counter() - started)
+        yield item
+
+
+def count_detections(class_counts: Dict[str, int], source: str):
+    for class_name, count in class_counts.items():
+        if count:
+            DETECTIONS_TOTAL.inc(count, class_name=class_name, source=source)
+
+
+def start_request_timings() -> contextvars.Token:
+    return _request_timings.set({})
+
+
+def finish_request_timings(token: contextvars.Token) -> Dict[str, float]:
+    timings = _request_timings.get() or {}
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, float], total_seconds: float) -> str:
+    """Header Server-Timing (hiển thị trong tab Network của DevTools), đơn vị ms"""
+    entries = [f'{stage.replace(" ", "_")};dur={seconds * 1000:.1f}' for stage, seconds in timings.items()]
+    entries.append(f'total;dur={total_seconds * 1000:.1f}')
+    return ', '.join(entries)
@@ -0,0 +1,56 @@
+import os
+from typing import Optional
+
+import numpy as np
+import torch
+import torchvision
+from PIL import Image
+
+from preprocessing import write_input
+
+# Dùng chung cho server (app.py) và các công cụ offline (batch_cli.py, parity check của inference_backend.py):
+# module này không có side effect khi import (không tạo thư mục cache, pool, FastAPI app)
+MODEL_LOAD_MMAP = os.getenv("MODEL_LOAD_MMAP", "1") == "1"
+
+
+def create_blood_cell_model(num_classes=4):
+    """Tạo mô hình SSD với architecture tương thích với trained model
+
+    Không tải weights COCO/ImageNet: mọi tham số đều bị ghi đè bởi SSD_custom.pth,
+    nên chỉ cần dựng architecture (khởi động nhanh, chạy được trên máy không có mạng).
+    """
+    # SSD300 VGG16 với classification head 4 classes (bg + 3 loại tế bào)
+    # và regression head tương ứng: in_channels [512, 1024, 512, 256, 256, 256], anchors [4, 6, 6, 6, 4, 4]
+    return torchvision.models.detection.ssd300_vgg16(
+        weights=None,
+        weights_backbone=None,
+        num_classes=num_classes
+    )
+
+
+def find_model_path() -> Optional[str]:
+    """Tìm file SSD_custom.pth (MODEL_PATH, thư mục gốc repo hoặc thư mục backend/Docker)"""
+    candidates = [os.getenv("MODEL_PATH"), "../SSD_custom.pth", "SSD_custom.pth"]
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def load_state_dict_file(path: str, mmap: bool = MODEL_LOAD_MMAP):
+    """Load state dict, ưu tiên memory-map để không copy toàn bộ file vào RAM"""
+    if mmap:
+        try:
+            return torch.load(path, map_location="cpu", weights_only=False, mmap=True)
+        except Exception as e:
+            # Checkpoint định dạng cũ (không phải zip) không mmap được
+            print(f"mmap load failed ({e}), falling back to regular load")
+    return torch.load(path, map_location="cpu", weights_only=False)
+
+
+def preprocess_image(image: Image.Image, device=None):
+    """Tiền xử lý ảnh đầu vào cho blood cell detection"""
+    # Resize theo kích thước mà model được train (SSD300), ghi thẳng vào tensor [1, 3, 300, 300]
+    image_tensor = torch.empty((1, 3, 300, 300), dtype=torch.float32)
+    write_input(np.asarray(image.convert('RGB').resize((300, 300))), image_tensor[0])
+    return image_tensor if device is None else image_tensor.to(device)
@@ -0,0 +1,136 @@
+import base64
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Màu cho các loại tế bào (RGB)
+CLASS_COLORS = {
+    'Platelets': (255, 215, 0),   # Gold
+    'RBC': (255, 107, 107),       # Red
+    'WBC': (78, 205, 196),        # Teal
+}
+DEFAULT_COLOR = (136, 136, 136)
+
+# macOS, Windows, Linux (Debian/Ubuntu có DejaVu khi cài fonts-dejavu)
+FONT_CANDIDATES = (
+    "/System/Library/Fonts/Arial.ttf",
+    "arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
+
+@lru_cache(maxsize=8)
+def load_font(size: int = 16):
+    """Load font 1 lần cho mỗi size (trước đây load lại ở mỗi lần vẽ)"""
+    for path in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+class OverlayRenderer:
+    """Vẽ bounding box trực tiếp lên frame numpy (RGB) và encode JPEG 1 lần ở kích thước đích
+
+    Label (nền màu + chữ trắng) được render bằng PIL 1 lần rồi cache dưới dạng mảng numpy,
+    các lần sau chỉ copy vào frame.
+    """
+
+    def __init__(self, font_size: int = 16, box_thickness: int = 3, max_cached_labels: int = 4096):
+        self.font = load_font(font_size)
+        self.box_thickness = box_thickness
+        self.max_cached_labels = max_cached_labels
+        self._labels: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._frames = 0
+        self._draw_seconds = 0.0
+
+    def label_sprite(self, text: str, color: Tuple[int, int, int]) -> np.ndarray:
+        key = (text, color)
+        with self._lock:
+            sprite = self._labels.get(key)
+            if sprite is not None:
+                self._labels.move_to_end(key)
+                return sprite
+
+        left, top, right, bottom = self.font.getbbox(text)
+        width, height = right - left + 8, bottom - top + 4
+        image = Image.new('RGB', (width, height), color)
+        ImageDraw.Draw(image).text((4 - left, 2 - top), text, fill=(255, 255, 255), font=self.font)
+        sprite = np.asarray(image)
+
+        with self._lock:
+            self._labels[key] = sprite
+            while len(self._labels) > self.max_cached_labels:
+                self._labels.popitem(last=False)
+        return sprite
+
+    def draw(self, frame: np.ndarray, boxes: np.ndarray, scores: Sequence[float], names: Sequence[str],
+             scale: float = 1.0) -> np.ndarray:
+        """Vẽ box + label lên frame (sửa trực tiếp, không copy); scale: tỉ lệ frame so với tọa độ box"""
+        started = time.perf_counter()
+        height, width = frame.shape[:2]
+        for box, score, name in zip(np.asarray(boxes, dtype=np.float64) * scale, scores, names):
+            x1, y1, x2, y2 = (int(round(value)) for value in box)
+            color = CLASS_COLORS.get(name, DEFAULT_COLOR)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, self.box_thickness)
+
+            # Label phía trên box (HIỂN THỊ PHẦN TRĂM), cắt phần nằm ngoài frame
+            sprite = self.label_sprite(f"{name}: {score * 100:.1f}%", color)
+            top, left = y1 - sprite.shape[0], x1
+            y_start, x_start = max(0, top), max(0, left)
+            y_end, x_end = min(height, top + sprite.shape[0]), min(width, left + sprite.shape[1])
+            if y_end > y_start and x_end > x_start:
+                frame[y_start:y_end, x_start:x_end] = sprite[y_start - top:y_end - top, x_start - left:x_end - left]
+
+        with self._lock:
+            self._frames += 1
+            self._draw_seconds += time.perf_counter() - started
+        return frame
+
+    def draw_detections(self, frame: np.ndarray, detections: List[Dict], scale: float = 1.0) -> np.ndarray:
+        """Vẽ detections dạng list dict ('bbox', 'confidence', 'class_name')"""
+        if not detections:
+            return self.draw(frame, np.zeros((0, 4)), [], [], scale)
+        return self.draw(
+            frame,
+            np.array([detection['bbox'] for detection in detections], dtype=np.float64),
+            [detection['confidence'] for detection in detections],
+            [detection['class_name'] for detection in detections],
+            scale,
+        )
+
+    @staticmethod
+    def fit(frame: np.ndarray, max_size: Optional[int]) -> Tuple[np.ndarray, float]:
+        """Thu nhỏ frame để cạnh dài <= max_size (1 lần resize INTER_AREA), trả về (frame, tỉ lệ)"""
+        height, width = frame.shape[:2]
+        if not max_size or max(height, width) <= max_size:
+            return frame, 1.0
+        scale = max_size / max(height, width)
+        return cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA), scale
+
+    @staticmethod
+    def encode_jpeg(frame: np.ndarray, quality: int = 85) -> bytes:
+        ok, encoded = cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("Không encode được JPEG")
+        return encoded.tobytes()
+
+    def data_uri(self, frame: np.ndarray, quality: int = 85) -> str:
+        return f"data:image/jpeg;base64,{base64.b64encode(self.encode_jpeg(frame, quality)).decode('utf-8')}"
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'frames_drawn': self._frames,
+                'draw_seconds': self._draw_seconds,
+                'draw_fps': self._frames / self._draw_seconds if self._draw_seconds > 0 else 0,
+                'cached_labels': len(self._labels),
+            }
@@ -0,0 +1,119 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Định dạng response: list dict từng box (mặc định, tương thích ngược) hoặc các mảng song song
+RESPONSE_FORMATS = ('objects', 'columnar')
+
+
+class DetectionSettings:
+    """Tham số postprocess của SSD head, áp dụng trong bước postprocess của model (trước decode box + NMS)
+
+    score_thresh: bỏ anchor có score <= ngưỡng trước khi decode box; nms_thresh: IoU của NMS theo class;
+    topk_candidates: số anchor tối đa mỗi class đưa vào NMS; detections_per_img: số box tối đa mỗi ảnh.
+    """
+
+    def __init__(self, score_thresh: float = 0.5, nms_thresh: float = 0.45, topk_candidates: int = 400,
+                 detections_per_img: int = 200):
+        if not 0.0 <= score_thresh < 1.0:
+            raise ValueError("score_thresh phải nằm trong [0, 1)")
+        if not 0.0 < nms_thresh <= 1.0:
+            raise ValueError("nms_thresh phải nằm trong (0, 1]")
+        if topk_candidates < 1 or detections_per_img < 1:
+            raise ValueError("topk_candidates và detections_per_img phải >= 1")
+        self.score_thresh = float(score_thresh)
+        self.nms_thresh = float(nms_thresh)
+        self.topk_candidates = int(topk_candidates)
+        self.detections_per_img = int(detections_per_img)
+
+    def replace(self, score_thresh: Optional[float] = None, nms_thresh: Optional[float] = None,
+                topk_candidates: Optional[int] = None, detections_per_img: Optional[int] = None) -> 'DetectionSettings':
+        """Bản sao với các giá trị được ghi đè (None = giữ nguyên)"""
+        return DetectionSettings(
+            self.score_thresh if score_thresh is None else score_thresh,
+            self.nms_thresh if nms_thresh is None else nms_thresh,
+            self.topk_candidates if topk_candidates is None else topk_candidates,
+            self.detections_per_img if detections_per_img is None else detections_per_img,
+        )
+
+    def cache_variant(self) -> str:
+        return f"det:{self.score_thresh:.4f}:{self.nms_thresh:.4f}:{self.topk_candidates}:{self.detections_per_img}"
+
+    def describe(self) -> Dict:
+        return {
+            'score_thresh': self.score_thresh,
+            'nms_thresh': self.nms_thresh,
+            'topk_candidates': self.topk_candidates,
+            'detections_per_img': self.detections_per_img,
+        }
+
+
+def filter_detections(prediction: Dict, confidence_threshold: float = 0.5,
+                      scale: Tuple[float, float] = (1.0, 1.0)) -> Dict[str, np.ndarray]:
+    """Lọc theo confidence và scale box trên toàn bộ mảng (không loop từng box)
+
+    Trả về {'boxes': float32 [N, 4], 'scores': float32 [N], 'labels': int64 [N]}.
+    """
+    boxes = prediction['boxes'].detach().cpu().numpy()
+    scores = prediction['scores'].detach().cpu().numpy()
+    labels = prediction['labels'].detach().cpu().numpy()
+
+    # Lọc các detection có confidence cao
+    mask = scores > confidence_threshold
+    boxes = boxes[mask]
+    if scale != (1.0, 1.0):
+        boxes = boxes * np.array([scale[0], scale[1], scale[0], scale[1]])
+
+    return {'boxes': boxes, 'scores': scores[mask], 'labels': labels[mask].astype(np.int64)}
+
+
+def empty_detections() -> Dict[str, np.ndarray]:
+    return {
+        'boxes': np.zeros((0, 4), dtype=np.float32),
+        'scores': np.zeros((0,), dtype=np.float32),
+        'labels': np.zeros((0,), dtype=np.int64),
+    }
+
+
+def label_names(labels: np.ndarray, class_names: Sequence[str]) -> np.ndarray:
+    """Tên class cho từng label, 'unknown' nếu label ngoài danh sách"""
+    names = np.array(list(class_names) + ['unknown'], dtype=object)
+    return names[np.where((labels >= 0) & (labels < len(class_names)), labels, len(class_names))]
+
+
+def class_counts(labels: np.ndarray, class_names: Sequence[str]) -> Dict[str, int]:
+    """Đếm số detection theo class (bỏ background)"""
+    counts = np.bincount(labels[(labels >= 0) & (labels < len(class_names))], minlength=len(class_names))
+    return {name: int(count) for name, count in zip(class_names[1:], counts[1:])}
+
+
+def to_detection_dicts(detections: Dict[str, np.ndarray], class_names: Sequence[str]) -> List[Dict]:
+    """Định dạng cũ: list {'bbox', 'confidence', 'class_id', 'class_name'}"""
+    boxes = detections['boxes'].tolist()
+    scores = detections['scores'].tolist()
+    labels = detections['labels'].tolist()
+    names = label_names(detections['labels'], class_names).tolist()
+    return [
+        {'bbox': box, 'confidence': score, 'class_id': label, 'class_name': name}
+        for box, score, label, name in zip(boxes, scores, labels, names)
+    ]
+
+
+def to_columnar(detections: Dict[str, np.ndarray], class_names: Sequence[str]) -> Dict:
+    """Định dạng gọn: các mảng song song boxes/scores/labels + bảng tên class"""
+    return {
+        'boxes': detections['boxes'].tolist(),
+        'scores': detections['scores'].tolist(),
+        'labels': detections['labels'].tolist(),
+        'class_names': list(class_names),
+    }
+
+
+def format_detections(detections: Dict[str, np.ndarray], class_names: Sequence[str], response_format: str = 'objects'):
+    if response_format == 'columnar':
+        return to_columnar(detections, class_names)
+    return to_detection_dicts(detections, class_names)
+
+
+def detection_count(detections: Dict[str, np.ndarray]) -> int:
+    return int(len(detections['scores']))
@@ -0,0 +1,61 @@
+import io
+import threading
+from typing import Tuple
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+# Kích thước input của SSD300 (width, height)
+INPUT_SIZE = (300, 300)
+
+
+def decode_image(contents: bytes, target_size: Tuple[int, int] = INPUT_SIZE) -> Tuple[Image.Image, Tuple[int, int]]:
+    """Decode ảnh upload và resize về target_size, trả về (ảnh RGB đã resize, kích thước gốc)
+
+    Với JPEG, draft() cho libjpeg decode thẳng ở tỉ lệ 1/2, 1/4 hoặc 1/8 (DCT scaling)
+    miễn là vẫn >= target_size, nên ảnh hiển vi 4000x3000 không phải decode full-res.
+    """
+    image = Image.open(io.BytesIO(contents))
+    original_size = image.size
+    if image.format == 'JPEG':
+        image.draft('RGB', target_size)
+    image = image.convert('RGB')
+    if image.size != target_size:
+        image = image.resize(target_size)
+    return image, original_size
+
+
+def resize_frame(frame: np.ndarray, target_size: Tuple[int, int] = INPUT_SIZE) -> np.ndarray:
+    """Resize frame RGB (numpy) bằng OpenCV, không qua PIL"""
+    if (frame.shape[1], frame.shape[0]) == target_size:
+        return frame
+    return cv2.resize(frame, target_size, interpolation=cv2.INTER_AREA)
+
+
+def to_uint8_tensor(image: Image.Image) -> torch.Tensor:
+    """Ảnh PIL RGB -> tensor uint8 [3, H, W] (việc chuẩn hóa [0, 1] để cho buffer của batch)"""
+    return torch.from_numpy(np.array(image, dtype=np.uint8)).permute(2, 0, 1)
+
+
+def write_input(pixels: np.ndarray, out: torch.Tensor) -> torch.Tensor:
+    """Ghi ảnh uint8 HWC vào tensor float CHW [0, 1] có sẵn (không cấp phát tensor mới)"""
+    out.copy_(torch.from_numpy(np.ascontiguousarray(pixels)).permute(2, 0, 1))
+    return out.div_(255.0)
+
+
+class InputBuffers:
+    """Tensor input [N, 3, 300, 300] cấp phát sẵn và tái sử dụng, mỗi thread 1 buffer riêng"""
+
+    def __init__(self, target_size: Tuple[int, int] = INPUT_SIZE):
+        self.target_size = target_size
+        self._local = threading.local()
+
+    def get(self, batch_size: int) -> torch.Tensor:
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape[0] < batch_size:
+            width, height = self.target_size
+            buffer = torch.empty((batch_size, 3, height, width), dtype=torch.float32)
+            self._local.buffer = buffer
+        return buffer[:batch_size]
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+YOUTUBE_ID_PATTERN = re.compile(r'[a-zA-Z0-9_-]{6,}')
+# Các dạng URL YouTube: watch?v=ID, youtu.be/ID, shorts/ID, embed/ID, live/ID
+YOUTUBE_PATH_PREFIXES = ('shorts', 'embed', 'live', 'v')
+
+
+def file_fingerprint(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 của file weights, dùng để vô hiệu hóa cache khi đổi model"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def youtube_video_id(url: str) -> str:
+    """Lấy video id từ URL YouTube (không cần gọi mạng), fallback về chính URL
+
+    Chỉ đọc đúng query parameter v (không khớp nhầm dev=, xv=...) hoặc đoạn path sau youtu.be/, shorts/, embed/.
+    """
+    url = url.strip()
+    parsed = urlparse(url if '://' in url else f"https://{url}")
+    host = (parsed.hostname or '').lower()
+    parts = [part for part in parsed.path.split('/') if part]
+    candidate = None
+    if host == 'youtu.be':
+        candidate = parts[0] if parts else None
+    elif host == 'youtube.com' or host.endswith('.youtube.com') or host.endswith('youtube-nocookie.com'):
+        values = parse_qs(parsed.query).get('v')
+        if values:
+            candidate = values[0]
+        elif len(parts) >= 2 and parts[0] in YOUTUBE_PATH_PREFIXES:
+            candidate = parts[1]
+    if candidate and YOUTUBE_ID_PATTERN.fullmatch(candidate):
+        return candidate
+    return url
+
+
+class DetectionCache:
+    """Cache kết quả detection theo nội dung (hash ảnh / video id) với 2 tầng: RAM (LRU + TTL) và disk (tùy chọn)
+
+    Giá trị được lưu dưới dạng JSON bytes để trả thẳng về response mà không serialize lại.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: float = 3600,
+                 disk_dir: Optional[str] = None, max_disk_bytes: int = 1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds  # <= 0: không hết hạn, chỉ evict theo LRU
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.model_fingerprint = ''
+        # False khi weights không cố định (random weights): mỗi worker có fingerprint riêng, không dùng disk
+        self.persistent = True
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def set_model_fingerprint(self, fingerprint: str, persistent: bool = True):
+        """Đổi model weights: xóa entry trong RAM và các file trên disk của weights cũ
+
+        persistent=False (random weights, fingerprint khác nhau giữa các worker của serve.py): bỏ qua tầng disk,
+        không xóa entry của worker khác hay của weights thật.
+        """
+        if fingerprint == self.model_fingerprint and persistent == self.persistent:
+            return
+        self.model_fingerprint = fingerprint
+        self.persistent = persistent
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        # Entry trên disk của cùng weights vẫn dùng lại được sau khi restart
+        if persistent:
+            self._disk_remove(lambda name: not name.startswith(self._disk_prefix()))
+
+    def image_key(self, image_bytes: bytes, confidence_threshold: float, variant: str = '') -> str:
+        return self._make_key('image', hashlib.sha256(image_bytes).hexdigest(), confidence_threshold, variant)
+
+    def video_key(self, url: str, max_frames: int, confidence_threshold: float, variant: str = '') -> str:
+        return self._make_key('video', f"{youtube_video_id(url)}:{max_frames}", confidence_threshold, variant)
+
+    def _make_key(self, kind: str, content_id: str, confidence_threshold: float, variant: str) -> str:
+        raw = f"{kind}|{content_id}|{confidence_threshold:.4f}|{variant}|{self.model_fingerprint}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Trả về JSON bytes đã cache hoặc None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if self._expired(created_at, now):
+                    self._remove(key)
+                    self._counters['expirations'] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return value
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['disk_hits'] += 1
+            self._store(key, value, now)
+        return value
+
+    def set(self, key: str, value: Dict) -> bytes:
+        """Serialize value thành JSON bytes, lưu vào cache và trả về bytes đó"""
+        encoded = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        now = time.time()
+        with self._lock:
+            self._store(key, encoded, now)
+        self._disk_set(key, encoded)
+        return encoded
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        self._disk_remove(lambda name: True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = counters['hits'] + counters['disk_hits'] + counters['misses']
+            return {
+                **counters,
+                'hit_rate': (counters['hits'] + counters['disk_hits']) / lookups if lookups else 0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'disk_enabled': self._disk_enabled(),
+                'model_fingerprint': self.model_fingerprint[:12],
+            }
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def _store(self, key: str, value: bytes, created_at: float):
+        # Entry lớn hơn toàn bộ giới hạn RAM thì chỉ giữ ở disk
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (created_at, value)
+        self._bytes += len(value)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self._counters['evictions'] += 1
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def _disk_enabled(self) -> bool:
+        return bool(self.disk_dir) and self.persistent
+
+    def _disk_prefix(self) -> str:
+        return f"{self.model_fingerprint[:12]}_"
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{self._disk_prefix()}{key}.json")
+
+    def _disk_remove(self, predicate):
+        if not self.disk_dir:
+            return
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.json') and predicate(name):
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except OSError:
+                    pass
+
+    def _disk_get(self, key: str, now: float) -> Optional[bytes]:
+        if not self._disk_enabled():
+            return None
+        path = self._disk_path(key)
+        try:
+            if self._expired(os.path.getmtime(path), now):
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                value = f.read()
+            # Cập nhật atime để eviction trên disk theo LRU
+            os.utime(path, (now, os.path.getmtime(path)))
+            return value
+        except OSError:
+            return None
+
+    def _disk_set(self, key: str, value: bytes):
+        if not self._disk_enabled():
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+            self._disk_evict()
+        except OSError as e:
+            print(f"Error writing cache entry to disk: {e}")
+
+    def _disk_evict(self):
+        """Xóa các file ít được dùng nhất (theo atime) khi vượt max_disk_bytes"""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_atime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
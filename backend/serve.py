@@ -0,0 +1,163 @@
+"""Chạy nhiều worker uvicorn dùng chung 1 bản weights
+
+Supervisor load SSD_custom.pth 1 lần, đưa tensor vào shared memory rồi fork các worker, nên
+N worker không tốn N bản weights VGG16-SSD. Mỗi worker nhận 1 phần số core (torch.set_num_threads)
+để các intra-op pool không tranh nhau cùng core.
+
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional, Tuple
+
+import torch
+import uvicorn
+
+
+def available_cores() -> int:
+    """Số core process được phép dùng (tính cả giới hạn affinity/cgroup cpuset)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def thread_budget(workers: int, cores: Optional[int] = None) -> Tuple[int, int]:
+    """Chia đều core cho các worker: (intra-op threads, inter-op threads) mỗi worker
+
+    TORCH_NUM_THREADS / TORCH_INTEROP_THREADS ghi đè giá trị tính được.
+    """
+    cores = cores or available_cores()
+    intra = max(1, cores // max(1, workers))
+    # SSD forward gần như tuần tự giữa các op, 1 inter-op thread là đủ
+    interop = 1
+    intra = int(os.getenv("TORCH_NUM_THREADS", intra))
+    interop = int(os.getenv("TORCH_INTEROP_THREADS", interop))
+    return intra, interop
+
+
+def apply_thread_budget(intra: int, interop: int):
+    torch.set_num_threads(intra)
+    try:
+        torch.set_num_interop_threads(interop)
+    except RuntimeError:
+        # Chỉ set được trước khi inter-op pool khởi tạo
+        pass
+
+
+def preload_model():
+    """Load weights ở supervisor, không chạy forward nào trước khi fork
+
+    libgomp không an toàn với fork khi OpenMP pool đã chạy, nên supervisor dùng 1 thread
+    và để warm-up cho từng worker.
+    """
+    import app as app_module
+
+    torch.set_num_threads(1)
+    app_module.load_trained_model(warmup=False)
+    # Weights chỉ đọc: đưa vào shared memory để các worker dùng chung thay vì copy-on-write từng page
+    app_module.model.share_memory()
+    return app_module
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app_module, sock: socket.socket, intra: int, interop: int, log_level: str):
+    """Thân của process worker (sau fork): set thread budget rồi phục vụ trên socket chung"""
+    apply_thread_budget(intra, interop)
+    print(f"Worker {os.getpid()}: torch threads intra={intra} interop={interop}")
+    config = uvicorn.Config(app_module.app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Fork N worker từ process đã load model, tự khởi động lại worker bị chết"""
+
+    def __init__(self, app_module, sock: socket.socket, workers: int, log_level: str = "info"):
+        self.app_module = app_module
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        self.intra, self.interop = thread_budget(workers)
+        self.children: Dict[int, int] = {}  # pid -> slot
+        self.stopping = False
+
+    def spawn(self, slot: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            exit_code = 0
+            try:
+                run_worker(self.app_module, self.sock, self.intra, self.interop, self.log_level)
+            except Exception as e:
+                print(f"Worker {os.getpid()} crashed: {e}")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self.children[pid] = slot
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        print(f"Supervisor {os.getpid()}: {self.workers} workers x {self.intra} threads "
+              f"({available_cores()} cores available)")
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            slot = self.children.pop(pid, None)
+            if slot is not None and not self.stopping:
+                print(f"Worker {pid} exited (status {status}), restarting slot {slot}")
+                time.sleep(1.0)
+                self.spawn(slot)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blood cell detection API với nhiều worker dùng chung weights")
+    parser.add_argument('--host', default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument('--port', type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument('--workers', type=int, default=int(os.getenv("WORKERS", "2")))
+    parser.add_argument('--log-level', default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork') or args.workers <= 1:
+        # Windows (không có fork) hoặc 1 worker: chạy 1 process, dùng toàn bộ core
+        import app as app_module
+        apply_thread_budget(*thread_budget(1))
+        uvicorn.run(app_module.app, host=args.host, port=args.port, log_level=args.log_level)
+        return
+
+    app_module = preload_model()
+    sock = bind_socket(args.host, args.port)
+    Supervisor(app_module, sock, args.workers, args.log_level).run()
+    sock.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
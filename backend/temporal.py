@@ -0,0 +1,133 @@
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Cách tính độ thay đổi giữa 2 frame
+CHANGE_METRICS = ('diff', 'hist')
+
+
+class TemporalConfig:
+    """Cấu hình chế độ temporal: chỉ chạy model trên keyframe, các frame còn lại dùng lại box"""
+
+    def __init__(self, change_threshold: float = 0.02, keyframe_interval: int = 10, optical_flow: bool = False,
+                 metric: str = 'diff'):
+        if metric not in CHANGE_METRICS:
+            raise ValueError(f"metric phải là một trong {list(CHANGE_METRICS)}")
+        self.change_threshold = max(0.0, change_threshold)
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.optical_flow = optical_flow
+        self.metric = metric
+
+    def gate(self) -> 'KeyframeGate':
+        return KeyframeGate(self)
+
+    def cache_variant(self) -> str:
+        return f"temporal:{self.metric}:{self.change_threshold:.4f}:{self.keyframe_interval}:{int(self.optical_flow)}"
+
+    def describe(self) -> Dict:
+        return {
+            'change_threshold': self.change_threshold,
+            'keyframe_interval': self.keyframe_interval,
+            'optical_flow': self.optical_flow,
+            'metric': self.metric,
+        }
+
+
+class KeyframeGate:
+    """Quyết định frame nào cần inference, propagate box của keyframe gần nhất cho các frame còn lại
+
+    Độ thay đổi được so với keyframe (không phải frame liền trước) để thay đổi chậm vẫn được cộng dồn,
+    và box được dịch từ keyframe nên không tích lũy sai số qua nhiều frame.
+    """
+
+    def __init__(self, config: TemporalConfig, thumbnail_size: Tuple[int, int] = (64, 64), flow_width: int = 320):
+        self.config = config
+        self.thumbnail_size = thumbnail_size
+        self.flow_width = flow_width
+        self._key_signature = None
+        self._key_gray = None
+        self._key_detections: Optional[Dict[str, np.ndarray]] = None
+        self._since_keyframe = 0
+        self.inferred = 0
+        self.propagated = 0
+
+    def plan(self, frames: List[np.ndarray]) -> List[Tuple[bool, float]]:
+        """(có inference không, điểm thay đổi so với keyframe) cho từng frame theo thứ tự"""
+        decisions = []
+        for frame in frames:
+            signature = self._signature(frame)
+            if self._key_signature is None:
+                infer, score = True, 1.0
+            else:
+                score = self._change_score(self._key_signature, signature)
+                infer = score > self.config.change_threshold or self._since_keyframe + 1 >= self.config.keyframe_interval
+            if infer:
+                self._key_signature = signature
+                self._since_keyframe = 0
+                self.inferred += 1
+            else:
+                self._since_keyframe += 1
+                self.propagated += 1
+            decisions.append((infer, round(float(score), 5)))
+        return decisions
+
+    def set_keyframe(self, frame: np.ndarray, detections: Dict[str, np.ndarray]):
+        """Lưu kết quả detection của keyframe (gọi theo đúng thứ tự frame)"""
+        self._key_detections = detections
+        self._key_gray = self._flow_gray(frame) if self.config.optical_flow else None
+
+    def propagate(self, frame: np.ndarray) -> Dict[str, np.ndarray]:
+        """Box của keyframe cho frame bị bỏ qua, dịch theo optical flow nếu bật"""
+        detections = self._key_detections
+        boxes = detections['boxes']
+        if self.config.optical_flow and self._key_gray is not None and len(boxes):
+            boxes = self._shift_boxes(boxes, frame)
+        return {'boxes': boxes, 'scores': detections['scores'], 'labels': detections['labels']}
+
+    def stats(self) -> Dict:
+        total = self.inferred + self.propagated
+        return {
+            **self.config.describe(),
+            'inferred_frames': self.inferred,
+            'propagated_frames': self.propagated,
+            'inference_ratio': self.inferred / total if total else 0,
+        }
+
+    def _signature(self, frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        if self.config.metric == 'hist':
+            hist = cv2.calcHist([gray], [0], None, [32], [0, 256])
+            return cv2.normalize(hist, hist).flatten()
+        return cv2.resize(gray, self.thumbnail_size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def _change_score(self, reference: np.ndarray, current: np.ndarray) -> float:
+        """0 = giống hệt, càng lớn càng khác (diff: trung bình |Δ| / 255, hist: 1 - tương quan)"""
+        if self.config.metric == 'hist':
+            return max(0.0, 1.0 - cv2.compareHist(reference, current, cv2.HISTCMP_CORREL))
+        return float(np.mean(np.abs(reference - current)) / 255.0)
+
+    def _flow_gray(self, frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        scale = min(1.0, self.flow_width / gray.shape[1])
+        if scale < 1.0:
+            gray = cv2.resize(gray, (int(gray.shape[1] * scale), int(gray.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+        return gray
+
+    def _shift_boxes(self, boxes: np.ndarray, frame: np.ndarray) -> np.ndarray:
+        """Dịch mỗi box theo median optical flow (Farneback) bên trong box, từ keyframe tới frame hiện tại"""
+        gray = self._flow_gray(frame)
+        if gray.shape != self._key_gray.shape:
+            return boxes
+        flow = cv2.calcOpticalFlowFarneback(self._key_gray, gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        scale = gray.shape[1] / frame.shape[1]
+        height, width = gray.shape
+        shifted = boxes.astype(np.float64, copy=True)
+        for index, (x1, y1, x2, y2) in enumerate(boxes * scale):
+            left, top = int(max(0, np.floor(x1))), int(max(0, np.floor(y1)))
+            right, bottom = int(min(width, np.ceil(x2))), int(min(height, np.ceil(y2)))
+            if right <= left or bottom <= top:
+                continue
+            dx, dy = np.median(flow[top:bottom, left:right].reshape(-1, 2), axis=0) / scale
+            shifted[index] += (dx, dy, dx, dy)
+        return shifted
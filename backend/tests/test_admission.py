@@ -0,0 +1,187 @@
+import asyncio
+import threading
+
+import pytest
+
+from admission import AdmissionController, AdmissionLimiter, AdmissionRejected
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def settle():
+    # Cho các task đang chờ future chạy tiếp
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_admits_up_to_max_concurrent_then_queues():
+    async def scenario():
+        limiter = AdmissionLimiter('image', max_concurrent=2, max_queue=4)
+        first = await limiter.acquire()
+        second = await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await settle()
+        assert not waiter.done()
+        assert limiter.stats()['queued'] == 1
+
+        first.release()
+        third = await asyncio.wait_for(waiter, 1)
+        assert limiter.active == 2
+        second.release()
+        third.release()
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_waiters_are_admitted_in_fifo_order():
+    async def scenario():
+        limiter = AdmissionLimiter('video', max_concurrent=1, max_queue=10)
+        holder = await limiter.acquire()
+        order = []
+
+        async def wait(name):
+            ticket = await limiter.acquire()
+            order.append(name)
+            ticket.release()
+
+        tasks = []
+        for name in 'abcd':
+            tasks.append(asyncio.ensure_future(wait(name)))
+            await settle()
+        holder.release()
+        await asyncio.wait_for(asyncio.gather(*tasks), 1)
+        assert order == list('abcd')
+
+    run(scenario())
+
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        limiter = AdmissionLimiter('bulk', max_concurrent=1, max_queue=1)
+        holder = await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after >= 1
+        assert limiter.rejected_queue_full == 1
+        holder.release()
+        (await waiter).release()
+
+    run(scenario())
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        limiter = AdmissionLimiter('bulk', max_concurrent=1, max_queue=1, queue_timeout=0.01)
+        holder = await limiter.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        assert rejected.value.status_code == 503
+        assert limiter.stats()['queued'] == 0
+        holder.release()
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_frame_budget_limits_concurrent_frames():
+    async def scenario():
+        limiter = AdmissionLimiter('video', max_concurrent=10, max_queue=10, frame_budget=100)
+        first = await limiter.acquire(60)
+        waiter = asyncio.ensure_future(limiter.acquire(60))
+        await settle()
+        # Slot còn nhưng 60 + 60 > 100 frame
+        assert not waiter.done()
+        first.release()
+        second = await asyncio.wait_for(waiter, 1)
+        assert limiter.active_frames == 60
+        small = await limiter.acquire(40)
+        assert limiter.active_frames == 100
+        second.release()
+        small.release()
+        assert limiter.active_frames == 0
+
+    run(scenario())
+
+
+def test_request_larger_than_budget_runs_alone():
+    async def scenario():
+        limiter = AdmissionLimiter('video', max_concurrent=10, max_queue=10, frame_budget=100)
+        ticket = await limiter.acquire(500)
+        # Bị chặn về đúng ngân sách và vẫn được chạy khi không có request nào khác
+        assert ticket.frames == 100
+        waiter = asyncio.ensure_future(limiter.acquire(1))
+        await settle()
+        assert not waiter.done()
+        ticket.release()
+        (await asyncio.wait_for(waiter, 1)).release()
+
+    run(scenario())
+
+
+def test_release_is_idempotent():
+    async def scenario():
+        limiter = AdmissionLimiter('image', max_concurrent=1, max_queue=1)
+        ticket = await limiter.acquire(5)
+        ticket.release()
+        ticket.release()
+        assert limiter.active == 0
+        assert limiter.active_frames == 0
+
+    run(scenario())
+
+
+def test_release_from_worker_thread_wakes_waiter():
+    async def scenario():
+        limiter = AdmissionLimiter('video', max_concurrent=1, max_queue=1)
+        holder = await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await settle()
+        thread = threading.Thread(target=holder.release)
+        thread.start()
+        thread.join()
+        (await asyncio.wait_for(waiter, 1)).release()
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        limiter = AdmissionLimiter('video', max_concurrent=1, max_queue=2)
+        holder = await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await settle()
+        waiter.cancel()
+        await settle()
+        assert limiter.stats()['queued'] == 0
+        holder.release()
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_slot_context_manager_releases_on_error():
+    async def scenario():
+        limiter = AdmissionLimiter('image', max_concurrent=1, max_queue=0)
+        with pytest.raises(RuntimeError):
+            async with limiter.slot():
+                raise RuntimeError("handler failed")
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_controller_stats_per_group():
+    controller = AdmissionController()
+    controller.add('image', max_concurrent=4, max_queue=8)
+    controller.add('video', max_concurrent=1, max_queue=2, frame_budget=100)
+    stats = controller.stats()
+    assert set(stats) == {'image', 'video'}
+    assert stats['video']['frame_budget'] == 100
+    assert stats['image']['accepting'] is True
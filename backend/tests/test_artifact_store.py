@@ -0,0 +1,113 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from artifact_store import ArtifactStore, RangeNotSatisfiable, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+    ('bytes=900-5000', (900, 999)),
+    ('bytes=999-999', (999, 999)),
+    ('BYTES = 0-0', (0, 0)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ['bytes=1000-', 'bytes=1000-2000', 'bytes=-0'])
+def test_unsatisfiable_range(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1000)
+
+
+@pytest.mark.parametrize("header", [
+    'items=0-10', 'bytes=0-10,20-30', 'bytes=a-b', 'bytes=abc', 'bytes=50-10', 'bytes=-', 'bytes=--5',
+])
+def test_unsupported_or_malformed_range_returns_whole_file(header):
+    assert parse_range(header, 1000) is None
+
+
+def make_store(tmp_path, **kwargs):
+    return ArtifactStore(root_dir=str(tmp_path / 'artifacts'), **kwargs)
+
+
+def test_put_is_content_addressed_and_deduplicated(tmp_path):
+    store = make_store(tmp_path)
+    first = store.put(b'jpeg bytes')
+    assert first == f"{hashlib.sha256(b'jpeg bytes').hexdigest()}.jpg"
+    assert store.put(b'jpeg bytes') == first
+    stats = store.stats()
+    assert stats['writes'] == 1
+    assert stats['dedup_writes'] == 1
+    assert stats['bytes'] == len(b'jpeg bytes')
+
+
+def test_url_uses_prefix(tmp_path):
+    store = make_store(tmp_path, url_prefix='/api/')
+    artifact_id = store.put(b'x')
+    assert store.put_url(b'x') == f"/api/artifacts/{artifact_id}"
+
+
+def test_stat_and_ranged_read(tmp_path):
+    store = make_store(tmp_path)
+    artifact_id = store.put(b'0123456789')
+    path, size, media_type = store.stat(artifact_id)
+    assert (size, media_type) == (10, 'image/jpeg')
+    assert os.path.exists(path)
+    assert store.read(artifact_id) == b'0123456789'
+    assert store.read(artifact_id, 2, 4) == b'234'
+
+
+@pytest.mark.parametrize("artifact_id", ['../../etc/passwd', 'abc.jpg', f"{'0' * 64}.gif", f"{'A' * 64}.jpg"])
+def test_stat_rejects_invalid_ids(tmp_path, artifact_id):
+    assert make_store(tmp_path).stat(artifact_id) is None
+
+
+def test_stat_missing_artifact(tmp_path):
+    store = make_store(tmp_path)
+    assert store.stat(f"{'0' * 64}.jpg") is None
+    assert store.stats()['not_found'] == 1
+
+
+def test_etag_is_the_content_hash(tmp_path):
+    artifact_id = make_store(tmp_path).put(b'x')
+    assert ArtifactStore.etag(artifact_id) == f'"{hashlib.sha256(b"x").hexdigest()}"'
+
+
+def test_available_checks_every_referenced_artifact(tmp_path):
+    store = make_store(tmp_path)
+    present = store.put_url(b'present')
+    missing = f"/artifacts/{'f' * 64}.jpg"
+    assert store.available(f'{{"image": "{present}"}}'.encode())
+    assert not store.available(f'{{"a": "{present}", "b": "{missing}"}}'.encode())
+    # Response không có artifact nào (image_mode=inline)
+    assert store.available(b'{"image": "data:image/jpeg;base64,AAAA"}')
+
+
+def test_eviction_removes_least_recently_read(tmp_path):
+    store = make_store(tmp_path, max_bytes=250, low_water=0.8)
+    old = store.put(b'a' * 100)
+    recent = store.put(b'b' * 100)
+    now = time.time()
+    # 'old' được đọc lâu hơn 'recent'
+    os.utime(store.stat(old)[0], (now - 100, now - 100))
+    os.utime(store.stat(recent)[0], (now - 10, now - 10))
+
+    newest = store.put(b'c' * 100)
+    assert store.stat(old) is None
+    assert store.stat(recent) is not None
+    assert store.stat(newest) is not None
+    stats = store.stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] == 200
+
+
+def test_existing_files_are_counted_on_startup(tmp_path):
+    make_store(tmp_path).put(b'x' * 42)
+    assert make_store(tmp_path).stats()['bytes'] == 42
@@ -0,0 +1,109 @@
+import csv
+import json
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+pytest.importorskip("cv2")
+pytest.importorskip("PIL")
+
+from batch_cli import (  # noqa: E402
+    CHECKPOINT_FILE, DETECTION_COLUMNS, TableWriter, load_checkpoint, run_fingerprint, save_checkpoint,
+)
+from postprocessing import DetectionSettings  # noqa: E402
+
+
+def detection_row(path: str, score: float = 0.9):
+    return {'path': path, 'x1': 1.0, 'y1': 2.0, 'x2': 3.0, 'y2': 4.0, 'score': score, 'label': 'RBC'}
+
+
+def read_rows(writer: TableWriter):
+    if writer.output_format == 'csv':
+        with open(writer.path, newline='', encoding='utf-8') as f:
+            return [row['path'] for row in csv.DictReader(f)]
+    with open(writer.path, encoding='utf-8') as f:
+        return [json.loads(line)['path'] for line in f]
+
+
+@pytest.mark.parametrize("output_format", ['csv', 'jsonl'])
+def test_rows_are_written_only_on_commit(tmp_path, output_format):
+    writer = TableWriter(str(tmp_path), 'detections', DETECTION_COLUMNS, output_format)
+    writer.restore(None)
+    writer.append([detection_row('a.jpg')])
+    assert read_rows(writer) == []
+    state = writer.commit()
+    assert read_rows(writer) == ['a.jpg']
+    assert state['bytes'] == os.path.getsize(writer.path)
+    writer.close()
+
+
+@pytest.mark.parametrize("output_format", ['csv', 'jsonl'])
+def test_restore_truncates_rows_written_after_checkpoint(tmp_path, output_format):
+    writer = TableWriter(str(tmp_path), 'detections', DETECTION_COLUMNS, output_format)
+    writer.restore(None)
+    writer.append([detection_row('a.jpg'), detection_row('b.jpg')])
+    checkpoint = writer.commit()
+    # Lần chạy trước bị dừng sau khi ghi batch này nhưng trước khi lưu checkpoint
+    writer.append([detection_row('c.jpg')])
+    writer.commit()
+    writer.close()
+
+    resumed = TableWriter(str(tmp_path), 'detections', DETECTION_COLUMNS, output_format)
+    resumed.restore(checkpoint)
+    assert read_rows(resumed) == ['a.jpg', 'b.jpg']
+    resumed.append([detection_row('d.jpg')])
+    resumed.commit()
+    resumed.close()
+    # CSV không bị ghi header lần 2 khi tiếp tục
+    assert read_rows(resumed) == ['a.jpg', 'b.jpg', 'd.jpg']
+
+
+def test_restore_without_checkpoint_starts_fresh(tmp_path):
+    writer = TableWriter(str(tmp_path), 'detections', DETECTION_COLUMNS, 'csv')
+    writer.restore(None)
+    writer.append([detection_row('old.jpg')])
+    writer.commit()
+    writer.close()
+
+    fresh = TableWriter(str(tmp_path), 'detections', DETECTION_COLUMNS, 'csv')
+    fresh.restore(None)
+    fresh.close()
+    assert read_rows(fresh) == []
+
+
+def test_parquet_restore_removes_parts_after_checkpoint(tmp_path):
+    pytest.importorskip("pyarrow")
+    writer = TableWriter(str(tmp_path), 'detections', DETECTION_COLUMNS, 'parquet')
+    writer.restore(None)
+    writer.append([detection_row('a.jpg')])
+    checkpoint = writer.commit()
+    writer.append([detection_row('b.jpg')])
+    writer.commit()
+    assert sorted(os.listdir(writer.path)) == ['part-00000.parquet', 'part-00001.parquet']
+
+    resumed = TableWriter(str(tmp_path), 'detections', DETECTION_COLUMNS, 'parquet')
+    resumed.restore(checkpoint)
+    assert os.listdir(resumed.path) == ['part-00000.parquet']
+    assert resumed.parts == 1
+
+
+def test_checkpoint_round_trip_is_atomic(tmp_path):
+    assert load_checkpoint(str(tmp_path)) is None
+    checkpoint = {'fingerprint': 'abc', 'done': 10, 'tables': {'images': {'bytes': 123}}}
+    save_checkpoint(str(tmp_path), checkpoint)
+    assert load_checkpoint(str(tmp_path)) == checkpoint
+    # Không để lại file tạm
+    assert os.listdir(tmp_path) == [CHECKPOINT_FILE]
+
+
+def test_run_fingerprint_depends_on_inputs():
+    settings = DetectionSettings()
+    base = run_fingerprint(['a.jpg', 'b.jpg'], settings, 'weights', 'csv')
+    assert base == run_fingerprint(['a.jpg', 'b.jpg'], settings, 'weights', 'csv')
+    assert base != run_fingerprint(['a.jpg', 'c.jpg'], settings, 'weights', 'csv')
+    assert base != run_fingerprint(['ab.jpg'], settings, 'weights', 'csv')
+    assert base != run_fingerprint(['a.jpg', 'b.jpg'], settings.replace(score_thresh=0.6), 'weights', 'csv')
+    assert base != run_fingerprint(['a.jpg', 'b.jpg'], settings, 'other-weights', 'csv')
+    assert base != run_fingerprint(['a.jpg', 'b.jpg'], settings, 'weights', 'jsonl')
@@ -0,0 +1,90 @@
+import io
+import zipfile
+
+from batch_sources import BatchSourceError, iter_upload_images, iter_zip_images, list_image_files
+
+
+class Upload:
+    """UploadFile tối giản (filename, content_type, file)"""
+
+    def __init__(self, filename: str, data: bytes, content_type: str):
+        self.filename = filename
+        self.content_type = content_type
+        self.file = io.BytesIO(data)
+
+
+def make_zip(names, corrupt_first: bool = False) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for index, name in enumerate(names):
+            zf.writestr(name, b'pixels' * 1000 + bytes([index]))
+    data = bytearray(buffer.getvalue())
+    if corrupt_first:
+        # Làm hỏng dữ liệu nén của member đầu tiên (ngay sau local header 30 byte + tên file)
+        offset = 30 + len(names[0]) + 5
+        data[offset] ^= 0xff
+        data[offset + 1] ^= 0xff
+    return bytes(data)
+
+
+def run(uploads, max_images=100, max_member_bytes=10 ** 6):
+    report = {'truncated': False, 'skipped_images': 0}
+    items = list(iter_upload_images(uploads, max_images, max_member_bytes, report=report))
+    return items, report
+
+
+def test_zip_skips_non_images_and_macos_metadata():
+    data = make_zip(['a.jpg', 'notes.txt', '__MACOSX/._a.jpg', 'dir/b.png', '.hidden.jpg'])
+    names = [name for name, _ in iter_zip_images(io.BytesIO(data), 'x.zip', 10 ** 6)]
+    assert names == ['x.zip/a.jpg', 'x.zip/dir/b.png']
+
+
+def test_corrupt_member_yields_error_and_batch_continues():
+    items, report = run([Upload('x.zip', make_zip(['a.jpg', 'b.jpg', 'c.jpg'], corrupt_first=True), 'application/zip')])
+    assert [name for name, _ in items] == ['x.zip/a.jpg', 'x.zip/b.jpg', 'x.zip/c.jpg']
+    assert isinstance(items[0][1], BatchSourceError)
+    assert all(isinstance(contents, bytes) for _, contents in items[1:])
+    assert report['truncated'] is False
+
+
+def test_invalid_zip_is_reported_once():
+    items, _ = run([Upload('broken.zip', b'not a zip', 'application/zip'), Upload('a.png', b'png', 'image/png')])
+    assert items[0][0] == 'broken.zip' and isinstance(items[0][1], BatchSourceError)
+    assert items[1] == ('a.png', b'png')
+
+
+def test_oversized_images_become_errors():
+    items, _ = run([Upload('big.png', b'x' * 11, 'image/png'), Upload('x.zip', make_zip(['a.jpg']), 'application/zip')],
+                   max_member_bytes=10)
+    assert all(isinstance(contents, BatchSourceError) for _, contents in items)
+
+
+def test_non_image_upload_is_rejected():
+    items, _ = run([Upload('report.pdf', b'%PDF', 'application/pdf')])
+    assert isinstance(items[0][1], BatchSourceError)
+
+
+def test_truncation_counts_rest_of_current_zip_and_later_uploads():
+    uploads = [
+        Upload('first.zip', make_zip(['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg']), 'application/zip'),
+        Upload('single.png', b'png', 'image/png'),
+        Upload('second.zip', make_zip(['e.jpg', 'f.jpg']), 'application/zip'),
+    ]
+    items, report = run(uploads, max_images=3)
+    assert [name for name, _ in items] == ['first.zip/a.jpg', 'first.zip/b.jpg', 'first.zip/c.jpg']
+    assert report == {'truncated': True, 'skipped_images': 1 + 1 + 2}
+
+
+def test_exactly_max_images_is_not_truncated():
+    uploads = [Upload('x.zip', make_zip(['a.jpg', 'b.jpg']), 'application/zip'), Upload('c.png', b'png', 'image/png')]
+    items, report = run(uploads, max_images=3)
+    assert len(items) == 3
+    assert report == {'truncated': False, 'skipped_images': 0}
+
+
+def test_list_image_files_is_sorted_and_relative(tmp_path):
+    (tmp_path / 'b').mkdir()
+    (tmp_path / '.cache').mkdir()
+    for path in ['b/2.jpg', 'a.PNG', 'b/1.tif', 'readme.md', '.cache/x.jpg']:
+        (tmp_path / path).write_bytes(b'')
+    assert list_image_files(str(tmp_path)) == ['a.PNG', 'b/1.tif', 'b/2.jpg']
@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from postprocessing import DetectionSettings  # noqa: E402
+
+
+def test_defaults():
+    settings = DetectionSettings()
+    assert settings.describe() == {
+        'score_thresh': 0.5, 'nms_thresh': 0.45, 'topk_candidates': 400, 'detections_per_img': 200,
+    }
+
+
+@pytest.mark.parametrize("score_thresh", [0.0, 0.3, 0.999])
+def test_valid_score_thresh(score_thresh):
+    assert DetectionSettings(score_thresh=score_thresh).score_thresh == score_thresh
+
+
+@pytest.mark.parametrize("kwargs", [
+    {'score_thresh': -0.1},
+    {'score_thresh': 1.0},
+    {'nms_thresh': 0.0},
+    {'nms_thresh': 1.5},
+    {'topk_candidates': 0},
+    {'detections_per_img': 0},
+])
+def test_invalid_values_raise(kwargs):
+    with pytest.raises(ValueError):
+        DetectionSettings(**kwargs)
+
+
+def test_nms_thresh_one_is_allowed():
+    assert DetectionSettings(nms_thresh=1.0).nms_thresh == 1.0
+
+
+def test_replace_overrides_only_given_values():
+    base = DetectionSettings(score_thresh=0.4, nms_thresh=0.5, topk_candidates=100, detections_per_img=50)
+    changed = base.replace(score_thresh=0.7, detections_per_img=10)
+    assert changed.describe() == {
+        'score_thresh': 0.7, 'nms_thresh': 0.5, 'topk_candidates': 100, 'detections_per_img': 10,
+    }
+    # Bản gốc không bị sửa
+    assert base.score_thresh == 0.4
+
+
+def test_replace_validates():
+    with pytest.raises(ValueError):
+        DetectionSettings().replace(nms_thresh=2.0)
+
+
+def test_replace_with_zero_threshold_is_not_ignored():
+    assert DetectionSettings(score_thresh=0.5).replace(score_thresh=0.0).score_thresh == 0.0
+
+
+def test_cache_variant_changes_with_each_parameter():
+    base = DetectionSettings()
+    variants = {
+        base.cache_variant(),
+        base.replace(score_thresh=0.6).cache_variant(),
+        base.replace(nms_thresh=0.6).cache_variant(),
+        base.replace(topk_candidates=10).cache_variant(),
+        base.replace(detections_per_img=10).cache_variant(),
+    }
+    assert len(variants) == 5
+    assert DetectionSettings().cache_variant() == base.cache_variant()
+
+
+def test_values_are_normalized_to_numeric_types():
+    settings = DetectionSettings(score_thresh=0, nms_thresh=1, topk_candidates=5.0, detections_per_img=3.0)
+    assert isinstance(settings.score_thresh, float)
+    assert isinstance(settings.topk_candidates, int)
+    assert isinstance(settings.detections_per_img, int)
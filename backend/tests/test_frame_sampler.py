@@ -0,0 +1,63 @@
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+from frame_sampler import FrameSampler  # noqa: E402
+
+
+class FakeCapture:
+    """VideoCapture giả: seek luôn "thành công", frame đọc được có PTS do test chọn"""
+
+    def __init__(self, position_msec: float):
+        self.position_msec = position_msec
+        self.requested = None
+
+    def set(self, prop, value):
+        self.requested = value
+        return True
+
+    def read(self):
+        return True, np.zeros((2, 2, 3), dtype=np.uint8)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.position_msec
+        # Hầu hết backend chỉ trả lại giá trị vừa set
+        return self.requested
+
+
+def test_target_indices_evenly_spaced():
+    assert FrameSampler.target_indices(100, 4) == [0, 25, 50, 75]
+
+
+def test_target_indices_short_video_returns_every_frame():
+    assert FrameSampler.target_indices(3, 10) == [0, 1, 2]
+
+
+def test_target_indices_never_exceeds_max_frames():
+    indices = FrameSampler.target_indices(1001, 10)
+    assert len(indices) == 10
+    assert indices == sorted(set(indices))
+    assert indices[-1] < 1001
+
+
+@pytest.mark.parametrize("total_frames, max_frames", [(0, 10), (-1, 10), (100, 0)])
+def test_target_indices_empty(total_frames, max_frames):
+    assert FrameSampler.target_indices(total_frames, max_frames) == []
+
+
+def test_seek_accepts_frame_at_target_timestamp():
+    sampler = FrameSampler()
+    # Frame 300 ở 30 fps = 10 s
+    assert sampler._seek(FakeCapture(10000.0), 300, 30.0) is not None
+
+
+def test_seek_rejects_keyframe_snap():
+    sampler = FrameSampler()
+    # Seek rơi vào keyframe ở 8 s, POS_FRAMES vẫn báo 300
+    assert sampler._seek(FakeCapture(8000.0), 300, 30.0) is None
+
+
+def test_seek_rejects_backend_without_pts():
+    assert FrameSampler()._seek(FakeCapture(0.0), 300, 30.0) is None
@@ -0,0 +1,160 @@
+import os
+
+import pytest
+
+import result_cache
+from result_cache import DetectionCache, youtube_video_id
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(result_cache.time, 'time', fake)
+    return fake
+
+
+def test_hit_returns_stored_json_bytes():
+    cache = DetectionCache()
+    encoded = cache.set('k', {'a': 1})
+    assert cache.get('k') == encoded == b'{"a": 1}'
+    assert cache.stats()['hits'] == 1
+
+
+def test_miss_is_counted():
+    cache = DetectionCache()
+    assert cache.get('missing') is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_lru_evicts_least_recently_used_entry():
+    cache = DetectionCache(max_entries=2)
+    cache.set('a', {'v': 1})
+    cache.set('b', {'v': 2})
+    # Đọc 'a' để 'b' thành entry cũ nhất
+    assert cache.get('a') is not None
+    cache.set('c', {'v': 3})
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_byte_limit_evicts_and_skips_oversized_entries():
+    cache = DetectionCache(max_entries=100, max_bytes=30)
+    cache.set('a', {'v': 'x' * 10})
+    cache.set('b', {'v': 'y' * 10})
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] <= 30
+    # Lớn hơn toàn bộ giới hạn RAM: không giữ trong RAM
+    cache.set('big', {'v': 'z' * 100})
+    assert cache.get('big') is None
+
+
+def test_ttl_expires_entries(clock):
+    cache = DetectionCache(ttl_seconds=10)
+    cache.set('k', {'v': 1})
+    clock.now += 5
+    assert cache.get('k') is not None
+    clock.now += 6
+    assert cache.get('k') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_ttl_zero_never_expires(clock):
+    cache = DetectionCache(ttl_seconds=0)
+    cache.set('k', {'v': 1})
+    clock.now += 10 ** 6
+    assert cache.get('k') is not None
+
+
+def test_keys_depend_on_model_fingerprint():
+    cache = DetectionCache()
+    cache.set_model_fingerprint('a' * 64)
+    key_a = cache.image_key(b'image', 0.5)
+    cache.set_model_fingerprint('b' * 64)
+    assert cache.image_key(b'image', 0.5) != key_a
+    assert cache.image_key(b'image', 0.5) != cache.image_key(b'image', 0.6)
+    assert cache.image_key(b'image', 0.5) != cache.image_key(b'image', 0.5, variant='columns')
+
+
+def test_disk_tier_survives_restart_with_same_weights(tmp_path):
+    first = DetectionCache(disk_dir=str(tmp_path))
+    first.set_model_fingerprint('f' * 64)
+    first.set('k', {'v': 1})
+
+    second = DetectionCache(disk_dir=str(tmp_path))
+    second.set_model_fingerprint('f' * 64)
+    assert second.get('k') == b'{"v": 1}'
+    assert second.stats()['disk_hits'] == 1
+
+
+def test_new_weights_remove_old_disk_entries(tmp_path):
+    old = DetectionCache(disk_dir=str(tmp_path))
+    old.set_model_fingerprint('a' * 64)
+    old.set('k', {'v': 1})
+
+    new = DetectionCache(disk_dir=str(tmp_path))
+    new.set_model_fingerprint('b' * 64)
+    assert os.listdir(tmp_path) == []
+
+
+def test_random_weights_do_not_touch_disk(tmp_path):
+    real = DetectionCache(disk_dir=str(tmp_path))
+    real.set_model_fingerprint('a' * 64)
+    real.set('k', {'v': 1})
+
+    # Worker chạy random weights: không xóa, không đọc, không ghi entry trên disk
+    worker = DetectionCache(disk_dir=str(tmp_path))
+    worker.set_model_fingerprint('random-123', persistent=False)
+    worker.set('other', {'v': 2})
+    assert len(os.listdir(tmp_path)) == 1
+    assert worker.stats()['disk_enabled'] is False
+
+
+def test_disk_entries_expire(tmp_path, clock):
+    writer = DetectionCache(disk_dir=str(tmp_path), ttl_seconds=10)
+    writer.set('k', {'v': 1})
+    path = os.path.join(tmp_path, os.listdir(tmp_path)[0])
+    os.utime(path, (clock.now, clock.now))
+
+    reader = DetectionCache(disk_dir=str(tmp_path), ttl_seconds=10)
+    clock.now += 11
+    assert reader.get('k') is None
+    assert not os.path.exists(path)
+
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://www.youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=42",
+    "https://m.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?si=abc",
+    "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ",
+    "youtube.com/watch?v=dQw4w9WgXcQ",
+])
+def test_youtube_video_id_forms(url):
+    assert youtube_video_id(url) == 'dQw4w9WgXcQ'
+
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?dev=dQw4w9WgXcQ",
+    "https://www.youtube.com/watch?xv=dQw4w9WgXcQ",
+    "https://example.com/watch?v=dQw4w9WgXcQ",
+])
+def test_youtube_video_id_ignores_lookalike_parameters(url):
+    assert youtube_video_id(url) == url
+
+
+def test_video_key_distinguishes_lookalike_urls():
+    cache = DetectionCache()
+    real = cache.video_key("https://www.youtube.com/watch?v=dQw4w9WgXcQ", 30, 0.5)
+    lookalike = cache.video_key("https://www.youtube.com/watch?dev=dQw4w9WgXcQ", 30, 0.5)
+    assert real != lookalike
@@ -0,0 +1,86 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+pytest.importorskip("cv2")
+pytest.importorskip("PIL")
+
+from PIL import Image  # noqa: E402
+
+from tiling import (  # noqa: E402
+    MAX_TILE_BATCH_SIZE, MAX_TILE_SIZE, MIN_TILE_SIZE, SlideTooLarge, TiledDetector, load_slide, tile_origins,
+)
+
+
+def covered(origins, tile_size, length):
+    pixels = set()
+    for origin in origins:
+        pixels.update(range(origin, min(origin + tile_size, length)))
+    return pixels == set(range(length))
+
+
+def test_short_axis_is_single_tile():
+    assert tile_origins(200, 300, 50) == [0]
+    assert tile_origins(300, 300, 50) == [0]
+
+
+def test_stride_is_tile_minus_overlap():
+    assert tile_origins(800, 300, 50) == [0, 250, 500]
+
+
+def test_last_tile_is_pushed_to_the_edge():
+    origins = tile_origins(1000, 300, 50)
+    assert origins == [0, 250, 500, 700]
+    assert origins[-1] + 300 == 1000
+
+
+@pytest.mark.parametrize("length, tile_size, overlap", [
+    (1, 300, 50), (301, 300, 50), (4000, 300, 64), (3000, 512, 0), (999, 64, 63),
+])
+def test_tiles_cover_every_pixel_inside_the_image(length, tile_size, overlap):
+    origins = tile_origins(length, tile_size, overlap)
+    assert origins == sorted(set(origins))
+    assert all(0 <= origin and origin + min(tile_size, length) <= length for origin in origins)
+    assert covered(origins, tile_size, length)
+
+
+def test_iter_tiles_returns_views_at_origins():
+    detector = TiledDetector(None, 'cpu', tile_size=64, overlap=0)
+    slide = np.zeros((100, 130, 3), dtype=np.uint8)
+    tiles = list(detector.iter_tiles(slide))
+    assert [(x, y) for x, y, _ in tiles] == [(x, y) for y in (0, 36) for x in (0, 64, 66)]
+    assert all(view.shape == (64, 64, 3) and view.base is slide for _, _, view in tiles)
+
+
+@pytest.mark.parametrize("tile_size", [0, 1, MIN_TILE_SIZE - 1, MAX_TILE_SIZE + 1])
+def test_tile_size_out_of_range_is_rejected(tile_size):
+    with pytest.raises(ValueError):
+        TiledDetector(None, 'cpu', tile_size=tile_size, overlap=0)
+
+
+@pytest.mark.parametrize("overlap", [-1, 300, 301])
+def test_overlap_must_be_smaller_than_tile(overlap):
+    with pytest.raises(ValueError):
+        TiledDetector(None, 'cpu', tile_size=300, overlap=overlap)
+
+
+def test_batch_size_is_clamped():
+    assert TiledDetector(None, 'cpu', batch_size=100000).batch_size == MAX_TILE_BATCH_SIZE
+    assert TiledDetector(None, 'cpu', batch_size=0).batch_size == 1
+
+
+def test_load_slide_rejects_images_over_pixel_limit(tmp_path):
+    path = str(tmp_path / 'slide.png')
+    Image.new('RGB', (100, 80)).save(path)
+    with pytest.raises(SlideTooLarge):
+        load_slide(path, max_pixels=100 * 80 - 1)
+    assert load_slide(path, max_pixels=100 * 80).shape == (80, 100, 3)
+
+
+def test_load_slide_memory_maps_npy(tmp_path):
+    path = str(tmp_path / 'slide.npy')
+    np.save(path, np.zeros((50, 40, 3), dtype=np.uint8))
+    slide = load_slide(path, max_pixels=1)
+    assert isinstance(slide, np.memmap)
+    assert slide.shape == (50, 40, 3)
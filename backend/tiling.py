@@ -0,0 +1,164 @@
+import time
+from typing import Dict, Generator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from torchvision.ops import boxes as box_ops
+
+from postprocessing import DetectionSettings, empty_detections, filter_detections
+from preprocessing import INPUT_SIZE, InputBuffers, resize_frame, write_input
+
+
+# Giới hạn tham số tiling (request và biến môi trường): tile quá nhỏ -> số tile bùng nổ, batch quá lớn -> hết RAM
+MIN_TILE_SIZE = 64
+MAX_TILE_SIZE = 2048
+MAX_TILE_BATCH_SIZE = 32
+
+
+def tile_origins(length: int, tile_size: int, overlap: int) -> List[int]:
+    """Vị trí bắt đầu các tile trên 1 trục, tile cuối được đẩy sát mép để phủ hết ảnh"""
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    origins = list(range(0, length - tile_size + 1, stride))
+    if origins[-1] + tile_size < length:
+        origins.append(length - tile_size)
+    return origins
+
+
+class SlideTooLarge(ValueError):
+    """Ảnh vượt giới hạn pixel khi phải decode toàn bộ vào RAM (413)"""
+
+
+def image_size(path: str) -> Optional[Tuple[int, int]]:
+    """(width, height) đọc từ header ảnh, chưa decode pixel; None nếu PIL không nhận ra định dạng"""
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Image.DecompressionBombError as e:
+        raise SlideTooLarge(str(e))
+    except Exception:
+        return None
+
+
+def load_slide(path: str, max_pixels: int = 0) -> np.ndarray:
+    """Đọc ảnh RGB [H, W, 3] uint8
+
+    Chỉ file .npy được memory-map (chỉ các tile đang xử lý nằm trong RAM). Định dạng ảnh khác (JPEG, PNG,
+    TIFF...) được decode toàn bộ vào RAM nên bị giới hạn max_pixels (0 = không giới hạn), kiểm tra từ header
+    trước khi decode.
+    """
+    if path.lower().endswith('.npy'):
+        slide = np.load(path, mmap_mode='r')
+        if slide.ndim != 3 or slide.shape[2] != 3 or slide.dtype != np.uint8:
+            raise ValueError("File .npy phải là mảng uint8 [H, W, 3] (RGB)")
+        return slide
+    if max_pixels:
+        size = image_size(path)
+        if size is not None and size[0] * size[1] > max_pixels:
+            raise SlideTooLarge(f"Ảnh {size[0]}x{size[1]} vượt giới hạn {max_pixels} pixel; "
+                                f"gửi slide lớn dạng .npy (uint8 [H, W, 3]) để xử lý bằng memory-map")
+    slide = cv2.imread(path, cv2.IMREAD_COLOR)
+    if slide is None:
+        raise ValueError("Không đọc được ảnh")
+    return cv2.cvtColor(slide, cv2.COLOR_BGR2RGB, dst=slide)
+
+
+class TiledDetector:
+    """Detection trên ảnh độ phân giải cao: cắt tile chồng lấn, inference theo batch, gộp box bằng NMS theo class"""
+
+    def __init__(self, model, device, tile_size: int = 300, overlap: int = 50, batch_size: int = 8,
+                 nms_iou_threshold: float = 0.5):
+        if not MIN_TILE_SIZE <= tile_size <= MAX_TILE_SIZE:
+            raise ValueError(f"tile_size phải trong khoảng [{MIN_TILE_SIZE}, {MAX_TILE_SIZE}]")
+        if not 0 <= overlap < tile_size:
+            raise ValueError("Cần 0 <= overlap < tile_size")
+        self.model = model
+        self.device = device
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.batch_size = max(1, min(batch_size, MAX_TILE_BATCH_SIZE))
+        self.nms_iou_threshold = nms_iou_threshold
+        self.input_buffers = InputBuffers()
+
+    def iter_tiles(self, slide: np.ndarray) -> Generator[Tuple[int, int, np.ndarray], None, None]:
+        """Sinh (x, y, view) cho từng tile, không copy dữ liệu ảnh"""
+        height, width = slide.shape[:2]
+        for y in tile_origins(height, self.tile_size, self.overlap):
+            for x in tile_origins(width, self.tile_size, self.overlap):
+                yield x, y, slide[y:y + self.tile_size, x:x + self.tile_size]
+
+    def _iter_batches(self, slide: np.ndarray):
+        batch = []
+        for tile in self.iter_tiles(slide):
+            batch.append(tile)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def detect(self, slide: np.ndarray, confidence_threshold: float = 0.5,
+               settings: Optional[DetectionSettings] = None) -> Tuple[Dict[str, np.ndarray], Dict]:
+        """Trả về (detections theo tọa độ ảnh gốc, thống kê tiling)
+
+        settings: tham số postprocess của model cho từng tile
+        (mặc định: của backend với score_thresh=confidence_threshold).
+        """
+        if settings is None:
+            settings = self.model.settings(score_thresh=confidence_threshold)
+        height, width = slide.shape[:2]
+        columns = len(tile_origins(width, self.tile_size, self.overlap))
+        rows = len(tile_origins(height, self.tile_size, self.overlap))
+
+        started = time.perf_counter()
+        tile_count = 0
+        parts = []
+        for batch in self._iter_batches(slide):
+            images = self.input_buffers.get(len(batch))
+            for slot, (_, _, tile) in zip(images, batch):
+                write_input(resize_frame(tile), slot)
+
+            with torch.no_grad():
+                predictions = self.model(images.to(self.device), settings)
+
+            for (x, y, tile), prediction in zip(batch, predictions):
+                scale = (tile.shape[1] / INPUT_SIZE[0], tile.shape[0] / INPUT_SIZE[1])
+                detections = filter_detections(prediction, settings.score_thresh, scale=scale)
+                detections['boxes'] = detections['boxes'] + np.array([x, y, x, y], dtype=np.float64)
+                parts.append(detections)
+            tile_count += len(batch)
+        inference_seconds = time.perf_counter() - started
+
+        raw_count = sum(len(part['scores']) for part in parts)
+        merged = self._merge(parts)
+        elapsed = time.perf_counter() - started
+        return merged, {
+            'image_size': [width, height],
+            'tile_size': self.tile_size,
+            'overlap': self.overlap,
+            'batch_size': self.batch_size,
+            'grid': [columns, rows],
+            'tiles': tile_count,
+            'raw_detections': raw_count,
+            'merged_detections': int(len(merged['scores'])),
+            'inference_seconds': round(inference_seconds, 3),
+            'total_seconds': round(elapsed, 3),
+            'tiles_per_second': round(tile_count / inference_seconds, 2) if inference_seconds > 0 else 0,
+        }
+
+    def _merge(self, parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """Gộp box của các tile, NMS theo từng class để bỏ box trùng ở vùng chồng lấn"""
+        if not parts:
+            return empty_detections()
+        boxes = np.concatenate([part['boxes'] for part in parts]).astype(np.float32)
+        scores = np.concatenate([part['scores'] for part in parts]).astype(np.float32)
+        labels = np.concatenate([part['labels'] for part in parts])
+        if len(scores) == 0:
+            return empty_detections()
+        keep = box_ops.batched_nms(torch.from_numpy(boxes), torch.from_numpy(scores),
+                                   torch.from_numpy(labels), self.nms_iou_threshold).numpy()
+        return {'boxes': boxes[keep], 'scores': scores[keep], 'labels': labels[keep]}
+
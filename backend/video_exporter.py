@@ -0,0 +1,241 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from metrics import FRAMES_PROCESSED_TOTAL, record_stage
+from postprocessing import DetectionSettings
+
+# Sentinel báo hết dữ liệu giữa các stage
+_END = object()
+# Số byte cuối của stderr ffmpeg được giữ để đưa vào thông báo lỗi
+STDERR_TAIL_BYTES = 64 * 1024
+
+
+def find_ffmpeg() -> str:
+    """Tìm ffmpeg trên PATH, fallback sang binary đi kèm package imageio-ffmpeg"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        return ffmpeg
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+class AnnotatedVideoExporter:
+    """Xuất video có bounding box bằng pipeline nhiều stage nối với nhau qua queue giới hạn
+
+    decode (OpenCV) -> detect theo batch -> vẽ box (nhiều thread) -> encode qua pipe ffmpeg
+    """
+
+    def __init__(self, video_processor, batch_size: int = 8, render_workers: Optional[int] = None,
+                 queue_size: int = 32, crf: int = 23, preset: str = "veryfast"):
+        self.video_processor = video_processor
+        self.batch_size = max(1, batch_size)
+        self.render_workers = render_workers or max(1, min(4, (os.cpu_count() or 2) // 2))
+        self.queue_size = queue_size
+        self.crf = crf
+        self.preset = preset
+
+    def export(self, input_path: str, output_path: str, confidence_threshold: float = 0.5,
+               settings: Optional[DetectionSettings] = None) -> Dict:
+        """Detect + vẽ box lên toàn bộ frame của input_path và ghi ra output_path (mp4/h264)"""
+        cap = cv2.VideoCapture(input_path)
+        if not cap.isOpened():
+            raise ValueError(f"Không mở được video: {input_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        decode_queue = queue.Queue(maxsize=self.queue_size)
+        render_queue = queue.Queue(maxsize=self.queue_size)
+        encode_queue = queue.Queue(maxsize=self.queue_size)
+        stop_event = threading.Event()
+        errors: List[BaseException] = []
+        stage_seconds = {'decode': 0.0, 'detect': 0.0, 'render': 0.0, 'encode': 0.0}
+        stage_lock = threading.Lock()
+
+        def record(stage: str, seconds: float):
+            with stage_lock:
+                stage_seconds[stage] += seconds
+
+        def put(q: queue.Queue, item) -> bool:
+            # put có timeout để stage không bị treo khi stage sau đã dừng vì lỗi
+            while not stop_event.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q: queue.Queue):
+            while not stop_event.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _END
+
+        def fail(e: BaseException):
+            errors.append(e)
+            stop_event.set()
+
+        def decode_stage():
+            try:
+                frame_idx = 0
+                while not stop_event.is_set():
+                    started = time.perf_counter()
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    record('decode', time.perf_counter() - started)
+                    if not put(decode_queue, (frame_idx, frame_rgb)):
+                        return
+                    frame_idx += 1
+            except Exception as e:
+                fail(e)
+            finally:
+                cap.release()
+                put(decode_queue, _END)
+
+        def detect_stage():
+            try:
+                finished = False
+                while not finished:
+                    batch = []
+                    while len(batch) < self.batch_size:
+                        item = get(decode_queue)
+                        if item is _END:
+                            finished = True
+                            break
+                        batch.append(item)
+                    if not batch:
+                        continue
+                    started = time.perf_counter()
+                    outputs = self.video_processor.detect_in_frames(
+                        [frame for _, frame in batch], confidence_threshold, batch_size=self.batch_size, settings=settings
+                    )
+                    record('detect', time.perf_counter() - started)
+                    for (frame_idx, frame), (detections, _) in zip(batch, outputs):
+                        if not put(render_queue, (frame_idx, frame, detections)):
+                            return
+            except Exception as e:
+                fail(e)
+            finally:
+                # Mỗi render worker cần 1 sentinel
+                for _ in range(self.render_workers):
+                    put(render_queue, _END)
+
+        def render_stage():
+            try:
+                while True:
+                    item = get(render_queue)
+                    if item is _END:
+                        break
+                    frame_idx, frame, detections = item
+                    started = time.perf_counter()
+                    annotated = self.video_processor.render_detections(frame, detections)
+                    record('render', time.perf_counter() - started)
+                    if not put(encode_queue, (frame_idx, annotated)):
+                        return
+            except Exception as e:
+                fail(e)
+            finally:
+                put(encode_queue, _END)
+
+        # Kích thước chẵn cho yuv420p / libx264
+        command = [
+            find_ffmpeg(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", f"{fps}",
+            "-i", "pipe:0",
+            "-an", "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+            "-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf),
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            output_path,
+        ]
+        encoder = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Đọc stderr liên tục trên thread riêng: ffmpeg ghi nhiều hơn buffer của pipe sẽ bị chặn (deadlock)
+        # nếu chỉ đọc sau khi encode xong. Chỉ giữ phần cuối để báo lỗi
+        stderr_tail = bytearray()
+
+        def drain_stderr():
+            for chunk in iter(lambda: encoder.stderr.read(4096), b''):
+                stderr_tail.extend(chunk)
+                del stderr_tail[:-STDERR_TAIL_BYTES]
+
+        stderr_reader = threading.Thread(target=drain_stderr, name="export-ffmpeg-stderr", daemon=True)
+        stderr_reader.start()
+
+        threads = [
+            threading.Thread(target=decode_stage, name="export-decode", daemon=True),
+            threading.Thread(target=detect_stage, name="export-detect", daemon=True),
+        ] + [
+            threading.Thread(target=render_stage, name=f"export-render-{i}", daemon=True)
+            for i in range(self.render_workers)
+        ]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        # Encode stage chạy trên thread hiện tại, sắp xếp lại frame theo thứ tự vì render chạy song song
+        frames_written = 0
+        pending: Dict[int, np.ndarray] = {}
+        finished_renderers = 0
+        try:
+            while finished_renderers < self.render_workers:
+                item = get(encode_queue)
+                if item is _END:
+                    if stop_event.is_set():
+                        break
+                    finished_renderers += 1
+                    continue
+                frame_idx, annotated = item
+                pending[frame_idx] = annotated
+                while frames_written in pending:
+                    write_started = time.perf_counter()
+                    encoder.stdin.write(np.ascontiguousarray(pending.pop(frames_written)).tobytes())
+                    record('encode', time.perf_counter() - write_started)
+                    frames_written += 1
+        except Exception as e:
+            fail(e)
+        finally:
+            for thread in threads:
+                thread.join(timeout=5)
+            try:
+                encoder.stdin.close()
+            except Exception:
+                pass
+            return_code = encoder.wait()
+            stderr_reader.join()
+            encoder_stderr = stderr_tail.decode("utf-8", errors="replace")
+
+        if return_code != 0:
+            raise RuntimeError(f"ffmpeg encode lỗi: {encoder_stderr.strip()}")
+        if errors:
+            raise errors[0]
+
+        elapsed = time.perf_counter() - started
+        fps_processed = frames_written / elapsed if elapsed > 0 else 0
+        print(f"Exported {frames_written} annotated frames in {elapsed:.1f}s ({fps_processed:.1f} fps)")
+        # Tổng thời gian mỗi stage (cộng dồn qua các thread) cho /metrics
+        for stage, seconds in stage_seconds.items():
+            record_stage(f'export_{stage}', seconds)
+        record_stage('export_total', elapsed)
+        FRAMES_PROCESSED_TOTAL.inc(frames_written, pipeline='export')
+        return {
+            'frames': frames_written,
+            'seconds': elapsed,
+            'fps': fps_processed,
+            # Throughput vẽ overlay của 1 render worker
+            'render_fps': frames_written / stage_seconds['render'] if stage_seconds['render'] > 0 else 0,
+            'source_fps': fps,
+            'stage_seconds': stage_seconds,
+        }
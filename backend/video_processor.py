@@ -1,314 +1,370 @@
 import os
 import cv2
 import numpy as np
-import yt_dlp
-from typing import List, Dict, Generator
+from typing import List, Dict, Generator, Iterable, Optional, Callable
 import tempfile
 import threading
 import time
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import torch
-from pathlib import Path
-import base64
-import io
-from moviepy.editor import VideoFileClip
+from frame_sampler import FrameSampler
+from download_manager import DownloadManager
+from artifact_store import ArtifactStore
+from preprocessing import InputBuffers, resize_frame, write_input
+from temporal import TemporalConfig
+from overlay import OverlayRenderer
+from metrics import FRAMES_PROCESSED_TOTAL, count_detections, span, timed_iter
+from postprocessing import DetectionSettings, class_counts, empty_detections, filter_detections, format_detections, label_names, to_detection_dicts
 
 class YouTubeVideoProcessor:
-    def __init__(self, model, device, class_names):
+    def __init__(self, model, device, class_names, download_manager: Optional[DownloadManager] = None,
+                 artifacts: Optional[ArtifactStore] = None):
         self.model = model
         self.device = device
         self.class_names = class_names
         self.temp_dir = tempfile.mkdtemp()
+        self.downloads = download_manager or DownloadManager(os.path.join(self.temp_dir, 'downloads'))
+        self.input_buffers = InputBuffers()
+        self.frame_sampler = FrameSampler()
+        self.overlay = OverlayRenderer()
+        # Nơi lưu frame đã render cho image_mode='url' (None: luôn trả data URI)
+        self.artifacts = artifacts
         
     def download_youtube_video(self, url: str, max_duration: int = 300) -> str:
-        """Download video từ YouTube và trả về đường dẫn file"""
+        """Download video từ YouTube vào workspace riêng của job và trả về đường dẫn file"""
         try:
-            # Cấu hình yt-dlp với hỗ trợ YouTube Shorts
-            ydl_opts = {
-                'format': 'best[height<=720][ext=mp4]/best[ext=mp4]/best',  # Hỗ trợ nhiều format hơn
-                'outtmpl': os.path.join(self.temp_dir, '%(id)s.%(ext)s'),  # Dùng ID thay vì title
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,  # Đảm bảo extract full info
-                'force_json': False,
-            }
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # Lấy thông tin video trước
-                info = ydl.extract_info(url, download=False)
-                duration = info.get('duration', 0)
-                
-                # Kiểm tra độ dài video (cho phép Shorts dài hơn)
-                max_allowed = max_duration if duration and duration > 60 else 180  # Shorts có thể dài đến 3 phút
-                if duration and duration > max_allowed:
-                    raise ValueError(f"Video quá dài ({duration}s). Tối đa {max_allowed}s")
-                
-                # Download video
-                ydl.download([url])
-                
-                # Tìm file đã download (hỗ trợ nhiều format)
-                video_files = list(Path(self.temp_dir).glob('*.*'))
-                video_files = [f for f in video_files if f.suffix.lower() in ['.mp4', '.webm', '.mkv', '.avi']]
-                
-                if not video_files:
-                    raise FileNotFoundError("Không thể download video")
-                
-                return str(video_files[0])
-                
+            with span('download'):
+                return self.downloads.fetch(url, max_duration)
         except Exception as e:
             raise Exception(f"Lỗi download video: {str(e)}")
+
+    def release_video(self, video_path: str):
+        """Xóa file video đã download cùng workspace của job"""
+        self.downloads.release(video_path)
     
+    def extract_frames_with_timestamps(self, video_path: str, max_frames: int = 100) -> Generator[tuple[np.ndarray, int, float], None, None]:
+        """Extract frames từ video bằng seek, kèm frame index và timestamp thực tế (giây)"""
+        yield from self.frame_sampler.sample(video_path, max_frames)
+
     def extract_frames(self, video_path: str, max_frames: int = 100) -> Generator[np.ndarray, None, None]:
         """Extract frames từ video"""
-        cap = cv2.VideoCapture(video_path)
-        
-        try:
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            
-            # Tính toán step để lấy đủ frames mà không quá nhiều
-            step = max(1, total_frames // max_frames)
-            
-            frame_count = 0
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
-                if frame_count % step == 0:
-                    # Convert BGR to RGB
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    yield frame_rgb
-                
-                frame_count += 1
-                
-        finally:
-            cap.release()
+        for frame_rgb, _, _ in self.extract_frames_with_timestamps(video_path, max_frames):
+            yield frame_rgb
     
+    def iter_frame_batches(self, video_path: str, max_frames: int, batch_size: int) -> Generator[List[tuple[np.ndarray, int, float]], None, None]:
+        """Gom các frame đã sample (frame, frame index, timestamp) thành từng batch (tối đa max_frames frame)"""
+        yield from self.batch_samples(self.extract_frames_with_timestamps(video_path, max_frames), max_frames, batch_size)
+
+    @staticmethod
+    def batch_samples(samples: Iterable[tuple], max_frames: int, batch_size: int) -> Generator[List[tuple], None, None]:
+        """Gom (frame, frame index, timestamp) từ bất kỳ nguồn nào thành từng batch (tối đa max_frames frame)"""
+        batch_size = max(1, batch_size)
+        batch = []
+        for sample_idx, sample in enumerate(samples):
+            if sample_idx >= max_frames:
+                break
+            batch.append(sample)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _crop_frame(self, frame: np.ndarray) -> np.ndarray:
+        """Crop (zoom) vào giữa frame, trả về view numpy (không copy)"""
+        height, width = frame.shape[:2]
+
+        # --- ZOOM vào giữa frame ---
+        zoom_factor = 1.0  # Có thể chỉnh 1.2, 1.5, 2.0 tùy ý
+        new_w, new_h = int(width / zoom_factor), int(height / zoom_factor)
+        left = (width - new_w) // 2
+        top = (height - new_h) // 2
+        # --- KẾT THÚC ZOOM ---
+        return frame[top:top + new_h, left:left + new_w]
+
+    def _scale_detections(self, prediction: Dict, image_size: tuple, confidence_threshold: float) -> Dict[str, np.ndarray]:
+        """Lọc theo confidence và scale box từ 300x300 về kích thước frame (trên toàn mảng)"""
+        return filter_detections(prediction, confidence_threshold, scale=(image_size[0] / 300, image_size[1] / 300))
+
+    def detect_in_frames_arrays(self, frames: List[np.ndarray], confidence_threshold: float = 0.5,
+                                batch_size: int = 8, settings: Optional[DetectionSettings] = None) -> List[tuple[Dict[str, np.ndarray], Image.Image]]:
+        """Phát hiện tế bào trên nhiều frame theo batch, trả về detections dạng mảng (boxes/scores/labels)
+
+        settings: tham số postprocess của model (mặc định: của backend với score_thresh=confidence_threshold).
+        """
+        batch_size = max(1, batch_size)
+        if settings is None:
+            settings = self.model.settings(score_thresh=confidence_threshold)
+        outputs = []
+
+        for start in range(0, len(frames), batch_size):
+            chunk = frames[start:start + batch_size]
+            try:
+                # Resize bằng OpenCV và ghi thẳng vào buffer input có sẵn (không stack tensor mới)
+                image_tensor = self.input_buffers.get(len(chunk))
+                crops = []
+                for slot, frame in zip(image_tensor, chunk):
+                    crop = self._crop_frame(frame)
+                    write_input(resize_frame(crop), slot)
+                    crops.append(crop)
+
+                # Inference 1 lần cho cả batch
+                with torch.no_grad():
+                    predictions = self.model(image_tensor.to(self.device), settings)
+
+                for crop, prediction in zip(crops, predictions):
+                    detections = self._scale_detections(prediction, (crop.shape[1], crop.shape[0]), settings.score_thresh)
+                    outputs.append((detections, Image.fromarray(crop)))
+
+            except Exception as e:
+                print(f"Error in frame detection: {e}")
+                outputs.extend((empty_detections(), Image.fromarray(frame)) for frame in chunk)
+
+        return outputs
+
+    def detect_in_frames(self, frames: List[np.ndarray], confidence_threshold: float = 0.5,
+                         batch_size: int = 8, settings: Optional[DetectionSettings] = None) -> List[tuple[List[Dict], Image.Image]]:
+        """Phát hiện tế bào trên nhiều frame, chạy model theo batch thay vì từng frame"""
+        return [
+            (to_detection_dicts(detections, self.class_names), pil_image)
+            for detections, pil_image in self.detect_in_frames_arrays(frames, confidence_threshold, batch_size, settings)
+        ]
+
     def detect_in_frame(self, frame: np.ndarray, confidence_threshold: float = 0.5) -> tuple[List[Dict], Image.Image]:
         """Phát hiện tế bào trong 1 frame và trả về kết quả + ảnh gốc"""
-        try:
-            pil_image = Image.fromarray(frame)
-            original_size = pil_image.size
-
-            # --- ZOOM vào giữa frame ---
-            zoom_factor = 1.0  # Có thể chỉnh 1.2, 1.5, 2.0 tùy ý
-            new_w, new_h = int(original_size[0] / zoom_factor), int(original_size[1] / zoom_factor)
-            left = (original_size[0] - new_w) // 2
-            top = (original_size[1] - new_h) // 2
-            right = left + new_w
-            bottom = top + new_h
-            pil_image = pil_image.crop((left, top, right, bottom))
-            # --- KẾT THÚC ZOOM ---
-
-            # Resize để inference
-            resized_image = pil_image.resize((300, 300))
-            
-            # Convert to tensor
-            from torchvision.transforms import transforms
-            transform = transforms.Compose([transforms.ToTensor()])
-            image_tensor = transform(resized_image).unsqueeze(0).to(self.device)
-            
-            # Inference
-            with torch.no_grad():
-                predictions = self.model(image_tensor)
-            
-            # Process predictions
-            results = []
-            if predictions and len(predictions) > 0:
-                prediction = predictions[0]
-                boxes = prediction['boxes'].cpu().numpy()
-                scores = prediction['scores'].cpu().numpy()
-                labels = prediction['labels'].cpu().numpy()
-                
-                # Filter by confidence
-                mask = scores > confidence_threshold
-                boxes = boxes[mask]
-                scores = scores[mask]
-                labels = labels[mask]
-                
-                # Scale boxes về kích thước gốc
-                scale_x = original_size[0] / 300
-                scale_y = original_size[1] / 300
-                
-                for box, score, label in zip(boxes, scores, labels):
-                    x1, y1, x2, y2 = box
-                    
-                    # Scale coordinates về original size
-                    x1_scaled = x1 * scale_x
-                    y1_scaled = y1 * scale_y
-                    x2_scaled = x2 * scale_x
-                    y2_scaled = y2 * scale_y
-                    
-                    class_name = self.class_names[label] if label < len(self.class_names) else 'unknown'
-                    
-                    results.append({
-                        'bbox': [float(x1_scaled), float(y1_scaled), float(x2_scaled), float(y2_scaled)],
-                        'confidence': float(score),
-                        'class_id': int(label),
-                        'class_name': class_name
-                    })
-            
-            return results, pil_image
-            
-        except Exception as e:
-            print(f"Error in frame detection: {e}")
-            return [], Image.fromarray(frame)
+        return self.detect_in_frames([frame], confidence_threshold, batch_size=1)[0]
 
     def draw_bounding_boxes(self, image: Image.Image, detections: List[Dict]) -> Image.Image:
-        """Vẽ bounding box lên ảnh"""
+        """Vẽ bounding box lên ảnh (trả về ảnh mới, ảnh gốc không bị sửa)"""
         try:
-            # Create a copy để không modify original
-            img_with_boxes = image.copy()
-            draw = ImageDraw.Draw(img_with_boxes)
-            
-            # Color map cho các loại tế bào
-            colors = {
-                'Platelets': '#FFD700',  # Gold
-                'RBC': '#FF6B6B',        # Red
-                'WBC': '#4ECDC4',        # Teal
-            }
-            
-            # Try to load a font, fallback to default
-            try:
-                # Thử load font system
-                font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", 16)
-            except:
-                try:
-                    font = ImageFont.truetype("arial.ttf", 16)
-                except:
-                    font = ImageFont.load_default()
-            
-            for detection in detections:
-                x1, y1, x2, y2 = detection['bbox']
-                class_name = detection['class_name']
-                confidence = detection['confidence']
-                
-                # Lấy màu cho class
-                color = colors.get(class_name, '#888888')
-                
-                # Vẽ bounding box
-                draw.rectangle(
-                    [(x1, y1), (x2, y2)],
-                    outline=color,
-                    width=3
-                )
-                
-                # Vẽ label và confidence (HIỂN THỊ PHẦN TRĂM)
-                label_text = f"{class_name}: {confidence * 100:.1f}%"
-                # Tính toán vị trí text
-                try:
-                    bbox = draw.textbbox((0, 0), label_text, font=font)
-                    text_width = bbox[2] - bbox[0]
-                    text_height = bbox[3] - bbox[1]
-                except:
-                    # Fallback cho older PIL versions
-                    text_width, text_height = draw.textsize(label_text, font=font)
-                
-                # Background cho text
-                text_bg_coords = [
-                    (x1, y1 - text_height - 4),
-                    (x1 + text_width + 8, y1)
-                ]
-                draw.rectangle(text_bg_coords, fill=color)
-                
-                # Text
-                draw.text(
-                    (x1 + 4, y1 - text_height - 2),
-                    label_text,
-                    fill='white',
-                    font=font
-                )
-            
-            return img_with_boxes
-            
+            return Image.fromarray(self.overlay.draw_detections(np.array(image.convert('RGB')), detections))
         except Exception as e:
             print(f"Error drawing bounding boxes: {e}")
             return image
 
-    def frame_to_base64(self, image: Image.Image, quality: int = 85) -> str:
-        """Convert PIL Image thành base64 string"""
+    def render_detections(self, frame: np.ndarray, detections: List[Dict]) -> np.ndarray:
+        """Vẽ bounding box trực tiếp lên frame RGB dạng numpy (sửa tại chỗ), trả về chính frame đó"""
+        return self.overlay.draw_detections(frame, detections)
+
+    def frame_to_base64(self, image, quality: int = 85, max_size: int = 800) -> str:
+        """Convert ảnh (PIL hoặc numpy RGB) thành data URI JPEG, thu nhỏ nếu cạnh dài > max_size"""
         try:
-            buffer = io.BytesIO()
             # Resize nếu quá lớn để tiết kiệm bandwidth
-            max_size = 800
-            if max(image.size) > max_size:
-                ratio = max_size / max(image.size)
-                new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-                image = image.resize(new_size, Image.Resampling.LANCZOS)
-            
-            image.save(buffer, format='JPEG', quality=quality, optimize=True)
-            img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            return f"data:image/jpeg;base64,{img_str}"
+            frame, _ = self.overlay.fit(np.asarray(image), max_size)
+            return self.overlay.data_uri(frame, quality)
         except Exception as e:
             print(f"Error converting image to base64: {e}")
             return ""
+
+    def image_reference(self, frame: np.ndarray, quality: int = 85, image_mode: str = 'inline') -> str:
+        """Encode JPEG: URL tới artifact store (image_mode='url') hoặc data URI base64 ('inline')"""
+        if image_mode == 'url' and self.artifacts is not None:
+            return self.artifacts.put_url(self.overlay.encode_jpeg(frame, quality))
+        return self.overlay.data_uri(frame, quality)
+
+    def encode_frame_images(self, frame: np.ndarray, detections: Dict[str, np.ndarray],
+                            quality: int = 85, max_size: int = 800, image_mode: str = 'inline') -> tuple[str, str]:
+        """(frame có bounding box, frame gốc) dạng URL hoặc data URI: resize 1 lần, vẽ ở kích thước đích, mỗi ảnh encode 1 lần"""
+        with span('encode'):
+            resized, scale = self.overlay.fit(frame, max_size)
+            original_uri = self.image_reference(resized, quality, image_mode)
+        with span('draw'):
+            annotated = self.overlay.draw(resized.copy(), detections['boxes'], detections['scores'].tolist(),
+                                          label_names(detections['labels'], self.class_names).tolist(), scale)
+        with span('encode'):
+            return self.image_reference(annotated, quality, image_mode), original_uri
     
-    def process_video(self, url: str, max_frames: int = 50) -> Dict:
-        """Xử lý toàn bộ video từ YouTube"""
+    def _detect_with_gate(self, frames: List[np.ndarray], gate, batch_size: int,
+                          settings: Optional[DetectionSettings] = None) -> List[tuple]:
+        """Chỉ inference các keyframe, frame còn lại nhận box propagate từ keyframe gần nhất
+
+        Trả về list (detections, ảnh đã crop, inferred, change_score) theo thứ tự frame.
+        """
+        crops = [self._crop_frame(frame) for frame in frames]
+        decisions = gate.plan(crops)
+        keyframes = [frame for frame, (infer, _) in zip(frames, decisions) if infer]
+        with span('frame_inference'):
+            key_outputs = iter(self.detect_in_frames_arrays(keyframes, batch_size=batch_size, settings=settings)
+                               if keyframes else [])
+
+        outputs = []
+        for crop, (infer, score) in zip(crops, decisions):
+            if infer:
+                detections, pil_image = next(key_outputs)
+                gate.set_keyframe(crop, detections)
+            else:
+                with span('frame_propagate'):
+                    detections = gate.propagate(crop)
+                pil_image = Image.fromarray(crop)
+            outputs.append((detections, pil_image, infer, score))
+        return outputs
+
+    def iter_video_results(self, url: str, max_frames: int = 50, batch_size: int = 8,
+                           include_images: bool = True, response_format: str = 'objects',
+                           temporal: Optional[TemporalConfig] = None,
+                           settings: Optional[DetectionSettings] = None,
+                           image_mode: str = 'url') -> Generator[Dict, None, None]:
+        """Xử lý video YouTube và yield kết quả từng frame ngay khi xong
+
+        Yield {'type': 'frame', 'frames_done', 'frames_total', 'frame': {...}} cho mỗi frame,
+        cuối cùng là {'type': 'summary', ...}. Không giữ lại kết quả các frame trước đó.
+        response_format='columnar' trả detections của frame dạng mảng song song.
+        temporal: chỉ chạy model trên frame thay đổi đáng kể (hoặc mỗi keyframe_interval frame),
+        mỗi frame có 'inferred' (True) hoặc được propagate box từ keyframe (False).
+        settings: tham số postprocess của model (score/NMS/top-k), được ghi lại trong summary.
+        image_mode: 'url' (frame_image/original_frame là link tới artifact store) hoặc 'inline' (data URI).
+        """
+        # Download video
+        video_path = self.download_youtube_video(url)
         try:
-            # Download video
-            video_path = self.download_youtube_video(url)
-            
-            # Thống kê
-            frame_results = []
-            total_detections = 0
-            class_counts = {'Platelets': 0, 'RBC': 0, 'WBC': 0}
-            
-            # Process từng frame
-            for frame_idx, frame in enumerate(self.extract_frames(video_path, max_frames)):
-                if frame_idx >= max_frames:
-                    break
-                
-                # Detect và lấy ảnh gốc
-                detections, original_frame = self.detect_in_frame(frame)
-                
-                # Vẽ bounding boxes lên ảnh
-                frame_with_boxes = self.draw_bounding_boxes(original_frame, detections)
-                
-                # Convert thành base64
-                frame_base64 = self.frame_to_base64(frame_with_boxes)
-                original_frame_base64 = self.frame_to_base64(original_frame)
-                
+            yield from self.iter_file_results(video_path, max_frames, batch_size, include_images, response_format,
+                                              temporal, settings, image_mode)
+        finally:
+            # Cleanup
+            self.release_video(video_path)
+
+    def iter_file_results(self, video_path: str, max_frames: int = 50, batch_size: int = 8,
+                          include_images: bool = True, response_format: str = 'objects',
+                          temporal: Optional[TemporalConfig] = None,
+                          settings: Optional[DetectionSettings] = None,
+                          image_mode: str = 'url') -> Generator[Dict, None, None]:
+        """Như iter_video_results nhưng với file video có sẵn trên disk (không xóa file)"""
+        frames_total = min(max_frames, self.frame_sampler.planned_frame_count(video_path, max_frames))
+        yield from self.iter_sample_results(self.extract_frames_with_timestamps(video_path, max_frames), frames_total,
+                                            max_frames, batch_size, include_images, response_format, temporal,
+                                            settings=settings, image_mode=image_mode)
+
+    def iter_sample_results(self, samples: Iterable[tuple], frames_total: int, max_frames: int = 50,
+                            batch_size: int = 8, include_images: bool = True, response_format: str = 'objects',
+                            temporal: Optional[TemporalConfig] = None,
+                            settings: Optional[DetectionSettings] = None,
+                            decode_stage: str = 'frame_decode',
+                            image_mode: str = 'url') -> Generator[Dict, None, None]:
+        """Detect + thống kê trên các frame (frame RGB, frame index, timestamp) từ bất kỳ nguồn nào
+
+        frames_total chỉ dùng để báo tiến độ; decode_stage là tên stage trong /metrics cho thời gian chờ frame.
+        """
+        gate = temporal.gate() if temporal is not None else None
+        settings = settings or self.model.detection_settings
+        # Thống kê
+        total_detections = 0
+        class_statistics = {'Platelets': 0, 'RBC': 0, 'WBC': 0}
+
+        # Gom frame thành batch để inference cùng lúc
+        frame_idx = 0
+        for batch in timed_iter(self.batch_samples(samples, max_frames, batch_size), decode_stage):
+            batch_frames = [frame for frame, _, _ in batch]
+
+            # Detect và lấy ảnh gốc cho cả batch
+            if gate is not None:
+                batch_outputs = self._detect_with_gate(batch_frames, gate, batch_size, settings)
+            else:
+                with span('frame_inference'):
+                    batch_outputs = [(detections, pil_image, True, None) for detections, pil_image
+                                     in self.detect_in_frames_arrays(batch_frames, batch_size=batch_size,
+                                                                     settings=settings)]
+            FRAMES_PROCESSED_TOTAL.inc(sum(1 for output in batch_outputs if output[2]), pipeline='analysis')
+            for (_, source_frame_index, timestamp), (detections, original_frame, inferred, change_score) in zip(batch, batch_outputs):
                 # Cập nhật thống kê
-                for detection in detections:
-                    class_name = detection['class_name']
-                    if class_name in class_counts:
-                        class_counts[class_name] += 1
-                        total_detections += 1
-                
-                frame_results.append({
+                frame_counts = class_counts(detections['labels'], self.class_names)
+                count_detections(frame_counts, source='video')
+                for class_name, count in frame_counts.items():
+                    if class_name in class_statistics:
+                        class_statistics[class_name] += count
+                        total_detections += count
+
+                frame_result = {
                     'frame_index': frame_idx,
-                    'detections': detections,
-                    'detection_count': len(detections),
-                    'frame_image': frame_base64,  # Frame với bounding boxes
-                    'original_frame': original_frame_base64,  # Frame gốc
-                    'timestamp': f"{frame_idx * (1.0 / 30):.2f}s"  # Giả sử 30 FPS
-                })
+                    'detections': format_detections(detections, self.class_names, response_format),
+                    'detection_count': len(detections['scores']),
+                    'source_frame_index': source_frame_index,  # Vị trí frame trong video gốc
+                    'timestamp': f"{timestamp:.2f}s"  # Timestamp thực tế từ container
+                }
+                if gate is not None:
+                    # False: box được propagate từ keyframe gần nhất, không chạy model
+                    frame_result['inferred'] = inferred
+                    frame_result['change_score'] = change_score
+
+                if include_images:
+                    # Vẽ bounding boxes lên ảnh và convert thành base64
+                    frame_image, original_image = self.encode_frame_images(np.asarray(original_frame), detections,
+                                                                           image_mode=image_mode)
+                    frame_result['frame_image'] = frame_image  # Frame với bounding boxes
+                    frame_result['original_frame'] = original_image  # Frame gốc
+
+                frame_idx += 1
+                yield {
+                    'type': 'frame',
+                    'frames_done': frame_idx,
+                    'frames_total': frames_total,
+                    'frame': frame_result
+                }
+
+        summary = {
+            'type': 'summary',
+            'total_frames_processed': frame_idx,
+            'total_detections': total_detections,
+            'class_statistics': class_statistics,
+            'average_detections_per_frame': total_detections / frame_idx if frame_idx else 0,
+            'detection_settings': settings.describe()
+        }
+        if gate is not None:
+            summary['temporal'] = gate.stats()
+        yield summary
+
+    def collect_results(self, records: Generator[Dict, None, None],
+                        progress_callback: Optional[Callable[[Dict, int, int], None]] = None,
+                        cancel_event: Optional[threading.Event] = None) -> Dict:
+        """Gom các record của iter_*_results thành 1 kết quả (frame_results + thống kê)"""
+        try:
+            frame_results = []
+            summary = {}
+            for record in records:
+                if record['type'] == 'summary':
+                    summary = record
+                    continue
                 
-                # Progress callback có thể thêm sau
-                print(f"Processed frame {frame_idx + 1}/{max_frames}")
+                frame_results.append(record['frame'])
+                if progress_callback is not None:
+                    progress_callback(record['frame'], record['frames_done'], record['frames_total'])
+                if cancel_event is not None and cancel_event.is_set():
+                    return {'success': False, 'cancelled': True, 'error': 'Job đã bị hủy'}
             
-            # Cleanup
-            try:
-                os.remove(video_path)
-            except:
-                pass
-            
-            return {
+            result = {
                 'success': True,
-                'total_frames_processed': len(frame_results),
-                'total_detections': total_detections,
-                'class_statistics': class_counts,
+                'total_frames_processed': summary['total_frames_processed'],
+                'total_detections': summary['total_detections'],
+                'class_statistics': summary['class_statistics'],
                 'frame_results': frame_results,
-                'average_detections_per_frame': total_detections / len(frame_results) if frame_results else 0
+                'average_detections_per_frame': summary['average_detections_per_frame']
             }
+            result['detection_settings'] = summary['detection_settings']
+            if 'temporal' in summary:
+                result['temporal'] = summary['temporal']
+            return result
             
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
+        finally:
+            # Đóng generator để xóa file video tạm ngay cả khi dừng giữa chừng
+            records.close()
+
+    def process_video(self, url: str, max_frames: int = 50, batch_size: int = 8,
+                      progress_callback: Optional[Callable[[Dict, int, int], None]] = None,
+                      cancel_event: Optional[threading.Event] = None, response_format: str = 'objects',
+                      temporal: Optional[TemporalConfig] = None,
+                      settings: Optional[DetectionSettings] = None, image_mode: str = 'url') -> Dict:
+        """Xử lý toàn bộ video từ YouTube
+
+        progress_callback(frame_result, frames_done, frames_total) được gọi sau mỗi frame,
+        cancel_event được kiểm tra giữa các frame để dừng job sớm.
+        """
+        records = self.iter_video_results(url, max_frames, batch_size, response_format=response_format,
+                                          temporal=temporal, settings=settings, image_mode=image_mode)
+        return self.collect_results(records, progress_callback, cancel_event)
     
     def cleanup(self):
         """Dọn dẹp thư mục tạm"""
@@ -316,15 +372,4 @@ class YouTubeVideoProcessor:
             import shutil
             shutil.rmtree(self.temp_dir)
         except:
-            pass 
-
-def process_video_with_boxes(self, input_path, output_path):
-    def process_frame(frame):
-        # Detect + vẽ box trên frame
-        pil_image = Image.fromarray(frame)
-        # ... detect, vẽ box như các hàm hiện tại ...
-        # Trả về numpy array
-        return np.array(pil_image_with_boxes)
-    clip = VideoFileClip(input_path)
-    new_clip = clip.fl_image(process_frame)
-    new_clip.write_videofile(output_path, audio=False) 
\ No newline at end of file
+            pass
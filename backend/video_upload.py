@@ -0,0 +1,178 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+from typing import BinaryIO, Dict, Generator, Optional, Tuple
+
+import numpy as np
+
+from video_exporter import find_ffmpeg
+
+# Sentinel báo ffmpeg đã hết frame
+_END = object()
+
+
+class VideoUploadTooLarge(ValueError):
+    """Video upload vượt quá giới hạn dung lượng"""
+
+
+def read_ppm_frame(stream: BinaryIO) -> Optional[np.ndarray]:
+    """Đọc 1 frame PPM (P6) từ stdout của ffmpeg, None khi hết stream"""
+    tokens = []
+    token = b''
+    # Header: "P6 <width> <height> <maxval>" + đúng 1 ký tự trắng trước dữ liệu pixel
+    while len(tokens) < 4:
+        char = stream.read(1)
+        if not char:
+            return None
+        if char.isspace():
+            if token:
+                tokens.append(token)
+                token = b''
+        else:
+            token += char
+    if tokens[0] != b'P6':
+        raise ValueError(f"Frame PPM không hợp lệ: {tokens[0]!r}")
+    width, height = int(tokens[1]), int(tokens[2])
+    data = stream.read(width * height * 3)
+    if len(data) < width * height * 3:
+        return None
+    return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+
+
+class StreamingVideoUpload:
+    """Ghi video upload xuống disk theo từng chunk, đồng thời pipe vào ffmpeg để sample frame khi upload chưa xong
+
+    ffmpeg đọc video từ stdin và xuất frame RGB (PPM) theo sample_fps; frames() yield frame ngay khi
+    decode xong. Container không đọc tuần tự được (vd. MP4 có moov atom ở cuối file) sẽ không cho frame nào,
+    khi đó xử lý lại từ file trên disk sau khi upload xong (xem pipe_frames).
+    """
+
+    def __init__(self, path: str, max_bytes: int, sample_fps: float = 1.0, max_frames: int = 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.sample_fps = sample_fps
+        self.max_frames = max_frames
+        self.bytes_received = 0
+        self.pipe_frames = 0
+        self.frames_before_upload_complete = 0
+        self.first_frame_seconds: Optional[float] = None
+        self.upload_seconds: Optional[float] = None
+        self._file = open(path, 'wb')
+        self._frames: queue.Queue = queue.Queue()
+        self._process: Optional[subprocess.Popen] = None
+        self._reader: Optional[threading.Thread] = None
+        self._pipe_open = False
+        self._upload_done = threading.Event()
+        self._started = time.perf_counter()
+
+    def start(self):
+        """Chạy ffmpeg đọc từ stdin; không có ffmpeg thì chỉ ghi file (xử lý sau khi upload xong)"""
+        try:
+            ffmpeg = find_ffmpeg()
+        except ImportError:
+            print("Không tìm thấy ffmpeg, video upload sẽ được xử lý sau khi upload xong")
+            self._frames.put(_END)
+            return
+        command = [
+            ffmpeg, "-loglevel", "error",
+            "-i", "pipe:0",
+            "-an", "-vf", f"fps={self.sample_fps}", "-frames:v", str(self.max_frames),
+            "-f", "image2pipe", "-c:v", "ppm", "pipe:1",
+        ]
+        try:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                             stderr=subprocess.DEVNULL)
+        except OSError as e:
+            print(f"Không chạy được ffmpeg ({e}), video upload sẽ được xử lý sau khi upload xong")
+            self._frames.put(_END)
+            return
+        self._pipe_open = True
+        # stdout được đọc liên tục vào queue để ffmpeg không bị chặn khi detection chậm hơn decode
+        self._reader = threading.Thread(target=self._read_frames, name="upload-ffmpeg-reader", daemon=True)
+        self._reader.start()
+
+    def _read_frames(self):
+        try:
+            for sample_idx in range(self.max_frames):
+                frame = read_ppm_frame(self._process.stdout)
+                if frame is None:
+                    break
+                if self.first_frame_seconds is None:
+                    self.first_frame_seconds = time.perf_counter() - self._started
+                if not self._upload_done.is_set():
+                    self.frames_before_upload_complete += 1
+                self.pipe_frames += 1
+                # Không biết frame index gốc khi đọc từ pipe, timestamp suy ra từ sample_fps
+                self._frames.put((frame, None, sample_idx / self.sample_fps))
+        except Exception as e:
+            print(f"Lỗi đọc frame từ ffmpeg: {e}")
+        finally:
+            self._frames.put(_END)
+
+    def write(self, chunk: bytes):
+        """Ghi 1 chunk xuống disk và vào stdin của ffmpeg (blocking, gọi từ threadpool)"""
+        self.bytes_received += len(chunk)
+        if self.bytes_received > self.max_bytes:
+            raise VideoUploadTooLarge(f"Video vượt quá giới hạn {self.max_bytes // (1024 * 1024)} MB")
+        self._file.write(chunk)
+        if self._pipe_open:
+            try:
+                self._process.stdin.write(chunk)
+            except (BrokenPipeError, OSError):
+                # ffmpeg đã dừng (đủ max_frames hoặc không đọc được container), upload vẫn tiếp tục ghi file
+                self._pipe_open = False
+
+    def finish(self):
+        """Upload xong: đóng file và stdin để ffmpeg flush các frame còn lại"""
+        self.upload_seconds = time.perf_counter() - self._started
+        self._upload_done.set()
+        self._file.close()
+        self._close_pipe()
+
+    def abort(self):
+        """Hủy upload (quá giới hạn hoặc client ngắt kết nối)"""
+        self._upload_done.set()
+        self._file.close()
+        self.close()
+
+    def close(self):
+        """Dừng ffmpeg nếu còn chạy và xóa file video tạm"""
+        self._file.close()
+        if self._process is not None:
+            self._close_pipe()
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _close_pipe(self):
+        if self._process is None:
+            return
+        self._pipe_open = False
+        try:
+            self._process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+    def frames(self) -> Generator[Tuple[np.ndarray, Optional[int], float], None, None]:
+        """Yield (frame RGB, frame index gốc (None), timestamp) theo thứ tự, ngay khi ffmpeg decode xong"""
+        while True:
+            item = self._frames.get()
+            if item is _END:
+                break
+            yield item
+
+    def stats(self) -> Dict:
+        return {
+            'bytes_received': self.bytes_received,
+            'upload_seconds': self.upload_seconds,
+            'streamed': self.pipe_frames > 0,
+            'frames_before_upload_complete': self.frames_before_upload_complete,
+            'first_frame_seconds': self.first_frame_seconds,
+            'sample_fps': self.sample_fps if self.pipe_frames > 0 else None,
+        }